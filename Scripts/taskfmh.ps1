@@ -1,3 +1,6 @@
+# Tarea programada externa. Con SCHEDULER_ENABLED=true la API ejecuta estos
+# ciclos por su cuenta (ver services/scheduler_service.py); no usar ambos a la vez.
+
 # Ruta de los scripts Python
 $transferScript = "C:\FastAPI\facturasmh\transferfmh.py"
 $syncScript = "C:\FastAPI\facturasmh\sync_scriptfmh.py"
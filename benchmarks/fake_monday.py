@@ -0,0 +1,176 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mutaciones con o sin alias: "item_0: create_item (" o "create_item ("
+MUTATION_PATTERN = re.compile(r"(?:(\w+)\s*:\s*)?\b(create_item|change_multiple_column_values|create_group)\s*\(")
+GROUP_NAME_PATTERN = re.compile(r'group_name:\s*"([^"]*)"')
+
+class FakeMondayState:
+    """Estado del tablero falso: grupos, ítems, presupuesto de complejidad y contadores"""
+
+    def __init__(self, latency_ms: float = 50.0, budget: int = 10_000_000, reset_seconds: float = 60.0,
+                 query_cost: int = 100, mutation_cost: int = 100, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, item_error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.budget = budget
+        self.reset_seconds = reset_seconds
+        self.query_cost = query_cost
+        self.mutation_cost = mutation_cost
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.item_error_rate = item_error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._remaining = budget
+        self._reset_at = time.monotonic() + reset_seconds
+        self._next_id = 1000
+        self.groups: Dict[str, str] = {}
+        self.stats = {
+            "requests": 0,
+            "mutations": 0,
+            "server_errors": 0,
+            "rate_limited": 0,
+            "complexity_exhausted": 0,
+            "item_errors": 0,
+            "complexity_consumed": 0,
+        }
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _charge(self, cost: int) -> Optional[Dict[str, Any]]:
+        """Descuenta el costo del presupuesto; retorna el campo complexity o None si no alcanza"""
+        now = time.monotonic()
+        if now >= self._reset_at:
+            self._remaining = self.budget
+            self._reset_at = now + self.reset_seconds
+        reset_in = max(int(self._reset_at - now), 1)
+        if cost > self._remaining:
+            return None
+        before = self._remaining
+        self._remaining -= cost
+        self.stats["complexity_consumed"] += cost
+        return {"before": before, "after": self._remaining, "reset_in_x_seconds": reset_in}
+
+    def handle(self, query: str) -> tuple:
+        """Resuelve una operación GraphQL; retorna (status HTTP, headers, cuerpo)"""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self.stats["server_errors"] += 1
+                return 500, {}, {"error_message": "Internal server error (simulado)"}
+            if roll < self.error_rate + self.throttle_rate:
+                self.stats["rate_limited"] += 1
+                return 429, {"Retry-After": "1"}, {"error_message": "Rate limit exceeded (simulado)"}
+
+            mutations = MUTATION_PATTERN.findall(query)
+            cost = self.query_cost + self.mutation_cost * len(mutations)
+            complexity = self._charge(cost)
+            if complexity is None:
+                self.stats["complexity_exhausted"] += 1
+                reset_in = max(int(self._reset_at - time.monotonic()), 1)
+                return 200, {}, {"errors": [{
+                    "message": f"Complexity budget exhausted, budget resets in {reset_in} seconds",
+                    "extensions": {"code": "ComplexityException", "retry_in_seconds": reset_in}
+                }]}
+
+            self.stats["mutations"] += len(mutations)
+            data: Dict[str, Any] = {}
+            errors: List[Dict[str, Any]] = []
+            if "complexity" in query:
+                data["complexity"] = complexity
+
+            if not mutations and "groups" in query:
+                data["boards"] = [{"groups": [{"id": gid, "title": title} for title, gid in self.groups.items()]}]
+
+            for alias, operation in mutations:
+                key = alias or operation
+                if operation == "create_group":
+                    match = GROUP_NAME_PATTERN.search(query)
+                    title = match.group(1) if match else f"grupo-{len(self.groups)}"
+                    self.groups.setdefault(title, f"group_{len(self.groups)}")
+                    data[key] = {"id": self.groups[title]}
+                elif self._random.random() < self.item_error_rate:
+                    self.stats["item_errors"] += 1
+                    data[key] = None
+                    errors.append({"message": "Item rechazado (simulado)", "path": [key]})
+                else:
+                    data[key] = {"id": self._new_id()}
+
+        body: Dict[str, Any] = {"data": data}
+        if errors:
+            body["errors"] = errors
+        return 200, {}, body
+
+    def latency(self) -> float:
+        """Latencia simulada en segundos (±50% alrededor de latency_ms)"""
+        with self._lock:
+            return self.latency_ms / 1000.0 * self._random.uniform(0.5, 1.5)
+
+class _Handler(BaseHTTPRequestHandler):
+    state: FakeMondayState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, headers: Dict[str, str], body: Dict[str, Any]):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {}, {"error_message": "JSON inválido"})
+            return
+        time.sleep(self.state.latency())
+        status, headers, body = self.state.handle(request.get("query") or "")
+        self._send(status, headers, body)
+
+class FakeMondayServer:
+    """Servidor GraphQL de Monday.com simulado en un hilo, para pruebas de rendimiento sin red"""
+
+    def __init__(self, state: Optional[FakeMondayState] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = state or FakeMondayState()
+        handler = type("FakeMondayHandler", (_Handler,), {"state": self.state})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeMondayServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Monday simulado escuchando en {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
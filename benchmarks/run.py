@@ -0,0 +1,296 @@
+"""Pruebas de rendimiento sin sistemas de producción.
+
+Mide SyncService (contra un Monday.com simulado y SQLFACTF03 en SQLite) y
+exportar_registros (contra Firebird y SQL Server simulados en memoria) con
+facturas sintéticas, y reporta items/s, llamadas a la API por ítem,
+latencia p50/p99 y memoria pico.
+
+Uso:
+    python -m benchmarks.run
+    python -m benchmarks.run --escenarios sync --tamanos 1000 10000 --latencia-ms 20 --modo async
+    python -m benchmarks.run --tasa-errores 0.02 --tasa-errores-item 0.01 --json resultados.json
+
+Cada medición corre en un proceso aparte para que la memoria pico sea la
+de esa medición.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_monday import FakeMondayServer, FakeMondayState
+from benchmarks.synthetic import (
+    FACTF03Generator, FirebirdStandIn, SqlServerStandIn, sqlfactf03_records
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+INSERT_CHUNK = 5000
+
+def peak_rss_mb() -> float:
+    """Memoria residente pico del proceso en MB"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def timed(fn, latencies: List[float]):
+    """Envuelve una función para registrar la duración de cada llamada"""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return wrapper
+
+def timed_async(fn, latencies: List[float]):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return wrapper
+
+def configure_environment(url: str, workdir: str):
+    """Variables de entorno de la aplicación apuntando a los servicios simulados"""
+    for name in ("SQL_SERVER", "SQL_DATABASE", "SQL_USER", "SQL_PASSWORD", "MONDAY_API_KEY"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ["MONDAY_BOARD_ID"] = "1"
+    os.environ["MONDAY_API_URL"] = url
+    os.environ["MONDAY_LEDGER_PATH"] = str(Path(workdir) / "monday_ledger.sqlite3")
+    os.environ.setdefault("MONDAY_RETRY_BASE_DELAY", "0.05")
+    os.environ.setdefault("MONDAY_RETRY_MAX_DELAY", "2")
+
+def run_sync(size: int, url: str, mode: str) -> Dict[str, Any]:
+    """Sincroniza `size` facturas pendientes de SQLite contra el Monday simulado"""
+    workdir = tempfile.mkdtemp(prefix="bench_sync_")
+    configure_environment(url, workdir)
+
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from core.database import Base
+    from models.entities import SQLFACTF03
+    from services.sql_service import SQLService
+    from services.sync_service import SyncService
+    from core.metrics import StageTimes, track_stages
+
+    engine = create_engine(f"sqlite:///{Path(workdir) / 'sqlfactf03.sqlite3'}")
+    Base.metadata.create_all(engine)
+    records = sqlfactf03_records(FACTF03Generator(size))
+    with engine.begin() as conn:
+        while True:
+            chunk = [record for _, record in zip(range(INSERT_CHUNK), records)]
+            if not chunk:
+                break
+            conn.execute(insert(SQLFACTF03), chunk)
+
+    db = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    latencies: List[float] = []
+    sql_service = SQLService(db)
+    sync_service = SyncService()
+    stages = StageTimes()
+
+    started = time.perf_counter()
+    with track_stages(stages):
+        summary = _sync_pages(mode, sql_service, sync_service, db, latencies)
+    elapsed = time.perf_counter() - started
+    db.close()
+
+    return {
+        "items": summary["synced_items"] + summary["failed_items"],
+        "synced": summary["synced_items"],
+        "failed": summary["failed_items"],
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "stages": stages.to_dict(),
+    }
+
+def _sync_pages(mode: str, sql_service, sync_service, db, latencies: List[float]) -> Dict[str, Any]:
+    if mode == "async":
+        async_monday_client = sync_service.async_client
+        async_monday_client._post = timed_async(async_monday_client._post, latencies)
+
+        async def run():
+            try:
+                return await sync_service.sync_invoice_pages_async(sql_service.iter_recent_invoices(), db)
+            finally:
+                await async_monday_client.aclose()
+
+        return asyncio.run(run())
+    monday_client = sync_service.client
+    monday_client._execute = timed(monday_client._execute, latencies)
+    return sync_service.sync_invoice_pages(sql_service.iter_recent_invoices(), db)
+
+def run_transfer(size: int) -> Dict[str, Any]:
+    """Ejecuta exportar_registros con Firebird y SQL Server simulados en memoria"""
+    import snapshotfb
+    import transferfmh
+
+    generator = FACTF03Generator(size)
+    sql_conn = SqlServerStandIn()
+    params = SimpleNamespace(get_connection_params=lambda *args: {"connection_string": "benchmark"})
+    transferfmh.load_configurations = lambda: {"firebird": params, "sqlserver": params}
+    transferfmh.fdb = SimpleNamespace(
+        connect=lambda **kwargs: FirebirdStandIn(generator),
+        fbcore=transferfmh.fdb.fbcore
+    )
+    transferfmh.pyodbc = SimpleNamespace(
+        connect=lambda *args, **kwargs: sql_conn,
+        Error=transferfmh.pyodbc.Error
+    )
+    os.environ["MODO_TRANSFERENCIA"] = "completo"
+    # Instantáneas activas como en producción, pero en un directorio temporal y no en data/snapshots
+    snapshotfb.DIRECTORIO = Path(tempfile.mkdtemp(prefix="bench_snapshots_"))
+    os.environ["DIAS_A_TRANSFERIR"] = str(generator.dias)
+
+    latencies: List[float] = []
+    transferfmh.cargar_lote = timed(transferfmh.cargar_lote, latencies)
+    # Las etapas se reportan aquí en lugar de sobrescribir las métricas de la última transferencia real
+    snapshot: Dict[str, Any] = {}
+    transferfmh.write_transfer_snapshot = lambda rows, stages, failed_batches, **kwargs: snapshot.update(
+        rows=rows, stages=stages.to_dict(), failed_batches=failed_batches
+    )
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        transferfmh.exportar_registros()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "items": len(sql_conn.table),
+        "synced": len(sql_conn.table),
+        "failed": size - len(sql_conn.table),
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "stages": snapshot.get("stages", {}),
+    }
+
+def run_child(args) -> int:
+    """Proceso hijo: una medición, resultado como JSON en la última línea"""
+    if args.child[0] == "sync":
+        result = run_sync(int(args.child[1]), args.url, args.modo)
+    else:
+        result = run_transfer(int(args.child[1]))
+    latencies = result.pop("latencies")
+    result.update({
+        "operations": len(latencies),
+        "p50_ms": (percentile(latencies, 0.50) or 0.0) * 1000,
+        "p99_ms": (percentile(latencies, 0.99) or 0.0) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    print(json.dumps(result))
+    return 0
+
+def measure(scenario: str, size: int, args) -> Dict[str, Any]:
+    """Lanza una medición en un proceso aparte; para sync levanta un Monday simulado nuevo"""
+    server = None
+    command = [sys.executable, "-m", "benchmarks.run", "--hijo", scenario, str(size), "--modo", args.modo]
+    if scenario == "sync":
+        state = FakeMondayState(
+            latency_ms=args.latencia_ms, budget=args.presupuesto, reset_seconds=args.reinicio_s,
+            mutation_cost=args.costo_mutacion, error_rate=args.tasa_errores,
+            throttle_rate=args.tasa_limite, item_error_rate=args.tasa_errores_item, seed=size
+        )
+        server = FakeMondayServer(state).start()
+        command += ["--url", server.url]
+
+    try:
+        completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    finally:
+        if server is not None:
+            server.stop()
+    if completed.returncode != 0 or not completed.stdout.strip():
+        raise RuntimeError(f"Falló la medición {scenario}/{size}:\n{completed.stderr[-2000:]}")
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result.update({"scenario": scenario, "size": size, "mode": args.modo if scenario == "sync" else None})
+    result["items_per_second"] = result["items"] / result["elapsed"] if result["elapsed"] else 0.0
+    if server is not None:
+        result["api"] = dict(server.state.stats)
+        result["api_calls_per_item"] = server.state.stats["requests"] / size if size else 0.0
+    else:
+        result["api_calls_per_item"] = None
+    return result
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'escenario':<10}{'tamaño':>9}{'items/s':>11}{'llamadas/ítem':>15}{'p50 ms':>10}{'p99 ms':>10}{'RSS pico MB':>13}{'fallidos':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        calls = f"{r['api_calls_per_item']:.3f}" if r["api_calls_per_item"] is not None else "-"
+        name = r["scenario"] if r["mode"] in (None, "sync") else f"{r['scenario']}/{r['mode']}"
+        print(f"{name:<10}{r['size']:>9}{r['items_per_second']:>11.1f}{calls:>15}{r['p50_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['peak_rss_mb']:>13.1f}{r['failed']:>10}")
+    print("\nLatencia: por llamada a Monday (sync, incluye reintentos) o por lote cargado (transfer).")
+    for r in results:
+        stages = ", ".join(f"{name} {data['seconds']}s" for name, data in r.get("stages", {}).items())
+        print(f"Etapas {r['scenario']}/{r['size']}: {stages or '-'}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento con servicios simulados")
+    parser.add_argument("--escenarios", nargs="+", choices=["sync", "transfer"], default=["sync", "transfer"])
+    parser.add_argument("--tamanos", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--modo", choices=["sync", "async"], default="sync", help="Cliente de Monday a medir")
+    parser.add_argument("--latencia-ms", type=float, default=50.0, help="Latencia media simulada de Monday")
+    parser.add_argument("--presupuesto", type=int, default=10_000_000, help="Presupuesto de complejidad por ventana")
+    parser.add_argument("--reinicio-s", type=float, default=60.0, help="Segundos de la ventana de complejidad")
+    parser.add_argument("--costo-mutacion", type=int, default=100, help="Complejidad por mutación")
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="Fracción de peticiones con HTTP 500")
+    parser.add_argument("--tasa-limite", type=float, default=0.0, help="Fracción de peticiones con HTTP 429")
+    parser.add_argument("--tasa-errores-item", type=float, default=0.0, help="Fracción de ítems rechazados")
+    parser.add_argument("--json", help="Archivo donde guardar los resultados completos")
+    parser.add_argument("--hijo", dest="child", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    results = []
+    for scenario in args.escenarios:
+        for size in args.tamanos:
+            print(f"Midiendo {scenario} con {size} facturas...", file=sys.stderr)
+            results.append(measure(scenario, size, args))
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
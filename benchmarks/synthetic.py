@@ -0,0 +1,180 @@
+import itertools
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MONEDAS = ("Pesos", "Dolares", "Euros")
+VENDEDORES = tuple(f"VENDEDOR {n:02d}" for n in range(1, 21))
+CLIENTES = 5000
+
+# Catálogos sintéticos: tabla → {llave: descripción}
+CATALOGOS = {
+    "CLIE03": {f"C{n:05d}": f"CLIENTE {n:05d}" for n in range(CLIENTES)},
+    "MONED03": {n + 1: moneda for n, moneda in enumerate(MONEDAS)},
+    "VEND03": {f"V{n + 1:02d}": vendedor for n, vendedor in enumerate(VENDEDORES)},
+}
+
+def factf03_row(index: int, fecha_doc: date) -> Tuple[Any, ...]:
+    """Fila sintética con las columnas de SQLFACTF03 (cliente, moneda y vendedor ya resueltos)"""
+    moneda = MONEDAS[index % len(MONEDAS)]
+    tipcamb = 1.0 if moneda == "Pesos" else 17.0 + (index % 300) / 100.0
+    importe = 100.0 + (index * 37) % 250_000 / 10.0
+    return (
+        f"FB{index:08d}",
+        f"CLIENTE {index % CLIENTES:05d}",
+        f"PED{index % 100_000:06d}",
+        fecha_doc,
+        fecha_doc + timedelta(days=30),
+        moneda,
+        tipcamb,
+        importe,
+        importe / tipcamb,
+        VENDEDORES[index % len(VENDEDORES)],
+        0,
+    )
+
+class FACTF03Generator:
+    """Reparte N facturas sintéticas de forma uniforme en los últimos `dias` días.
+
+    Es determinista: la misma fecha produce siempre las mismas filas, así que
+    cada partición de fechas se puede generar de forma independiente.
+    """
+
+    def __init__(self, total: int, dias: int = 170, hasta: Optional[date] = None):
+        self.total = total
+        self.dias = dias
+        self.hasta = hasta or datetime.now().date()
+        self.desde = self.hasta - timedelta(days=dias - 1)
+        self.por_dia = -(-total // dias)  # división hacia arriba
+
+    def rows_between(self, inicio: date, fin: date) -> Iterator[Tuple[Any, ...]]:
+        """Filas con FECHA_DOC entre inicio y fin, ordenadas por (FECHA_DOC, CVE_DOC)"""
+        dia = max(inicio, self.desde)
+        while dia <= min(fin, self.hasta):
+            offset = (dia - self.desde).days * self.por_dia
+            for index in range(offset, min(offset + self.por_dia, self.total)):
+                yield factf03_row(index, dia)
+            dia += timedelta(days=1)
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        return self.rows_between(self.desde, self.hasta)
+
+    def fact_rows_between(self, inicio: date, fin: date) -> Iterator[Tuple[Any, ...]]:
+        """Filas con las columnas de FACTF03 que lee transferfmh.py (CVE_CLPV, NUM_MONED, CVE_VEND)"""
+        for row in self.rows_between(inicio, fin):
+            index = int(row[0][2:])  # CVE_DOC = FB + índice
+            yield (
+                row[0], f"C{index % CLIENTES:05d}", row[2], row[3], row[4],
+                index % len(MONEDAS) + 1, row[6], row[7], row[8], f"V{index % len(VENDEDORES) + 1:02d}",
+            )
+
+class FirebirdCursorStandIn:
+    """Cursor de Firebird simulado: facturas del generador y catálogos de CATALOGOS"""
+
+    def __init__(self, generator: FACTF03Generator, connection: "FirebirdStandIn" = None):
+        self.generator = generator
+        self.connection = connection
+        self._rows: Iterator[Tuple[Any, ...]] = iter(())
+
+    def execute(self, query: str, params: Tuple[Any, ...] = ()):
+        catalogo = re.search(r"FROM (CLIE03|MONED03|VEND03)", query)
+        if "RDB$RELATION_FIELDS" in query:
+            self._rows = iter([(0,)])  # Sin VERSION_SINC: los catálogos se recargan completos
+        elif catalogo:
+            valores = CATALOGOS[catalogo.group(1)]
+            llaves = params if params else valores.keys()
+            self._rows = iter([(llave, valores[llave]) for llave in llaves if llave in valores])
+        elif "COUNT(*)" in query:
+            self._rows = iter([(self.generator.total,)])
+        else:
+            inicio, fin = params
+            self._rows = self.generator.fact_rows_between(inicio, fin)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size: int) -> List[Tuple[Any, ...]]:
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self) -> List[Tuple[Any, ...]]:
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+class FirebirdStandIn:
+    def __init__(self, generator: FACTF03Generator):
+        self.generator = generator
+
+    def cursor(self) -> FirebirdCursorStandIn:
+        return FirebirdCursorStandIn(self.generator, self)
+
+    def close(self):
+        pass
+
+class SqlServerStandIn:
+    """Conexión y cursor de SQL Server simulados para las sentencias de transferfmh.py.
+
+    Emula en memoria la staging, el MERGE por hash y la marca de agua; el
+    resto de las sentencias (DDL, commits) no hace nada.
+    """
+
+    def __init__(self):
+        self.table: Dict[str, str] = {}  # CVE_DOC -> HASH_CONTENIDO
+        self.watermark = None
+        self.fast_executemany = False
+        self._staging: List[Tuple[Any, ...]] = []
+        self._result: List[Tuple[Any, ...]] = []
+
+    def cursor(self) -> "SqlServerStandIn":
+        return self
+
+    def execute(self, query: str, *params):
+        if params and isinstance(params[0], tuple):
+            params = params[0]
+        self._result = []
+        if "DB_NAME()" in query:
+            self._result = [("benchmark",)]
+        elif "SELECT ULTIMA_FECHA" in query:
+            self._result = [(self.watermark,)] if self.watermark else []
+        elif query.startswith("TRUNCATE"):
+            self._staging = []
+        elif "MERGE TRANSFER_MARCA_AGUA" in query:
+            self.watermark = max(self.watermark or params[1], params[1])
+        elif "MERGE SQLFACTF03" in query:
+            for row in self._staging:
+                previous = self.table.get(row[0])
+                if previous is None:
+                    self._result.append(("INSERT",))
+                elif previous != row[-1]:
+                    self._result.append(("UPDATE",))
+                self.table[row[0]] = row[-1]
+
+    def executemany(self, query: str, rows):
+        self._staging = list(rows)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def sqlfactf03_records(generator: FACTF03Generator) -> Iterator[Dict[str, Any]]:
+    """Filas para la tabla SQLFACTF03 de SQLite, pendientes de sincronizar"""
+    for row in generator.rows():
+        yield {
+            "CVE_DOC": row[0], "NOMBRE": row[1], "CVE_PEDI": row[2],
+            "FECHA_DOC": datetime.combine(row[3], datetime.min.time()),
+            "FECHA_VEN": datetime.combine(row[4], datetime.min.time()),
+            "MONEDA": row[5], "TIPCAMB": row[6], "IMPORTE": row[7], "IMPORTEME": row[8],
+            "VENDEDOR": row[9], "SINCRONIZADO": False, "ACTUALIZAR": False,
+        }
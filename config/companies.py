@@ -0,0 +1,81 @@
+import re
+import threading
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from config.settings import settings
+
+# Empresa histórica: su registro local y su marca de agua conservan los nombres sin número extra
+DEFAULT_COMPANY = "03"
+
+class Company(BaseModel):
+    """Empresa de Aspel: sufijo de sus tablas (FACTF03 → "03") y tablero de Monday destino"""
+    number: str = Field(..., pattern=r"^\d{2}$")
+    board_id: str = ""
+    budget_share: float = Field(1.0, gt=0, le=1)  # Fracción del presupuesto de complejidad de Monday
+
+    model_config = {"frozen": True}
+
+    def table(self, prefix: str) -> str:
+        """Nombre de la tabla de la empresa: table("CLIE") → "CLIE03" """
+        return f"{prefix}{self.number}"
+
+    @property
+    def sql_table(self) -> str:
+        return self.table("SQLFACTF")
+
+def parse_company_numbers(value: Optional[str]) -> List[str]:
+    """Números de empresa de COMPANIES ("03:123,05:456" o "03,05"); vacío = solo la 03"""
+    numbers = []
+    for entry in (value or "").split(","):
+        number = entry.split(":")[0].strip()
+        if not number:
+            continue
+        if not re.fullmatch(r"\d{2}", number):
+            raise ValueError(f"Número de empresa inválido en COMPANIES: {number!r}")
+        if number not in numbers:
+            numbers.append(number)
+    return numbers or [DEFAULT_COMPANY]
+
+def parse_companies(value: Optional[str], default_board_id: str) -> List[Company]:
+    """Empresas de COMPANIES ("03:tablero,05:tablero"); sin tablero se usa MONDAY_BOARD_ID.
+
+    El presupuesto de complejidad de Monday es de la cuenta, así que se
+    reparte en partes iguales entre las empresas.
+    """
+    boards = {}
+    for entry in (value or "").split(","):
+        number, _, board_id = entry.partition(":")
+        if number.strip():
+            boards[number.strip()] = board_id.strip()
+    numbers = parse_company_numbers(value)
+    return [
+        Company(number=number, board_id=boards.get(number) or default_board_id, budget_share=1.0 / len(numbers))
+        for number in numbers
+    ]
+
+_companies: Optional[List[Company]] = None
+_lock = threading.Lock()
+
+def get_companies() -> List[Company]:
+    """Empresas configuradas, leídas de la configuración en el primer uso"""
+    global _companies
+    if _companies is None:
+        with _lock:
+            if _companies is None:
+                _companies = parse_companies(settings.COMPANIES, settings.MONDAY_BOARD_ID)
+    return _companies
+
+def companies_sharing_board(company: Company) -> List[str]:
+    """Números de las otras empresas configuradas con el mismo tablero de Monday"""
+    return [other.number for other in get_companies()
+            if other.number != company.number and other.board_id == company.board_id]
+
+def get_company(number: Optional[str] = None) -> Company:
+    """Empresa por número; sin número, la primera configurada"""
+    companies = get_companies()
+    if number is None:
+        return companies[0]
+    for company in companies:
+        if company.number == number:
+            return company
+    raise ValueError(f"Empresa {number} no configurada en COMPANIES")
@@ -1,15 +1,8 @@
 import logging
-from functools import lru_cache
-from config.settings import settings
+from config.settings import settings, get_settings
 
 logger = logging.getLogger(__name__)
 
-@lru_cache()
-def get_settings():
-    """Obtiene la configuración con cache para mejor performance"""
-    logger.info("Cargando configuraciones de la aplicación")
-    return settings
-
 def verify_credentials():
     """Verifica que las credenciales esenciales estén configuradas"""
     required_credentials = [
@@ -21,5 +14,5 @@ def verify_credentials():
     ]
     
     if not all(required_credentials):
-        missing = [name for name, value in settings.dict().items() if not value]
+        missing = [name for name, value in get_settings().model_dump().items() if not value]
         raise ValueError(f"Credenciales faltantes: {', '.join(missing)}")
\ No newline at end of file
@@ -1,3 +1,4 @@
+import threading
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, SecretStr
 from pathlib import Path
@@ -9,11 +10,47 @@ class Settings(BaseSettings):
     SQL_USER: str = Field(..., min_length=1)
     SQL_PASSWORD: SecretStr = Field(...)
     SQL_DRIVER: str = "ODBC Driver 17 for SQL Server"
+    SQL_PAGE_SIZE: int = Field(500, ge=1)  # Facturas por página al leer pendientes
+    SQL_POOL_SIZE: int = Field(5, ge=1)  # Conexiones que el pool mantiene abiertas
+    SQL_MAX_OVERFLOW: int = Field(10, ge=0)  # Conexiones extra permitidas en picos
+    SQL_POOL_TIMEOUT: float = 30.0  # Segundos de espera por una conexión libre
+    SQL_POOL_RECYCLE: int = 1800  # Segundos antes de reciclar una conexión
+    SQL_POOL_WARMUP: int = Field(1, ge=0)  # Conexiones que se abren al iniciar la API
     
     # Config Monday.com
     MONDAY_API_KEY: SecretStr = Field(...)
     MONDAY_BOARD_ID: str = Field(..., min_length=1)
+    COMPANIES: str = ""  # Empresas de Aspel "03:tablero,05:tablero"; vacío = solo la 03 con MONDAY_BOARD_ID
     MONDAY_API_URL: str = "https://api.monday.com/v2"
+    # Columnas de SQLFACTFnn → ids de columna del tablero ("CAMPO:id,CAMPO:id") y campo del nombre del ítem
+    MONDAY_COLUMN_MAP: str = (
+        "NOMBRE:text_mknkr94f,CVE_PEDI:text_mknk2qt,FECHA_DOC:date4,FECHA_VEN:date_mknkfx2h,"
+        "MONEDA:text_mkq36w8v,TIPCAMB:numeric_mknkwc1,IMPORTE:numeric_mknkb26y,"
+        "IMPORTEME:numeric_mknk6qv1,VENDEDOR:text_mkr4r61z"
+    )
+    MONDAY_ITEM_NAME_COLUMN: str = "CVE_DOC"
+    MONDAY_GROUP_CACHE_TTL: int = 3600  # Segundos que se conserva el cache de grupos
+    MONDAY_BATCH_SIZE: int = Field(25, ge=1)  # Mutaciones create_item por petición
+    MONDAY_ITEMS_PAGE_LIMIT: int = Field(500, ge=1, le=500)  # Ítems por página al recorrer el tablero
+    MONDAY_MAX_CONCURRENCY: int = Field(4, ge=1)  # Peticiones simultáneas del cliente asíncrono
+    MONDAY_HTTP_TIMEOUT: float = 30.0
+    MONDAY_MAX_RETRIES: int = Field(5, ge=0)  # Reintentos ante límites de uso o errores 5xx
+    MONDAY_RETRY_BASE_DELAY: float = 1.0
+    MONDAY_RETRY_MAX_DELAY: float = 60.0
+    MONDAY_COMPLEXITY_RESERVE: float = 0.05  # Fracción del presupuesto que nunca se consume
+    MONDAY_COMPLEXITY_SLOWDOWN: float = 0.25  # Fracción restante a partir de la cual se espacian las llamadas
+    SYNC_MAX_ATTEMPTS: int = Field(5, ge=1)  # Intentos antes de poner un documento rechazado en cuarentena
+    SYNC_RETRY_BASE_DELAY: float = 300.0  # Segundos antes del primer reintento; se duplica en cada intento
+    SYNC_RETRY_MAX_DELAY: float = 86400.0
+    MONDAY_PLAN_CALL_SECONDS: float = 2.0  # Latencia por llamada para el plan mientras no haya llamadas medidas
+    MONDAY_PLAN_MUTATION_COMPLEXITY: int = 30000  # Complejidad por mutación para el plan mientras no haya llamadas medidas
+    SCHEDULER_ENABLED: bool = False  # Programador dentro de la API en lugar de Scripts/taskfmh.ps1
+    SCHEDULER_TRANSFER: bool = True  # Ejecutar transferfmh antes de sincronizar en cada ciclo
+    SCHEDULER_MIN_INTERVAL: float = Field(30.0, gt=0)  # Segundos entre ciclos mientras llegan documentos
+    SCHEDULER_MAX_INTERVAL: float = Field(900.0, gt=0)  # Segundos entre ciclos con el sistema inactivo
+    SCHEDULER_BACKOFF: float = Field(2.0, ge=1)  # Factor del intervalo tras cada ciclo sin trabajo
+    SCHEDULER_COALESCE_SECONDS: float = Field(2.0, ge=0)  # Espera para agrupar disparos en ráfaga
+    MONDAY_LEDGER_PATH: str = str(Path(__file__).parent.parent / 'data' / 'monday_ledger.sqlite3')
     
     # Config FastAPI (agregar estos nuevos campos)
     API_TITLE: str = "Sincronizador SQL a Monday.com"
@@ -26,5 +63,24 @@ class Settings(BaseSettings):
         extra='forbid'
     )
 
-# Carga de configuración
-settings = Settings()
\ No newline at end of file
+_settings = None
+_lock = threading.Lock()
+
+def get_settings() -> Settings:
+    """Carga y valida la configuración en el primer uso"""
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = Settings()
+    return _settings
+
+class _LazySettings:
+    """Acceso a la configuración que no la valida hasta leer el primer valor,
+    para que importar los módulos no requiera credenciales"""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+# Carga de configuración (diferida)
+settings = _LazySettings()
\ No newline at end of file
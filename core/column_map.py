@@ -0,0 +1,70 @@
+import threading
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import Date, DateTime
+from models.entities import InvoiceColumns
+from config.settings import settings
+
+class MondayPayload(NamedTuple):
+    """Nombre del ítem y valores de columnas que se envían a Monday por documento"""
+    name: str
+    column_values: Dict[str, Any]
+
+def parse_column_map(value: str) -> List[Tuple[str, str]]:
+    """Pares (columna de SQLFACTFnn, id de columna de Monday) de MONDAY_COLUMN_MAP ("NOMBRE:text_x,FECHA_DOC:date4")"""
+    pairs = []
+    for entry in value.split(","):
+        field, _, column_id = entry.partition(":")
+        if not field.strip():
+            continue
+        if not column_id.strip():
+            raise ValueError(f"Falta el id de columna de Monday para {field.strip()!r} en MONDAY_COLUMN_MAP")
+        pairs.append((field.strip(), column_id.strip()))
+    if not pairs:
+        raise ValueError("MONDAY_COLUMN_MAP no define columnas")
+    return pairs
+
+def compile_column_map(pairs: List[Tuple[str, str]], item_name_field: str) -> Callable[[Any], MondayPayload]:
+    """Compila el mapeo en una función fila → MondayPayload.
+
+    Los nombres se validan contra las columnas de SQLFACTFnn una sola vez;
+    por fila solo quedan un attrgetter, el isoformat de las fechas y el dict.
+    """
+    for field in [item_name_field] + [field for field, _ in pairs]:
+        if not hasattr(InvoiceColumns, field):
+            raise ValueError(f"La columna {field} de MONDAY_COLUMN_MAP no existe en SQLFACTFnn")
+
+    column_ids = tuple(column_id for _, column_id in pairs)
+    get_values = attrgetter(*(field for field, _ in pairs))
+    get_name = attrgetter(item_name_field)
+    dates = tuple(
+        index for index, (field, _) in enumerate(pairs)
+        if isinstance(getattr(InvoiceColumns, field).type, (Date, DateTime))
+    )
+
+    def to_payload(row) -> MondayPayload:
+        values = get_values(row)
+        if len(column_ids) == 1:
+            values = (values,)
+        if dates:
+            values = list(values)
+            for index in dates:
+                if values[index] is not None:
+                    values[index] = values[index].isoformat()
+        return MondayPayload(get_name(row), dict(zip(column_ids, values)))
+
+    return to_payload
+
+_column_map: Optional[Callable[[Any], MondayPayload]] = None
+_lock = threading.Lock()
+
+def get_column_map() -> Callable[[Any], MondayPayload]:
+    """Mapeo de columnas compilado, leído de la configuración en el primer uso"""
+    global _column_map
+    if _column_map is None:
+        with _lock:
+            if _column_map is None:
+                _column_map = compile_column_map(
+                    parse_column_map(settings.MONDAY_COLUMN_MAP), settings.MONDAY_ITEM_NAME_COLUMN
+                )
+    return _column_map
@@ -1,6 +1,8 @@
-import pyodbc
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+from typing import Dict, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config.settings import settings
 from config.security import verify_credentials
@@ -8,31 +10,113 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Verificar credenciales al importar
-verify_credentials()
-
-# Configuración SQLAlchemy
-# Versión corregida
-SQLALCHEMY_DATABASE_URL = (
-    f"mssql+pyodbc://{settings.SQL_USER}:{settings.SQL_PASSWORD.get_secret_value()}"
-    f"@{settings.SQL_SERVER}/{settings.SQL_DATABASE}"
-    "?driver=ODBC+Driver+17+for+SQL+Server"
-    "&TrustServerCertificate=yes"
-)
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    echo=False  # Cambiar a True para debug
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Los engines y fábricas de sesiones se crean en el primer uso (o en warm_up al
+# iniciar la API), así importar modelos o servicios no requiere credenciales.
+# Cada empresa tiene su propio pool para que una no acapare las conexiones de otra.
+_engines: Dict[Optional[str], Engine] = {}
+_session_factories: Dict[Optional[str], sessionmaker] = {}
+_lock = threading.Lock()
+
 Base = declarative_base()
 
+def database_url() -> str:
+    return (
+        f"mssql+pyodbc://{settings.SQL_USER}:{settings.SQL_PASSWORD.get_secret_value()}"
+        f"@{settings.SQL_SERVER}/{settings.SQL_DATABASE}"
+        "?driver=ODBC+Driver+17+for+SQL+Server"
+        "&TrustServerCertificate=yes"
+    )
+
+def get_engine(company: Optional[str] = None) -> Engine:
+    """Engine de SQLAlchemy de la empresa, creado en el primer uso con el pool configurado"""
+    engine = _engines.get(company)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(company)
+            if engine is None:
+                verify_credentials()
+                engine = _engines[company] = create_engine(
+                    database_url(),
+                    pool_pre_ping=True,
+                    pool_size=settings.SQL_POOL_SIZE,
+                    max_overflow=settings.SQL_MAX_OVERFLOW,
+                    pool_timeout=settings.SQL_POOL_TIMEOUT,
+                    pool_recycle=settings.SQL_POOL_RECYCLE,
+                    echo=False  # Cambiar a True para debug
+                )
+    return engine
+
+def get_session_factory(company: Optional[str] = None) -> sessionmaker:
+    factory = _session_factories.get(company)
+    if factory is None:
+        engine = get_engine(company)
+        with _lock:
+            factory = _session_factories.get(company)
+            if factory is None:
+                factory = _session_factories[company] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return factory
+
+def SessionLocal(company: Optional[str] = None) -> Session:
+    """Nueva sesión de base de datos del pool de la empresa (crea el engine si aún no existe)"""
+    return get_session_factory(company)()
+
+def warm_up(connections: Optional[int] = None, company: Optional[str] = None):
+    """Abre por adelantado conexiones del pool para que la primera petición no pague el handshake"""
+    connections = settings.SQL_POOL_WARMUP if connections is None else connections
+    engine = get_engine(company)
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
+    logger.info(f"Pool de SQL Server{f' de la empresa {company}' if company else ''} precalentado con {len(opened)} conexiones")
+
+def acquire_app_lock(resource: str) -> Optional[Connection]:
+    """Toma un candado de aplicación de SQL Server (sp_getapplock) sin esperar.
+
+    Coordina procesos distintos (p. ej. los workers de uvicorn). Retorna la
+    conexión que lo tiene, o None si otro proceso ya lo tiene; se libera con
+    release_app_lock.
+    """
+    conn = get_engine().connect()
+    try:
+        result = conn.execute(text(
+            "SET NOCOUNT ON; DECLARE @result INT; "
+            "EXEC @result = sp_getapplock @Resource = :resource, @LockMode = 'Exclusive', "
+            "@LockOwner = 'Session', @LockTimeout = 0; "
+            "SELECT @result"
+        ), {"resource": resource}).scalar()
+    except Exception:
+        conn.close()
+        raise
+    if result is None or result < 0:
+        conn.close()
+        return None
+    return conn
+
+def release_app_lock(conn: Connection, resource: str):
+    """Libera el candado antes de devolver la conexión al pool (un candado de sesión sobreviviría al rollback)"""
+    try:
+        conn.execute(text("EXEC sp_releaseapplock @Resource = :resource, @LockOwner = 'Session'"), {"resource": resource})
+    finally:
+        conn.close()
+
+def dispose_engine():
+    """Cierra las conexiones de todos los pools (al apagar la API)"""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
+
 def get_db():
     """Proveedor de sesión de base de datos para inyección de dependencias"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from config.settings import settings
+from config.companies import DEFAULT_COMPANY, get_company
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_SQLITE_PARAMS = 900
+
+def payload_hash(item_name: str, column_values: Dict[str, Any]) -> str:
+    """Hash estable del contenido enviado a Monday para un documento"""
+    payload = json.dumps({"name": item_name, "column_values": column_values}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MondayLedger:
+    """Registro local (SQLite) de CVE_DOC -> ID de ítem en Monday.
+
+    Se escribe en cuanto Monday confirma la creación del ítem, antes de marcar
+    SINCRONIZADO en SQL Server, para que una falla en ese commit no provoque
+    ítems duplicados en la siguiente ejecución.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS monday_ledger (
+            cve_doc TEXT PRIMARY KEY,
+            monday_id TEXT NOT NULL,
+            payload_hash TEXT NOT NULL,
+            synced_at TEXT NOT NULL,
+            payload TEXT
+        )
+        """)
+        # Registros creados antes de guardar el contenido enviado
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(monday_ledger)")}
+        if "payload" not in columns:
+            self._conn.execute("ALTER TABLE monday_ledger ADD COLUMN payload TEXT")
+
+    def _select(self, columns: str, cve_docs: Iterable[str]) -> List[tuple]:
+        cve_docs = list(cve_docs)
+        rows = []
+        with self._lock:
+            for start in range(0, len(cve_docs), MAX_SQLITE_PARAMS):
+                chunk = cve_docs[start:start + MAX_SQLITE_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows.extend(self._conn.execute(
+                    f"SELECT cve_doc, {columns} FROM monday_ledger WHERE cve_doc IN ({placeholders})",
+                    chunk
+                ))
+        return rows
+
+    def lookup(self, cve_docs: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+        """Busca en bloque los documentos ya creados; retorna {cve_doc: (monday_id, payload_hash)}"""
+        return {cve_doc: (monday_id, hash_value)
+                for cve_doc, monday_id, hash_value in self._select("monday_id, payload_hash", cve_docs)}
+
+    def lookup_payloads(self, cve_docs: Iterable[str]) -> Dict[str, Tuple[str, str, Optional[Dict[str, Any]]]]:
+        """Retorna {cve_doc: (monday_id, payload_hash, column_values enviados o None)}"""
+        return {
+            cve_doc: (monday_id, hash_value, json.loads(payload) if payload else None)
+            for cve_doc, monday_id, hash_value, payload in self._select("monday_id, payload_hash, payload", cve_docs)
+        }
+
+    def record(self, entries: List[Tuple[str, str, str, Dict[str, Any]]]):
+        """Registra en una sola transacción (cve_doc, monday_id, payload_hash, column_values) confirmados por Monday"""
+        if not entries:
+            return
+        synced_at = datetime.now().isoformat()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO monday_ledger (cve_doc, monday_id, payload_hash, synced_at, payload) VALUES (?, ?, ?, ?, ?)",
+                    [(cve_doc, monday_id, hash_value, synced_at, json.dumps(column_values, sort_keys=True, default=str))
+                     for cve_doc, monday_id, hash_value, column_values in entries]
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def forget(self, cve_docs: List[str]):
+        """Elimina documentos del registro (ítems que ya no existen en Monday)"""
+        if not cve_docs:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for start in range(0, len(cve_docs), MAX_SQLITE_PARAMS):
+                    chunk = cve_docs[start:start + MAX_SQLITE_PARAMS]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    self._conn.execute(f"DELETE FROM monday_ledger WHERE cve_doc IN ({placeholders})", chunk)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        self._conn.close()
+
+_ledgers: Dict[str, MondayLedger] = {}
+_ledger_lock = threading.Lock()
+
+def ledger_path(company: str) -> str:
+    """Ruta del registro de la empresa: la 03 usa MONDAY_LEDGER_PATH y las demás llevan su número"""
+    path = Path(settings.MONDAY_LEDGER_PATH)
+    if company == DEFAULT_COMPANY:
+        return str(path)
+    return str(path.with_name(f"{path.stem}_{company}{path.suffix}"))
+
+def get_monday_ledger(company: Optional[str] = None) -> MondayLedger:
+    """Registro local de la empresa (la primera configurada si no se indica), abierto en el primer uso"""
+    company = company or get_company().number
+    ledger = _ledgers.get(company)
+    if ledger is None:
+        with _ledger_lock:
+            ledger = _ledgers.get(company)
+            if ledger is None:
+                ledger = _ledgers[company] = MondayLedger(ledger_path(company))
+    return ledger
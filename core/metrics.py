@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Este módulo no depende de config.settings para que transferfmh.py pueda usarlo
+TRANSFER_SNAPSHOT_PATH = Path(__file__).parent.parent / 'data' / 'transfer_metrics.json'
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """Contadores, medidores e histogramas en memoria con salida en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[self._key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [cuenta por cubeta..., suma, total]
+            series = self._histograms.setdefault(name, {})
+            data = series.setdefault(key, [0.0] * (len(BUCKETS) + 2))
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def mean(self, name: str, **labels) -> Optional[float]:
+        """Promedio de un histograma (suma / cuenta), None si aún no tiene observaciones"""
+        with self._lock:
+            data = self._histograms.get(name, {}).get(self._key(labels))
+        if not data or not data[-1]:
+            return None
+        return data[-2] / data[-1]
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._values) | set(self._histograms)):
+                kind, help_text = self._meta.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self._values.get(name, {}).items():
+                    lines.append(f"{name}{self._labels(key)} {value}")
+                for key, data in self._histograms.get(name, {}).items():
+                    for index, bound in enumerate(BUCKETS):
+                        lines.append(f"{name}_bucket{self._labels(key, ('le', str(bound)))} {data[index]}")
+                    lines.append(f"{name}_bucket{self._labels(key, ('le', '+Inf'))} {data[-1]}")
+                    lines.append(f"{name}_sum{self._labels(key)} {data[-2]}")
+                    lines.append(f"{name}_count{self._labels(key)} {data[-1]}")
+        return "\n".join(lines) + "\n"
+
+class StageTimes:
+    """Tiempo acumulado por etapa (Firebird, SQL Server, Monday...) de una ejecución.
+
+    Con llamadas en paralelo los tiempos de una etapa se suman, así que el
+    total puede superar el tiempo real transcurrido.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.rows: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def add_rows(self, stage: str, rows: int):
+        with self._lock:
+            self.rows[stage] = self.rows.get(stage, 0) + rows
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            stages = {}
+            for stage, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+                stages[stage] = {"seconds": round(seconds, 3), "calls": self.calls[stage]}
+                if stage in self.rows:
+                    stages[stage]["rows"] = self.rows[stage]
+            return stages
+
+# Etapas de la ejecución en curso; se propaga a tareas asyncio y a asyncio.to_thread
+_current_stages: ContextVar[Optional[StageTimes]] = ContextVar("current_stages", default=None)
+
+@contextmanager
+def track_stages(stages: StageTimes) -> Iterator[StageTimes]:
+    """Acumula en `stages` los tiempos medidos dentro del bloque"""
+    token = _current_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _current_stages.reset(token)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Suma la duración del bloque a la etapa de la ejecución en curso, si la hay"""
+    stages = _current_stages.get()
+    if stages is None:
+        yield
+        return
+    with stages.measure(name):
+        yield
+
+@contextmanager
+def timed(histogram: str, stage_name: str, **labels) -> Iterator[None]:
+    """Registra la duración del bloque en un histograma y en la etapa en curso"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe(histogram, elapsed, **labels)
+        stages = _current_stages.get()
+        if stages is not None:
+            stages.add(stage_name, elapsed)
+
+def transfer_snapshot_path(company: Optional[str] = None) -> Path:
+    """Archivo de métricas de la empresa; la 03 conserva transfer_metrics.json"""
+    if company is None or company == "03":
+        return TRANSFER_SNAPSHOT_PATH
+    return TRANSFER_SNAPSHOT_PATH.with_name(f"{TRANSFER_SNAPSHOT_PATH.stem}_{company}{TRANSFER_SNAPSHOT_PATH.suffix}")
+
+def write_transfer_snapshot(rows: Dict[str, int], stages: StageTimes, failed_batches: int,
+                            path: Optional[Path] = None, company: Optional[str] = None):
+    """Guarda las métricas de la última ejecución de transferfmh.py (proceso aparte de la API)"""
+    path = path or transfer_snapshot_path(company)
+    snapshot = {
+        "finished_at": datetime.now().isoformat(),
+        "timestamp": time.time(),
+        "rows": rows,
+        "stages": stages.to_dict(),
+        "failed_batches": failed_batches,
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+        tmp.replace(path)
+    except OSError as e:
+        logger.error(f"No se pudieron guardar las métricas de transferencia: {str(e)}")
+
+def render_transfer_snapshot(directory: Optional[Path] = None) -> str:
+    """Métricas de la última transferencia de cada empresa como medidores de Prometheus"""
+    directory = directory or TRANSFER_SNAPSHOT_PATH.parent
+    snapshots = []
+    for path in sorted(directory.glob(f"{TRANSFER_SNAPSHOT_PATH.stem}*{TRANSFER_SNAPSHOT_PATH.suffix}")):
+        company = path.stem[len(TRANSFER_SNAPSHOT_PATH.stem):].lstrip("_") or "03"
+        try:
+            snapshots.append((company, json.loads(path.read_text(encoding="utf-8"))))
+        except (OSError, ValueError):
+            continue
+    if not snapshots:
+        return ""
+
+    lines = [
+        "# HELP transfer_last_run_timestamp_seconds Fin de la última ejecución de transferfmh.py",
+        "# TYPE transfer_last_run_timestamp_seconds gauge",
+    ]
+    for company, snapshot in snapshots:
+        lines.append(f'transfer_last_run_timestamp_seconds{{company="{company}"}} {snapshot.get("timestamp", 0)}')
+    lines += [
+        "# HELP transfer_last_run_rows Registros por fase en la última transferencia",
+        "# TYPE transfer_last_run_rows gauge",
+    ]
+    for company, snapshot in snapshots:
+        for phase, value in (snapshot.get("rows") or {}).items():
+            lines.append(f'transfer_last_run_rows{{company="{company}",phase="{phase}"}} {value}')
+    lines += [
+        "# HELP transfer_last_run_stage_seconds Tiempo acumulado por etapa en la última transferencia",
+        "# TYPE transfer_last_run_stage_seconds gauge",
+    ]
+    for company, snapshot in snapshots:
+        for name, data in (snapshot.get("stages") or {}).items():
+            lines.append(f'transfer_last_run_stage_seconds{{company="{company}",stage="{name}"}} {data["seconds"]}')
+    lines += [
+        "# HELP transfer_last_run_failed_batches Lotes con error en la última transferencia",
+        "# TYPE transfer_last_run_failed_batches gauge",
+    ]
+    for company, snapshot in snapshots:
+        lines.append(f'transfer_last_run_failed_batches{{company="{company}"}} {snapshot.get("failed_batches", 0)}')
+    return "\n".join(lines) + "\n"
+
+# Registro de métricas del proceso
+registry = MetricsRegistry()
+registry.describe("monday_request_seconds", "histogram", "Latencia de cada petición HTTP a Monday por operación")
+registry.describe("monday_requests_total", "counter", "Peticiones HTTP a Monday por operación y código de estado")
+registry.describe("monday_retries_total", "counter", "Reintentos de peticiones a Monday por operación y motivo")
+registry.describe("monday_complexity_consumed_total", "counter", "Complejidad consumida según el campo complexity")
+registry.describe("monday_complexity_remaining", "gauge", "Presupuesto de complejidad restante reportado por Monday")
+registry.describe("sql_query_seconds", "histogram", "Duración de consultas y actualizaciones en SQL Server por operación")
+registry.describe("sql_commit_seconds", "histogram", "Duración de commits en SQL Server por operación")
+registry.describe("ledger_write_seconds", "histogram", "Duración de escrituras en el registro local de Monday")
+registry.describe("sync_items_total", "counter", "Documentos procesados por la sincronización por acción y estado")
+registry.describe("scheduler_cycles_total", "counter", "Ciclos de transferencia y sincronización del programador")
+registry.describe("scheduler_cycles_skipped_total", "counter", "Ciclos omitidos porque otro proceso de la API tenía el candado del programador")
+registry.describe("scheduler_interval_seconds", "gauge", "Intervalo actual del programador según el trabajo pendiente")
+registry.describe("scheduler_stage_seconds", "histogram", "Duración de la transferencia y la sincronización de cada ciclo programado")
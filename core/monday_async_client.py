@@ -0,0 +1,216 @@
+import asyncio
+import time
+import httpx
+from typing import Dict, Any, List, Optional, Iterable
+from config.settings import settings
+from core.monday_client import BaseMondayClient, request_body
+from config.companies import Company, get_company
+from core.rate_limiter import ComplexityBudget, company_budget, with_complexity, backoff_delay
+from core import metrics
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class AsyncMondayClient(BaseMondayClient):
+    """Cliente asíncrono de Monday.com con conexiones reutilizables (keep-alive).
+
+    Expone la misma interfaz que MondayClient y limita con un semáforo el
+    número de peticiones simultáneas a MONDAY_MAX_CONCURRENCY (o a la parte
+    que le toca a su empresa).
+    """
+
+    def __init__(self, budget: Optional[ComplexityBudget] = None, max_concurrency: Optional[int] = None):
+        super().__init__(budget)
+        self.max_concurrency = max_concurrency or settings.MONDAY_MAX_CONCURRENCY
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.BoundedSemaphore] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Crea el pool HTTP en el primer uso (dentro del event loop)"""
+        if self._http is None or self._http.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            )
+            self._http = httpx.AsyncClient(
+                headers=self.headers,
+                limits=limits,
+                timeout=settings.MONDAY_HTTP_TIMEOUT
+            )
+            self._semaphore = asyncio.BoundedSemaphore(self.max_concurrency)
+        return self._http
+
+    async def aclose(self):
+        """Cierra el pool de conexiones"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _connect_failed(error: httpx.TransportError) -> bool:
+        """Indica si la petición falló antes de llegar a Monday (sin conexión o sin conexión libre a tiempo)"""
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    async def _post(self, query: str, operation: str = "query",
+                    variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Envía la consulta respetando el presupuesto de complejidad y reintenta límites, 5xx y fallas de red.
+
+        Las mutaciones solo se reintentan si no llegaron a Monday o fueron limitadas.
+        """
+        http = self._get_http()
+        body = request_body(with_complexity(query), variables)
+        attempt = 0
+        with metrics.stage("monday"):
+            while True:
+                await self.budget.acquire_async()
+                try:
+                    async with self._semaphore:
+                        started = time.perf_counter()
+                        response = await http.post(self.api_url, content=body)
+                except httpx.TransportError as e:
+                    if attempt >= settings.MONDAY_MAX_RETRIES:
+                        raise
+                    if operation in self.MUTATIONS and not self._connect_failed(e):
+                        logger.error(f"Error de red con Monday en {operation} después de enviar la petición, no se reintenta: {str(e)}")
+                        raise
+                    delay = backoff_delay(attempt)
+                    self._record_retry(operation, "network")
+                    logger.warning(f"Error de red con Monday ({str(e)}), reintento {attempt + 1} en {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_response(operation, response.status_code, time.perf_counter() - started)
+
+                data = self._response_json(response)
+                delay = self._retry_delay(response.status_code, response.headers, data, attempt, operation)
+                if delay is not None:
+                    self._record_retry(operation, self._retry_reason(response.status_code))
+                    logger.warning(f"Monday limitó la llamada (HTTP {response.status_code}), reintento {attempt + 1} en {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                response.raise_for_status()
+                self.budget.update(data, operation)
+                return data
+
+    async def get_board_groups(self, board_id: str) -> Dict[str, str]:
+        """Obtiene todos los grupos del tablero y retorna un dict {nombre: id}"""
+        try:
+            data = await self._post(self._build_board_groups_query(board_id), "get_board_groups")
+            return self._parse_board_groups(data)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al obtener grupos: {str(e)}")
+            raise
+
+    async def create_group(self, board_id: str, group_name: str) -> Optional[str]:
+        """Crea un nuevo grupo en el tablero y retorna su ID"""
+        try:
+            data = await self._post(self._build_create_group_query(board_id, group_name), "create_group")
+            return self._parse_create_group(data)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al crear grupo: {str(e)}")
+            raise
+
+    async def resolve_groups(self, board_id: str, fechas: Iterable[datetime]) -> Dict[str, str]:
+        """Resuelve en una sola pasada los grupos de todos los meses de las fechas"""
+        fechas = list(fechas)
+        resolved, pending = self._split_cached_groups(board_id, fechas)
+        if not pending:
+            return resolved
+
+        # Otra empresa con el mismo tablero pudo crear los grupos mientras se esperaba el candado
+        async with self._group_cache.async_board_lock(board_id):
+            resolved, pending = self._split_cached_groups(board_id, fechas)
+            if not pending:
+                return resolved
+
+            existing_groups = await self.get_board_groups(board_id)
+            for title, group_id in existing_groups.items():
+                self._group_cache.set(board_id, title, group_id)
+
+            for group_name in pending:
+                if group_name in existing_groups:
+                    logger.info(f"Grupo '{group_name}' ya existe con ID: {existing_groups[group_name]}")
+                    resolved[group_name] = existing_groups[group_name]
+                    continue
+
+                logger.info(f"Creando nuevo grupo: {group_name}")
+                try:
+                    group_id = await self.create_group(board_id, group_name)
+                except httpx.HTTPError:
+                    group_id = None
+                self._register_created_group(board_id, group_name, group_id, resolved)
+
+        return resolved
+
+    async def create_item(self, board_id: str, item_name: str, column_values: Dict[str, Any], group_id: Optional[str] = None):
+        """Crea un nuevo ítem en el tablero especificado, opcionalmente en un grupo específico"""
+        query, variables = self._build_create_item_query(board_id, item_name, column_values, group_id)
+        try:
+            return await self._post(query, "create_item", variables)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al crear ítem en Monday: {str(e)}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"Respuesta del servidor: {e.response.text}")
+            raise
+
+    async def _create_batch(self, board_id: str, batch: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        try:
+            query, variables = self._build_create_items_query(board_id, batch)
+            data = await self._post(query, "create_items", variables)
+            return self._parse_batch(batch, data)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al crear lote de {len(batch)} ítems en Monday: {str(e)}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"Respuesta del servidor: {e.response.text}")
+            return self._failed_batch(batch, e)
+
+    async def create_items(self, board_id: str, items: List[Dict[str, Any]],
+                           batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Crea ítems en lotes con alias, enviando los lotes en paralelo (acotado por el semáforo)"""
+        batch_size = batch_size or settings.MONDAY_BATCH_SIZE
+        batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+        results: Dict[str, Dict[str, Any]] = {}
+        for partial in await asyncio.gather(*(self._create_batch(board_id, batch) for batch in batches)):
+            results.update(partial)
+        return results
+
+    async def _change_batch(self, board_id: str, batch: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        try:
+            query, variables = self._build_change_columns_query(board_id, batch)
+            data = await self._post(query, "change_column_values", variables)
+            return self._parse_batch(batch, data)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al actualizar lote de {len(batch)} ítems en Monday: {str(e)}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"Respuesta del servidor: {e.response.text}")
+            return self._failed_batch(batch, e)
+
+    async def change_items_column_values(self, board_id: str, updates: List[Dict[str, Any]],
+                                         batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Actualiza columnas de ítems existentes en lotes con alias enviados en paralelo"""
+        batch_size = batch_size or settings.MONDAY_BATCH_SIZE
+        batches = [updates[start:start + batch_size] for start in range(0, len(updates), batch_size)]
+        results: Dict[str, Dict[str, Any]] = {}
+        for partial in await asyncio.gather(*(self._change_batch(board_id, batch) for batch in batches)):
+            results.update(partial)
+        return results
+
+_clients: Dict[str, AsyncMondayClient] = {}
+
+def get_async_monday_client(company: Optional[Company] = None) -> AsyncMondayClient:
+    """Cliente asíncrono de la empresa, creado en el primer uso con su parte de la concurrencia"""
+    company = company or get_company()
+    if company.number not in _clients:
+        _clients[company.number] = AsyncMondayClient(
+            budget=company_budget(company.number, company.budget_share),
+            max_concurrency=max(round(settings.MONDAY_MAX_CONCURRENCY * company.budget_share), 1)
+        )
+    return _clients[company.number]
+
+async def close_async_monday_client():
+    """Cierra los pools HTTP de los clientes asíncronos que llegaron a crearse"""
+    for client in _clients.values():
+        await client.aclose()
@@ -1,25 +1,157 @@
+import asyncio
 import requests
+import urllib3
 import json
-from typing import Dict, Any, Optional
+import threading
+import time
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
 from config.settings import settings
 from config.security import verify_credentials
+from config.companies import Company, get_company
+from core.rate_limiter import ComplexityBudget, complexity_budget, company_budget, with_complexity, throttle_delay, backoff_delay
+from core import metrics
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-class MondayClient:
+try:
+    import orjson
+
+    def dumps(value: Any) -> bytes:
+        """Serializa a JSON (orjson si está instalado)"""
+        return orjson.dumps(value, default=str)
+except ImportError:
+    def dumps(value: Any) -> bytes:
+        """Serializa a JSON (orjson si está instalado)"""
+        return json.dumps(value, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def request_body(query: str, variables: Optional[Dict[str, Any]] = None) -> bytes:
+    """Cuerpo de la petición GraphQL ya serializado"""
+    return dumps({'query': query, 'variables': variables} if variables else {'query': query})
+
+MESES = {
+    1: "ene", 2: "feb", 3: "mar", 4: "abr", 5: "may", 6: "jun",
+    7: "jul", 8: "ago", 9: "sep", 10: "oct", 11: "nov", 12: "dic"
+}
+
+class GroupCache:
+    """Cache con TTL de grupos {(board_id, nombre_grupo): (group_id, expira_en)}.
+
+    Hay una sola instancia por proceso (group_cache) que comparten todos los
+    clientes: Monday no evita títulos de grupo repetidos, así que dos
+    clientes que crean el mismo mes a la vez dejarían dos grupos.
+    """
+
     def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._board_locks: Dict[str, threading.Lock] = {}
+        self._async_board_locks: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = {}
+        self._guard = threading.Lock()
+
+    def board_lock(self, board_id: str) -> threading.Lock:
+        """Candado del tablero para buscar y crear sus grupos de uno en uno"""
+        with self._guard:
+            return self._board_locks.setdefault(str(board_id), threading.Lock())
+
+    def async_board_lock(self, board_id: str) -> asyncio.Lock:
+        """Candado del tablero para los clientes asíncronos del event loop actual
+        (empresas que comparten tablero y se sincronizan en paralelo)"""
+        loop = asyncio.get_running_loop()
+        with self._guard:
+            lock_loop, lock = self._async_board_locks.get(str(board_id), (None, None))
+            if lock_loop is not loop:
+                lock = asyncio.Lock()
+                self._async_board_locks[str(board_id)] = (loop, lock)
+            return lock
+
+    def get(self, board_id: str, group_name: str) -> Optional[str]:
+        """Retorna el ID de grupo en cache si no ha expirado"""
+        entry = self._entries.get((str(board_id), group_name))
+        if entry is None:
+            return None
+        group_id, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[(str(board_id), group_name)]
+            return None
+        return group_id
+
+    def set(self, board_id: str, group_name: str, group_id: str):
+        expires_at = time.monotonic() + settings.MONDAY_GROUP_CACHE_TTL
+        self._entries[(str(board_id), group_name)] = (group_id, expires_at)
+
+    def invalidate(self, board_id: str, group_name: Optional[str] = None):
+        """Invalida un grupo o todos los grupos del tablero"""
+        if group_name is not None:
+            self._entries.pop((str(board_id), group_name), None)
+            return
+        for key in [k for k in self._entries if k[0] == str(board_id)]:
+            del self._entries[key]
+
+# Cache de grupos compartido por todos los clientes del proceso
+group_cache = GroupCache()
+
+class BaseMondayClient:
+    """Construcción de consultas, lectura de respuestas y cache de grupos comunes a los clientes"""
+
+    # Operaciones que modifican el tablero: si Monday recibió la petición, reenviarla
+    # puede duplicar ítems o grupos, así que solo se reintentan fallas al conectar y límites
+    MUTATIONS = frozenset({"create_group", "create_item", "create_items", "change_column_values", "delete_items"})
+    # Códigos de error con los que Monday rechaza un group_id inexistente o borrado
+    GROUP_ERROR_CODES = frozenset({"InvalidGroupIdException"})
+
+    def __init__(self, budget: Optional[ComplexityBudget] = None):
         verify_credentials()
+        self.budget = budget or complexity_budget
         self.headers = {
             "Authorization": settings.MONDAY_API_KEY.get_secret_value(),
             "Content-Type": "application/json"
         }
         self.api_url = settings.MONDAY_API_URL
-    
-    def get_board_groups(self, board_id: str) -> Dict[str, str]:
-        """Obtiene todos los grupos del tablero y retorna un dict {nombre: id}"""
-        query = f"""
+        self._group_cache = group_cache
+
+    @staticmethod
+    def _response_json(response) -> Dict[str, Any]:
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def _record_response(operation: str, status_code: int, elapsed: float):
+        metrics.registry.observe("monday_request_seconds", elapsed, operation=operation)
+        metrics.registry.inc("monday_requests_total", operation=operation, status=status_code)
+
+    @staticmethod
+    def _record_retry(operation: str, reason: str):
+        metrics.registry.inc("monday_retries_total", operation=operation, reason=reason)
+
+    @staticmethod
+    def _retry_reason(status_code: int) -> str:
+        return "server_error" if status_code >= 500 else "throttled"
+
+    def _retry_delay(self, status_code: int, headers, data: Dict[str, Any], attempt: int,
+                     operation: str = "query") -> Optional[float]:
+        """Pausa antes de reintentar una respuesta limitada o 5xx, None si no se reintenta.
+
+        Un 5xx de una mutación no se reintenta: Monday pudo haberla aplicado.
+        """
+        if attempt >= settings.MONDAY_MAX_RETRIES:
+            return None
+        hint = throttle_delay(data)
+        retryable_5xx = status_code >= 500 and operation not in self.MUTATIONS
+        if hint is None and status_code != 429 and not retryable_5xx:
+            return None
+        if hint:
+            self.budget.exhausted(hint)
+        retry_after = headers.get('Retry-After')
+        if hint is None and retry_after and retry_after.isdigit():
+            hint = float(retry_after)
+        return backoff_delay(attempt, hint)
+
+    @staticmethod
+    def _build_board_groups_query(board_id: str) -> str:
+        return f"""
         query {{
             boards (ids: {board_id}) {{
                 groups {{
@@ -29,29 +161,18 @@ class MondayClient:
             }}
         }}
         """
-        
-        try:
-            response = requests.post(
-                self.api_url,
-                json={'query': query},
-                headers=self.headers
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            groups = {}
-            if data.get('data', {}).get('boards'):
-                for group in data['data']['boards'][0]['groups']:
-                    groups[group['title']] = group['id']
-            
-            return groups
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error al obtener grupos: {str(e)}")
-            raise
-    
-    def create_group(self, board_id: str, group_name: str) -> Optional[str]:
-        """Crea un nuevo grupo en el tablero y retorna su ID"""
-        query = f"""
+
+    @staticmethod
+    def _parse_board_groups(data: Dict[str, Any]) -> Dict[str, str]:
+        groups = {}
+        if (data.get('data') or {}).get('boards'):
+            for group in data['data']['boards'][0]['groups']:
+                groups[group['title']] = group['id']
+        return groups
+
+    @staticmethod
+    def _build_create_group_query(board_id: str, group_name: str) -> str:
+        return f"""
         mutation {{
             create_group (
                 board_id: {board_id},
@@ -61,84 +182,409 @@ class MondayClient:
             }}
         }}
         """
-        
-        try:
-            response = requests.post(
-                self.api_url,
-                json={'query': query},
-                headers=self.headers
+
+    @staticmethod
+    def _parse_create_group(data: Dict[str, Any]) -> Optional[str]:
+        if ((data.get('data') or {}).get('create_group') or {}).get('id'):
+            return data['data']['create_group']['id']
+        return None
+
+    @staticmethod
+    def group_name_for_date(fecha_doc: datetime) -> str:
+        """Nombre del grupo mensual para una fecha (ej: "ene-2024", "feb-2024")"""
+        return f"{MESES[fecha_doc.month]}-{fecha_doc.year}"
+
+    def invalidate_group_cache(self, board_id: str, group_name: Optional[str] = None):
+        """Invalida el cache de un grupo o de todos los grupos del tablero"""
+        self._group_cache.invalidate(board_id, group_name)
+
+    def _split_cached_groups(self, board_id: str, fechas: Iterable[datetime]) -> Tuple[Dict[str, str], List[str]]:
+        """Separa los meses de las fechas en grupos ya en cache y grupos pendientes"""
+        resolved = {}
+        pending = []
+        for group_name in {self.group_name_for_date(fecha) for fecha in fechas}:
+            group_id = self._group_cache.get(board_id, group_name)
+            if group_id:
+                resolved[group_name] = group_id
+            else:
+                pending.append(group_name)
+        return resolved, sorted(pending)
+
+    def _register_created_group(self, board_id: str, group_name: str, group_id: Optional[str],
+                                resolved: Dict[str, str]):
+        if group_id:
+            logger.info(f"Grupo '{group_name}' creado con ID: {group_id}")
+            self._group_cache.set(board_id, group_name, group_id)
+            resolved[group_name] = group_id
+        else:
+            logger.error(f"No se pudo crear el grupo {group_name}")
+            self._group_cache.invalidate(board_id)
+
+    @staticmethod
+    def error_codes(result: Dict[str, Any]) -> List[str]:
+        """Códigos de error de Monday: extensions.code (API 2023-10+) o error_code (formato anterior)"""
+        codes = [str(result['error_code'])] if result.get('error_code') else []
+        for error in result.get('errors') or []:
+            if not isinstance(error, dict):
+                continue
+            code = (error.get('extensions') or {}).get('code') or error.get('error_code')
+            if code:
+                codes.append(str(code))
+        return codes
+
+    @classmethod
+    def is_group_error(cls, result: Dict[str, Any]) -> bool:
+        """Indica si la respuesta de Monday rechaza el group_id enviado"""
+        return any(code in cls.GROUP_ERROR_CODES for code in cls.error_codes(result))
+
+    @staticmethod
+    def _build_create_item_query(board_id: str, item_name: str, column_values: Dict[str, Any],
+                                 group_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        return BaseMondayClient._build_create_items_query(
+            board_id, [{'item_name': item_name, 'column_values': column_values, 'group_id': group_id}]
+        )
+
+    @staticmethod
+    def _build_create_items_query(board_id: str, items: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """Arma un documento GraphQL con una mutación create_item por alias y sus variables.
+
+        Los nombres y valores viajan como variables: no se escapan a mano y el
+        texto de la mutación solo depende del tamaño del lote.
+        """
+        variables: Dict[str, Any] = {'board': str(board_id)}
+        definitions = ["$board: ID!"]
+        mutations = []
+        for index, item in enumerate(items):
+            definitions.append(f"$name_{index}: String!, $values_{index}: JSON, $group_{index}: String")
+            variables[f"name_{index}"] = item['item_name']
+            variables[f"values_{index}"] = dumps(item['column_values']).decode("utf-8")
+            variables[f"group_{index}"] = item.get('group_id')
+            mutations.append(
+                f"\n            item_{index}: create_item (board_id: $board, item_name: $name_{index}, "
+                f"column_values: $values_{index}, group_id: $group_{index}) {{ id }}"
             )
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('data', {}).get('create_group', {}).get('id'):
-                return data['data']['create_group']['id']
-            return None
+        return f"mutation ({', '.join(definitions)}) {{{''.join(mutations)}\n}}", variables
+
+    @staticmethod
+    def _build_change_columns_query(board_id: str, updates: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """Arma un documento GraphQL con una mutación change_multiple_column_values por alias y sus variables"""
+        variables: Dict[str, Any] = {'board': str(board_id)}
+        definitions = ["$board: ID!"]
+        mutations = []
+        for index, update in enumerate(updates):
+            definitions.append(f"$item_{index}: ID!, $values_{index}: JSON!")
+            variables[f"item_{index}"] = str(update['item_id'])
+            variables[f"values_{index}"] = dumps(update['column_values']).decode("utf-8")
+            mutations.append(
+                f"\n            item_{index}: change_multiple_column_values (board_id: $board, "
+                f"item_id: $item_{index}, column_values: $values_{index}) {{ id }}"
+            )
+        return f"mutation ({', '.join(definitions)}) {{{''.join(mutations)}\n}}", variables
+
+    @staticmethod
+    def _build_delete_items_query(deletes: List[Dict[str, Any]]) -> str:
+        """Arma un documento GraphQL con una mutación delete_item por alias"""
+        mutations = []
+        for index, delete in enumerate(deletes):
+            mutations.append(f"""
+            item_{index}: delete_item (item_id: {delete['item_id']}) {{
+                id
+            }}""")
+        return f"mutation {{{''.join(mutations)}\n}}"
+
+    @staticmethod
+    def _build_items_page_query(board_id: str, limit: int, cursor: Optional[str] = None) -> str:
+        """Primera página (items_page) o siguiente (next_items_page) de ítems, solo id y nombre"""
+        if cursor is None:
+            return f"""
+            query {{
+                boards (ids: {board_id}) {{
+                    items_page (limit: {limit}) {{
+                        cursor
+                        items {{ id name }}
+                    }}
+                }}
+            }}
+            """
+        return f"""
+        query {{
+            next_items_page (limit: {limit}, cursor: {json.dumps(cursor)}) {{
+                cursor
+                items {{ id name }}
+            }}
+        }}
+        """
+
+    @staticmethod
+    def _parse_items_page(data: Dict[str, Any]) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Retorna (ítems, cursor de la siguiente página o None si fue la última)"""
+        payload = data.get('data') or {}
+        if 'next_items_page' in payload:
+            page = payload['next_items_page'] or {}
+        else:
+            boards = payload.get('boards') or [{}]
+            page = boards[0].get('items_page') or {}
+        return page.get('items') or [], page.get('cursor')
+
+    @staticmethod
+    def _parse_batch(batch: List[Dict[str, Any]], data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Asocia la respuesta de un lote con alias a la clave de cada ítem"""
+        # Errores asociados a un alias (path) o al documento completo
+        alias_errors: Dict[str, List[Dict[str, Any]]] = {}
+        global_errors = []
+        for error in data.get('errors') or []:
+            path = error.get('path') if isinstance(error, dict) else None
+            if path:
+                alias_errors.setdefault(str(path[0]), []).append(error)
+            else:
+                global_errors.append(error)
+        if data.get('error_message'):
+            global_errors.append({'message': data['error_message'], 'error_code': data.get('error_code')})
+
+        results = {}
+        payload = data.get('data') or {}
+        for index, item in enumerate(batch):
+            alias = f"item_{index}"
+            created = payload.get(alias) or {}
+            errors = alias_errors.get(alias, [])
+            if not created.get('id'):
+                errors = errors or global_errors or [{'message': 'Monday no retornó ID'}]
+            results[item['key']] = {'id': created.get('id'), 'errors': errors}
+        return results
+
+    @staticmethod
+    def _failed_batch(batch: List[Dict[str, Any]], error: Exception) -> Dict[str, Dict[str, Any]]:
+        return {item['key']: {'id': None, 'errors': [{'message': str(error)}]} for item in batch}
+
+class MondayClient(BaseMondayClient):
+    def __init__(self, budget: Optional[ComplexityBudget] = None):
+        super().__init__(budget)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+    @staticmethod
+    def _connect_failed(error: requests.exceptions.RequestException) -> bool:
+        """Indica si la petición falló antes de llegar a Monday (sin conexión, DNS o tiempo de conexión agotado)"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            return isinstance(getattr(error.args[0], 'reason', None), urllib3.exceptions.NewConnectionError)
+        return False
+
+    def _execute(self, query: str, operation: str = "query",
+                 variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Envía la consulta respetando el presupuesto de complejidad y reintenta límites, 5xx y fallas de red.
+
+        Las mutaciones solo se reintentan si no llegaron a Monday o fueron limitadas.
+        """
+        body = request_body(with_complexity(query), variables)
+        attempt = 0
+        with metrics.stage("monday"):
+            while True:
+                self.budget.acquire()
+                started = time.perf_counter()
+                try:
+                    response = self.session.post(
+                        self.api_url,
+                        data=body,
+                        timeout=settings.MONDAY_HTTP_TIMEOUT
+                    )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt >= settings.MONDAY_MAX_RETRIES:
+                        raise
+                    if operation in self.MUTATIONS and not self._connect_failed(e):
+                        logger.error(f"Error de red con Monday en {operation} después de enviar la petición, no se reintenta: {str(e)}")
+                        raise
+                    delay = backoff_delay(attempt)
+                    self._record_retry(operation, "network")
+                    logger.warning(f"Error de red con Monday ({str(e)}), reintento {attempt + 1} en {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_response(operation, response.status_code, time.perf_counter() - started)
+
+                data = self._response_json(response)
+                delay = self._retry_delay(response.status_code, response.headers, data, attempt, operation)
+                if delay is not None:
+                    self._record_retry(operation, self._retry_reason(response.status_code))
+                    logger.warning(f"Monday limitó la llamada (HTTP {response.status_code}), reintento {attempt + 1} en {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+                response.raise_for_status()
+                self.budget.update(data, operation)
+                return data
+
+    def get_board_groups(self, board_id: str) -> Dict[str, str]:
+        """Obtiene todos los grupos del tablero y retorna un dict {nombre: id}"""
+        query = self._build_board_groups_query(board_id)
+
+        try:
+            return self._parse_board_groups(self._execute(query, "get_board_groups"))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error al obtener grupos: {str(e)}")
+            raise
+
+    def create_group(self, board_id: str, group_name: str) -> Optional[str]:
+        """Crea un nuevo grupo en el tablero y retorna su ID"""
+        query = self._build_create_group_query(board_id, group_name)
+
+        try:
+            return self._parse_create_group(self._execute(query, "create_group"))
         except requests.exceptions.RequestException as e:
             logger.error(f"Error al crear grupo: {str(e)}")
             raise
-    
+
+    def resolve_groups(self, board_id: str, fechas: Iterable[datetime]) -> Dict[str, str]:
+        """Resuelve en una sola pasada los grupos de todos los meses de las fechas.
+
+        Retorna un dict {nombre_grupo: id}. Los grupos que no se pudieron crear
+        no aparecen en el resultado.
+        """
+        fechas = list(fechas)
+        resolved, pending = self._split_cached_groups(board_id, fechas)
+        if not pending:
+            return resolved
+
+        # Otro hilo pudo crear los grupos mientras se esperaba el candado
+        with self._group_cache.board_lock(board_id):
+            resolved, pending = self._split_cached_groups(board_id, fechas)
+            if not pending:
+                return resolved
+
+            # Una sola consulta de grupos para todos los meses faltantes
+            existing_groups = self.get_board_groups(board_id)
+            for title, group_id in existing_groups.items():
+                self._group_cache.set(board_id, title, group_id)
+
+            for group_name in pending:
+                if group_name in existing_groups:
+                    logger.info(f"Grupo '{group_name}' ya existe con ID: {existing_groups[group_name]}")
+                    resolved[group_name] = existing_groups[group_name]
+                    continue
+
+                logger.info(f"Creando nuevo grupo: {group_name}")
+                try:
+                    group_id = self.create_group(board_id, group_name)
+                except requests.exceptions.RequestException:
+                    group_id = None
+                self._register_created_group(board_id, group_name, group_id, resolved)
+
+        return resolved
+
     def get_or_create_group_by_date(self, board_id: str, fecha_doc: datetime) -> str:
         """Obtiene o crea el grupo correspondiente al mes de la fecha"""
-        # Formatear el nombre del grupo (ej: "ene-2024", "feb-2024")
-        meses = {
-            1: "ene", 2: "feb", 3: "mar", 4: "abr", 5: "may", 6: "jun",
-            7: "jul", 8: "ago", 9: "sep", 10: "oct", 11: "nov", 12: "dic"
-        }
-        
-        mes_nombre = meses[fecha_doc.month]
-        año = fecha_doc.year
-        group_name = f"{mes_nombre}-{año}"
-        
-        # Obtener grupos existentes
-        existing_groups = self.get_board_groups(board_id)
-        
-        # Si el grupo ya existe, retornar su ID
-        if group_name in existing_groups:
-            logger.info(f"Grupo '{group_name}' ya existe con ID: {existing_groups[group_name]}")
-            return existing_groups[group_name]
-        
-        # Si no existe, crearlo
-        logger.info(f"Creando nuevo grupo: {group_name}")
-        group_id = self.create_group(board_id, group_name)
-        
-        if group_id:
-            logger.info(f"Grupo '{group_name}' creado con ID: {group_id}")
-            return group_id
-        else:
-            raise Exception(f"No se pudo crear el grupo {group_name}")
-    
+        group_name = self.group_name_for_date(fecha_doc)
+        groups = self.resolve_groups(board_id, [fecha_doc])
+        if group_name in groups:
+            return groups[group_name]
+        raise Exception(f"No se pudo crear el grupo {group_name}")
+
     def create_item(self, board_id: str, item_name: str, column_values: Dict[str, Any], group_id: Optional[str] = None):
         """Crea un nuevo ítem en el tablero especificado, opcionalmente en un grupo específico"""
-        
-        # Si se especifica group_id, incluirlo en la mutación
-        group_param = f', group_id: "{group_id}"' if group_id else ''
-        
-        query = f"""
-        mutation {{
-            create_item (
-                board_id: {board_id},
-                item_name: "{item_name}",
-                column_values: {json.dumps(json.dumps(column_values))}{group_param}
-            ) {{
-                id
-            }}
-        }}
-        """
-        
+        query, variables = self._build_create_item_query(board_id, item_name, column_values, group_id)
+
         try:
-            response = requests.post(
-                self.api_url,
-                json={'query': query},
-                headers=self.headers
-            )
-            response.raise_for_status()
-            return response.json()
+            return self._execute(query, "create_item", variables)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error al crear ítem en Monday: {str(e)}")
             if e.response is not None:
                 logger.error(f"Respuesta del servidor: {e.response.text}")
             raise
 
-# Instancia singleton del cliente
-monday_client = MondayClient()
\ No newline at end of file
+    def create_items(self, board_id: str, items: List[Dict[str, Any]],
+                     batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Crea varios ítems usando mutaciones con alias, batch_size por petición.
+
+        Cada ítem es un dict con 'key', 'item_name', 'column_values' y
+        opcionalmente 'group_id'. Retorna {key: {'id': ..., 'errors': [...]}}
+        para poder marcar o reportar cada documento por separado.
+        """
+        batch_size = batch_size or settings.MONDAY_BATCH_SIZE
+        results: Dict[str, Dict[str, Any]] = {}
+
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            query, variables = self._build_create_items_query(board_id, batch)
+
+            try:
+                results.update(self._parse_batch(batch, self._execute(query, "create_items", variables)))
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al crear lote de {len(batch)} ítems en Monday: {str(e)}")
+                if e.response is not None:
+                    logger.error(f"Respuesta del servidor: {e.response.text}")
+                results.update(self._failed_batch(batch, e))
+
+        return results
+
+    def change_items_column_values(self, board_id: str, updates: List[Dict[str, Any]],
+                                   batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Actualiza columnas de ítems existentes en lotes con alias, sin borrarlos ni recrearlos.
+
+        Cada actualización es un dict con 'key', 'item_id' y 'column_values'
+        (solo las columnas que cambiaron). Retorna {key: {'id': ..., 'errors': [...]}}.
+        """
+        batch_size = batch_size or settings.MONDAY_BATCH_SIZE
+        results: Dict[str, Dict[str, Any]] = {}
+
+        for start in range(0, len(updates), batch_size):
+            batch = updates[start:start + batch_size]
+            query, variables = self._build_change_columns_query(board_id, batch)
+
+            try:
+                results.update(self._parse_batch(batch, self._execute(query, "change_column_values", variables)))
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al actualizar lote de {len(batch)} ítems en Monday: {str(e)}")
+                if e.response is not None:
+                    logger.error(f"Respuesta del servidor: {e.response.text}")
+                results.update(self._failed_batch(batch, e))
+
+        return results
+
+    def delete_items(self, item_ids: List[str], batch_size: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Elimina ítems en lotes con alias; retorna {item_id: {'id': ..., 'errors': [...]}}"""
+        batch_size = batch_size or settings.MONDAY_BATCH_SIZE
+        deletes = [{'key': item_id, 'item_id': item_id} for item_id in item_ids]
+        results: Dict[str, Dict[str, Any]] = {}
+
+        for start in range(0, len(deletes), batch_size):
+            batch = deletes[start:start + batch_size]
+            try:
+                data = self._execute(self._build_delete_items_query(batch), "delete_items")
+                results.update(self._parse_batch(batch, data))
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al eliminar lote de {len(batch)} ítems en Monday: {str(e)}")
+                results.update(self._failed_batch(batch, e))
+
+        return results
+
+    def iter_board_items(self, board_id: str, limit: Optional[int] = None) -> Iterator[List[Dict[str, str]]]:
+        """Recorre los ítems del tablero por páginas con cursor (items_page / next_items_page).
+
+        Cada página trae solo id y nombre, así el costo es proporcional al
+        número de páginas y no al de ítems.
+        """
+        limit = limit or settings.MONDAY_ITEMS_PAGE_LIMIT
+        cursor = None
+        while True:
+            data = self._execute(self._build_items_page_query(board_id, limit, cursor), "items_page")
+            items, cursor = self._parse_items_page(data)
+            if items:
+                yield items
+            if not cursor:
+                break
+
+_clients: Dict[str, MondayClient] = {}
+_client_lock = threading.Lock()
+
+def get_monday_client(company: Optional[Company] = None) -> MondayClient:
+    """Cliente de la empresa (la primera configurada si no se indica), creado en el primer uso"""
+    company = company or get_company()
+    client = _clients.get(company.number)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(company.number)
+            if client is None:
+                client = _clients[company.number] = MondayClient(company_budget(company.number, company.budget_share))
+    return client
@@ -0,0 +1,170 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, Optional
+from config.settings import settings
+from core import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Códigos con los que Monday indica que la llamada fue limitada
+THROTTLE_CODES = {
+    "complexityexception",
+    "complexity_budget_exhausted",
+    "ratelimitexceeded",
+    "rate_limit_exceeded",
+    "maxconcurrencyexceeded",
+    "max_concurrency_exceeded",
+}
+
+COMPLEXITY_FIELD = "complexity { before after reset_in_x_seconds }"
+
+def with_complexity(query: str) -> str:
+    """Agrega el campo complexity a la operación GraphQL para medir el presupuesto"""
+    if "complexity {" in query:
+        return query
+    index = query.index("{") + 1
+    return f"{query[:index]}\n            {COMPLEXITY_FIELD}{query[index:]}"
+
+def throttle_delay(data: Dict[str, Any]) -> Optional[float]:
+    """Segundos a esperar si la respuesta indica límite de uso, None si no fue limitada.
+
+    Retorna 0 cuando Monday limita la llamada sin indicar cuánto esperar.
+    """
+    errors = [error for error in data.get('errors') or [] if isinstance(error, dict)]
+    candidates = [(str(data.get('error_code', '')), str(data.get('error_message', '')), {})]
+    for error in errors:
+        extensions = error.get('extensions') or {}
+        candidates.append((str(extensions.get('code', '')), str(error.get('message', '')), extensions))
+
+    for code, message, extensions in candidates:
+        text = message.lower()
+        if code.lower() not in THROTTLE_CODES and 'complexity budget' not in text and 'rate limit' not in text:
+            continue
+        if extensions.get('retry_in_seconds') is not None:
+            return float(extensions['retry_in_seconds'])
+        match = re.search(r"reset in (\d+) seconds", text)
+        return float(match.group(1)) if match else 0.0
+    return None
+
+class ComplexityBudget:
+    """Presupuesto de complejidad de Monday compartido por todos los clientes.
+
+    Se actualiza con el campo complexity de cada respuesta. Antes de cada
+    llamada estima el costo con el promedio de las anteriores: si el
+    presupuesto restante baja del umbral de frenado reparte las llamadas a lo
+    largo de la ventana de reinicio, y si no alcanza para la reserva espera al
+    reinicio.
+
+    Con share < 1 (varias empresas con la misma cuenta) además lleva la cuenta
+    de lo consumido por sus propias llamadas y espera al reinicio al llegar a
+    su parte del presupuesto.
+    """
+
+    def __init__(self, share: float = 1.0):
+        self._lock = threading.Lock()
+        self.share = share
+        self.budget: Optional[int] = None
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0
+        self.average_cost = 0.0
+        self.used = 0.0  # Consumido en la ventana actual por las llamadas de este presupuesto
+        self.operation_costs: Dict[str, float] = {}  # Costo promedio por llamada de cada operación
+
+    def update(self, data: Dict[str, Any], operation: Optional[str] = None):
+        """Registra el campo complexity de una respuesta de Monday"""
+        complexity = (data.get('data') or {}).get('complexity')
+        if not complexity:
+            return
+        with self._lock:
+            before = complexity.get('before')
+            after = complexity.get('after')
+            if before is not None:
+                self.budget = max(self.budget or 0, before)
+            if before is not None and after is not None:
+                cost = max(before - after, 0)
+                self.average_cost = cost if not self.average_cost else 0.8 * self.average_cost + 0.2 * cost
+                self.used += cost
+                if operation is not None:
+                    previous = self.operation_costs.get(operation)
+                    self.operation_costs[operation] = cost if previous is None else 0.8 * previous + 0.2 * cost
+                metrics.registry.inc("monday_complexity_consumed_total", cost)
+            if after is not None:
+                self.remaining = after
+                metrics.registry.set("monday_complexity_remaining", after)
+            if complexity.get('reset_in_x_seconds') is not None:
+                self.reset_at = time.monotonic() + complexity['reset_in_x_seconds']
+
+    def exhausted(self, reset_in: float):
+        """Marca el presupuesto como agotado hasta el siguiente reinicio"""
+        with self._lock:
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, time.monotonic() + reset_in)
+
+    def reserve(self) -> float:
+        """Calcula la pausa necesaria antes de la siguiente llamada y descuenta su costo estimado"""
+        with self._lock:
+            if self.remaining is None or not self.budget:
+                return 0.0
+
+            now = time.monotonic()
+            reset_in = max(self.reset_at - now, 0.0)
+            if reset_in == 0.0:
+                # La ventana ya se reinició: volver a confiar en el presupuesto completo
+                self.remaining = self.budget
+                self.used = 0.0
+                return 0.0
+
+            expected = self.average_cost
+            reserve = self.budget * settings.MONDAY_COMPLEXITY_RESERVE
+            over_share = self.share < 1.0 and self.used + expected > self.budget * self.share
+            if self.remaining - expected < reserve or over_share:
+                delay = reset_in
+            elif self.remaining < self.budget * settings.MONDAY_COMPLEXITY_SLOWDOWN:
+                calls_left = max((self.remaining - reserve) / max(expected, 1.0), 1.0)
+                delay = reset_in / calls_left
+            else:
+                delay = 0.0
+
+            self.remaining -= expected
+            return delay
+
+    def acquire(self):
+        """Espera (bloqueante) hasta poder realizar la siguiente llamada"""
+        delay = self.reserve()
+        if delay > 0:
+            logger.info(f"Presupuesto de complejidad bajo, pausa de {delay:.2f}s")
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Espera (asíncrona) hasta poder realizar la siguiente llamada"""
+        delay = self.reserve()
+        if delay > 0:
+            logger.info(f"Presupuesto de complejidad bajo, pausa de {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+def backoff_delay(attempt: int, hint: Optional[float] = None) -> float:
+    """Retroceso exponencial con jitter completo; respeta la espera sugerida por Monday"""
+    ceiling = min(settings.MONDAY_RETRY_MAX_DELAY, settings.MONDAY_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    if hint:
+        delay = max(delay, hint + random.uniform(0, settings.MONDAY_RETRY_BASE_DELAY))
+    return delay
+
+# Presupuesto compartido entre el cliente síncrono y el asíncrono
+complexity_budget = ComplexityBudget()
+
+_company_budgets: Dict[str, ComplexityBudget] = {}
+_budgets_lock = threading.Lock()
+
+def company_budget(company: str, share: float) -> ComplexityBudget:
+    """Presupuesto de una empresa; con una sola empresa es el presupuesto compartido"""
+    if share >= 1.0:
+        return complexity_budget
+    with _budgets_lock:
+        if company not in _company_budgets:
+            _company_budgets[company] = ComplexityBudget(share)
+        return _company_budgets[company]
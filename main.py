@@ -1,35 +1,250 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from services.sql_service import SQLService
 from services.sync_service import SyncService
-from models.schemas import Factura, MondayItem     
-from core.database import get_db
+from services.reconcile_service import ReconcileService
+from services.plan_service import PlanService
+from services.scheduler_service import scheduler
+from models.schemas import Factura, MondayItem
+from services.job_service import job_manager, SyncJob
+from core.database import SessionLocal, warm_up, dispose_engine
+from core.monday_async_client import close_async_monday_client
+from core import metrics
 from config.settings import settings
+from config.companies import Company, get_companies, get_company
 import logging
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(
-    title=settings.API_TITLE,
-    version=settings.API_VERSION
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La configuración se valida aquí y no al importar el módulo
+    app.title = settings.API_TITLE
+    app.version = settings.API_VERSION
+    app.description = settings.API_DESCRIPTION
 
-@app.post("/sync-recent-invoicesfmh")
-async def sync_recent_invoices(db: Session = Depends(get_db)):
-    """Endpoint para sincronizar facturas recientes con Monday.com y actualizar SQL"""
+    for company in get_companies():
+        # Crear el engine de la empresa y abrir conexiones antes de atender peticiones
+        try:
+            await run_in_threadpool(warm_up, None, company.number)
+        except Exception as e:
+            logger.error(f"No se pudo precalentar el pool de SQL Server de la empresa {company.number}: {str(e)}")
+
+        # Asegurar columnas de cambios e índice de pendientes
+        try:
+            db = await run_in_threadpool(SessionLocal, company.number)
+            try:
+                await run_in_threadpool(SQLService(db, company).ensure_schema)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"No se pudo asegurar el esquema de {company.sql_table}: {str(e)}")
+
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start(run_sync_job)
+    yield
+    await scheduler.stop()
+    # Cerrar el pool HTTP hacia Monday y las conexiones de SQL Server al apagar
+    await close_async_monday_client()
+    await run_in_threadpool(dispose_engine)
+
+app = FastAPI(lifespan=lifespan)
+
+async def gather_companies(coroutines):
+    """Ejecuta en paralelo el trabajo de cada empresa; si alguna falla, espera a las demás y relanza el error"""
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+def resolve_companies(company: Optional[str]) -> List[Company]:
+    """Empresa indicada o todas; 404 si no está configurada"""
+    try:
+        return [get_company(company)] if company else get_companies()
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def count_pending(company: Company) -> int:
+    """Documentos pendientes de crear o actualizar de una empresa (consultas fuera del event loop)"""
+    db = SessionLocal(company.number)
+    try:
+        sql_service = SQLService(db, company)
+        total = await run_in_threadpool(sql_service.count_recent_invoices)
+        return total + await run_in_threadpool(sql_service.count_changed_invoices)
+    finally:
+        db.close()
+
+async def sync_company(job: SyncJob, company: Company):
+    """Ejecuta la sincronización de una empresa con su propia sesión de base de datos"""
+    db = SessionLocal(company.number)
     try:
-        # Obtener facturas recientes
-        sql_service = SQLService(db)
-        invoices = sql_service.get_recent_invoices()
-
-        # Sincronizar con Monday.com y actualizar SQL
-        sync_service = SyncService()
-        result = sync_service.sync_invoices(invoices, db)  # Pasamos la sesión de DB
-
-        return {
-            "status": "success",
-            **result
-        }
-    except Exception as e:
+        # Sincronizar con Monday.com y actualizar SQL página por página
+        sql_service = SQLService(db, company)
+        sync_service = SyncService(company=company)
+        pages = sql_service.iter_recent_invoices()
+        await sync_service.sync_invoice_pages_async(pages, db, progress=job.record)
+
+        # Actualizar en su lugar los ítems de documentos modificados en Firebird
+        changed_pages = sql_service.iter_changed_invoices()
+        await sync_service.update_changed_pages_async(changed_pages, db, progress=job.record)
+    except Exception:
         db.rollback()  # Asegurar que no quedan transacciones pendientes
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise
+    finally:
+        db.close()
+
+async def run_sync_job(job: SyncJob):
+    """Sincroniza todas las empresas en paralelo, cada una con su pool de SQL Server y su parte del presupuesto de Monday"""
+    companies = get_companies()
+    totals = await gather_companies(count_pending(company) for company in companies)
+    job.start(total=sum(totals))
+    await gather_companies(sync_company(job, company) for company in companies)
+
+async def plan_company(company: Company) -> dict:
+    """Plan de sincronización de una empresa con su propia sesión de base de datos"""
+    db = SessionLocal(company.number)
+    try:
+        return await run_in_threadpool(PlanService(company=company).plan, db)
+    finally:
+        db.close()
+
+@app.post("/sync-recent-invoicesfmh", status_code=202)
+async def sync_recent_invoices(
+    response: Response,
+    dry_run: bool = Query(False, description="Solo calcular el plan (filas, grupos, llamadas, complejidad y tiempo) sin escribir")
+):
+    """Encola la sincronización de facturas recientes y retorna el ID del trabajo.
+
+    Si ya hay un trabajo en curso se retorna ese mismo trabajo en lugar de
+    iniciar otro. Con dry_run=true retorna el plan de cada empresa sin
+    crear el trabajo.
+    """
+    if dry_run:
+        companies = get_companies()
+        plans = await gather_companies(plan_company(company) for company in companies)
+        response.status_code = 200
+        return {"status": "dry_run", "companies": {plan["company"]: plan for plan in plans}}
+
+    job, created = job_manager.try_start()
+    if created:
+        job_manager.launch(job, run_sync_job)
+    else:
+        logger.info(f"Sincronización en curso, se reutiliza el trabajo {job.id}")
+
+    return {
+        "status": "accepted" if created else "already_running",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
+
+async def reconcile_company(company: Company, fix: bool) -> dict:
+    """Reconcilia el tablero de una empresa con su SQLFACTFnn con su propia sesión de base de datos"""
+    db = SessionLocal(company.number)
+    try:
+        return await run_in_threadpool(ReconcileService(company=company).reconcile, db, fix)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_reconcile_job(job: SyncJob, fix: bool, companies: list):
+    job.start(total=0)
+    reports = await gather_companies(reconcile_company(company, fix) for company in companies)
+    job.result = {"companies": {report["company"]: report for report in reports}}
+
+@app.post("/reconcile", status_code=202)
+async def reconcile_board(
+    fix: bool = Query(False, description="Corregir las diferencias además de reportarlas"),
+    company: Optional[str] = Query(None, description="Número de empresa (todas si se omite)")
+):
+    """Encola la reconciliación de los tableros contra SINCRONIZADO; el reporte queda en /jobs/{job_id}"""
+    companies = resolve_companies(company)
+    if fix:
+        # Con tableros compartidos se corregirían ítems de otra empresa
+        try:
+            for item in companies:
+                ReconcileService(company=item).check_fix()
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    job, created = job_manager.try_start(kind="reconcile")
+    if created:
+        job_manager.launch(job, lambda job: run_reconcile_job(job, fix, companies))
+    else:
+        logger.info(f"Trabajo en curso ({job.kind}), se reutiliza el trabajo {job.id}")
+
+    return {
+        "status": "accepted" if created else "already_running",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
+
+async def with_sql_service(company: Company, action):
+    """Ejecuta action(sql_service) fuera del event loop con una sesión de la empresa"""
+    db = SessionLocal(company.number)
+    try:
+        return await run_in_threadpool(action, SQLService(db, company))
+    finally:
+        db.close()
+
+@app.get("/failures")
+async def list_failures(
+    company: Optional[str] = Query(None, description="Número de empresa (todas si se omite)"),
+    status: str = Query("quarantined", pattern="^(quarantined|waiting|all)$",
+                        description="En cuarentena, en espera de reintento o todos"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Documentos rechazados por Monday con sus intentos, último error y siguiente reintento"""
+    companies = resolve_companies(company)
+    quarantined = {"quarantined": True, "waiting": False, "all": None}[status]
+    reports = await gather_companies(
+        with_sql_service(item, lambda sql_service: sql_service.list_failures(quarantined, offset, limit))
+        for item in companies
+    )
+    return {"companies": {item.number: report for item, report in zip(companies, reports)}}
+
+@app.post("/failures/requeue")
+async def requeue_failures(
+    company: Optional[str] = Query(None, description="Número de empresa (todas si se omite)"),
+    cve_doc: Optional[List[str]] = Query(None, description="Documentos a reencolar (todos los de cuarentena si se omite)")
+):
+    """Reencola documentos fallidos: vuelven a sincronizarse desde cero en la siguiente ejecución"""
+    companies = resolve_companies(company)
+    counts = await gather_companies(
+        with_sql_service(item, lambda sql_service: sql_service.requeue_failures(cve_doc))
+        for item in companies
+    )
+    return {"requeued": {item.number: count for item, count in zip(companies, counts)}}
+
+@app.get("/scheduler")
+async def get_scheduler():
+    """Estado del programador: intervalo actual, siguiente ciclo y resultado del último"""
+    return scheduler.to_dict()
+
+@app.post("/scheduler/trigger", status_code=202)
+async def trigger_scheduler():
+    """Pide un ciclo de transferencia y sincronización; los disparos seguidos se agrupan en uno"""
+    if not scheduler.started:
+        raise HTTPException(status_code=409, detail="El programador no está activo (SCHEDULER_ENABLED)")
+    queued = scheduler.trigger()
+    return {"status": "queued" if queued else "coalesced", "scheduler": scheduler.to_dict()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """Avance de un trabajo: contadores, velocidad y errores paginados"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    return job.to_dict(offset=offset, limit=limit)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus, incluida la última transferencia de Firebird"""
+    return metrics.registry.render() + metrics.render_transfer_snapshot()
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, String, String, String, DateTime, DateTime, String, Float, Float, Float, String, Boolean
+import threading
+from typing import Dict
+from sqlalchemy import Column, String, DateTime, Float, Boolean, Integer, Index, text
 from core.database import Base
 
-class SQLFACTF03(Base):
-    __tablename__ = "SQLFACTF03"
-    
+class InvoiceColumns:
+    """Columnas de SQLFACTFnn, comunes a todas las empresas"""
     CVE_DOC = Column(String, primary_key=True)
     NOMBRE = Column(String)
     CVE_PEDI = Column(String)
@@ -14,4 +15,51 @@ class SQLFACTF03(Base):
     IMPORTE = Column(Float)
     IMPORTEME = Column(Float)
     VENDEDOR = Column(String)
-    SINCRONIZADO = Column(Boolean, default=False, nullable=False)
\ No newline at end of file
+    SINCRONIZADO = Column(Boolean, default=False, nullable=False)
+    # Hash del contenido en Firebird y bandera de cambios pendientes de enviar a Monday
+    HASH_CONTENIDO = Column(String(64))
+    ACTUALIZAR = Column(Boolean, default=False, nullable=False)
+
+class FailureColumns:
+    """Documentos que Monday rechazó: intentos, último error y cuándo se pueden reintentar"""
+    CVE_DOC = Column(String(50), primary_key=True)
+    INTENTOS = Column(Integer, nullable=False, default=0)
+    TIPO_ERROR = Column(String(100))
+    ULTIMO_ERROR = Column(String(1000))
+    PROXIMO_INTENTO = Column(DateTime, nullable=False)
+    CUARENTENA = Column(Boolean, default=False, nullable=False)
+    ACTUALIZADO = Column(DateTime, nullable=False)
+
+_models: Dict[str, type] = {}
+_failure_models: Dict[str, type] = {}
+_lock = threading.Lock()
+
+def invoice_model(company: str = "03") -> type:
+    """Modelo de la tabla SQLFACTFnn de la empresa (uno por empresa, creado en el primer uso)"""
+    with _lock:
+        if company not in _models:
+            table = f"SQLFACTF{company}"
+            _models[company] = type(table, (InvoiceColumns, Base), {
+                "__tablename__": table,
+                # Índice filtrado sobre los pendientes: la búsqueda de trabajo no crece con el histórico
+                "__table_args__": (
+                    Index(
+                        f"IX_{table}_PENDIENTES", "FECHA_DOC", "CVE_DOC",
+                        mssql_where=text("SINCRONIZADO = 0"),
+                        mssql_include=["NOMBRE", "CVE_PEDI", "FECHA_VEN", "MONEDA", "TIPCAMB", "IMPORTE", "IMPORTEME", "VENDEDOR"]
+                    ),
+                ),
+            })
+        return _models[company]
+
+SQLFACTF03 = invoice_model("03")
+
+def failure_model(company: str = "03") -> type:
+    """Modelo de la tabla SQLFACTFnn_FALLIDOS de la empresa"""
+    with _lock:
+        if company not in _failure_models:
+            table = f"SQLFACTF{company}_FALLIDOS"
+            _failure_models[company] = type(table, (FailureColumns, Base), {"__tablename__": table})
+        return _failure_models[company]
+
+SQLFACTF03_FALLIDOS = failure_model("03")
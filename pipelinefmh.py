@@ -0,0 +1,347 @@
+"""Modo pipeline: Firebird → SQL Server → Monday.com en un solo proceso.
+
+Alternativa a ejecutar transferfmh.py y luego sync_scriptfmh.py por separado.
+Cada pocos segundos lee de Firebird desde la marca de agua y encadena las
+etapas con colas acotadas, así una etapa lenta frena a las anteriores en
+lugar de acumular lotes en memoria. Cada PIPELINE_VENTANA_COMPLETA_SEGUNDOS
+un ciclo lee la ventana completa de DIAS_A_TRANSFERIR para recalcular el
+hash de los documentos editados antes de la marca de agua:
+
+    extracción (Firebird) → carga (staging + MERGE) → Monday (N trabajadores)
+
+Cada trabajador de Monday confirma en SQL (SINCRONIZADO / ACTUALIZAR) y en el
+registro local justo después de cada lote de mutaciones, como la API.
+
+Con varias empresas en COMPANIES cada una corre su propio ciclo en un hilo,
+con sus conexiones, su tablero y su parte del presupuesto de complejidad.
+
+No debe correr al mismo tiempo que la sincronización programada de la API:
+ambos tomarían los mismos pendientes.
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import fdb
+import pyodbc
+from sqlalchemy.exc import SQLAlchemyError
+from settingsfb import load_configurations, ConfigError
+from transferfmh import (
+    FIN_LOTES, Empresa, asegurar_tabla_destino, asegurar_tablas_control, cargar_lote, crear_staging,
+    extraer_lotes, leer_marca_agua, medir, verificar_companies
+)
+from config.companies import get_companies
+from core.database import SessionLocal
+from core.metrics import StageTimes, track_stages, write_transfer_snapshot
+from core.monday_client import MondayClient
+from core.rate_limiter import company_budget
+from services.sql_service import SQLService
+from services.sync_service import SyncService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Segundos entre lecturas de Firebird
+INTERVALO = float(os.getenv("PIPELINE_INTERVALO", 5))
+# Registros por lote: lotes chicos llegan antes a Monday
+TAMANO_LOTE = int(os.getenv("PIPELINE_TAMANO_LOTE", 500))
+# Lotes en memoria entre cada par de etapas
+LOTES_EN_COLA = int(os.getenv("LOTES_EN_COLA", 4))
+# Trabajadores que envían lotes a Monday en paralelo, cada uno con su cliente y sesión
+TRABAJADORES_MONDAY = int(os.getenv("PIPELINE_TRABAJADORES_MONDAY", 2))
+# Días que se vuelven a leer antes de la marca de agua
+DIAS_SOLAPE = int(os.getenv("PIPELINE_DIAS_SOLAPE", 0))
+# Días a leer si aún no hay marca de agua
+DIAS_A_TRANSFERIR = int(os.getenv("DIAS_A_TRANSFERIR", 180))
+# Segundos entre barridos de pendientes fuera de la ventana (p. ej. lotes que fallaron en Monday)
+BARRIDO = float(os.getenv("PIPELINE_BARRIDO_SEGUNDOS", 900))
+# Segundos entre ciclos que leen toda la ventana de DIAS_A_TRANSFERIR (0 = nunca)
+VENTANA_COMPLETA = float(os.getenv("PIPELINE_VENTANA_COMPLETA_SEGUNDOS", 86400))
+
+class Totales:
+    """Contadores de un ciclo, compartidos entre etapas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores = {
+            "extraidos": 0, "insertados": 0, "actualizados": 0, "lotes_fallidos": 0,
+            "creados": 0, "actualizados_monday": 0, "fallidos_monday": 0,
+        }
+
+    def sumar(self, **valores):
+        with self._lock:
+            for nombre, valor in valores.items():
+                self.valores[nombre] += valor
+
+    def __getitem__(self, nombre):
+        return self.valores[nombre]
+
+def etapa_carga(sql_conn, sql_cursor, cola_extraccion, cola_monday, totales, etapas, empresa, company):
+    """Carga cada lote extraído y envía a Monday sus documentos pendientes o modificados.
+
+    Si un lote falla la marca de agua deja de avanzar, para que el siguiente
+    ciclo lo vuelva a leer.
+    """
+    db = SessionLocal(company.number)
+    sql_service = SQLService(db, company)
+    avanzar_marca = True
+    try:
+        while True:
+            with medir(etapas, "espera_firebird"):
+                lote = cola_extraccion.get()
+            if lote is FIN_LOTES:
+                break
+            if isinstance(lote, Exception):
+                print(f"❌ Error al consultar Firebird: {str(lote)}")
+                totales.sumar(lotes_fallidos=1)
+                avanzar_marca = False
+                continue
+
+            try:
+                insertados, actualizados = cargar_lote(sql_conn, sql_cursor, lote, avanzar_marca, etapas, empresa)
+            except pyodbc.Error as e:
+                print(f"❌ Error al cargar lote de {len(lote)} registros: {str(e)}")
+                sql_conn.rollback()
+                totales.sumar(lotes_fallidos=1)
+                avanzar_marca = False
+                continue
+            totales.sumar(extraidos=len(lote), insertados=insertados, actualizados=actualizados)
+
+            # Incluye pendientes anteriores del mismo rango (p. ej. fallas de Monday en el ciclo previo)
+            try:
+                pendientes, modificados = sql_service.get_pending_by_cve([row[0] for row in lote])
+            except SQLAlchemyError as e:
+                # El lote ya está en SQL como pendiente: lo envía el barrido
+                print(f"❌ Error al leer los pendientes de un lote de {len(lote)} registros: {str(e)}")
+                db.rollback()
+                totales.sumar(lotes_fallidos=1)
+                avanzar_marca = False
+                continue
+            if pendientes or modificados:
+                with medir(etapas, "espera_monday"):
+                    cola_monday.put((pendientes, modificados))
+    finally:
+        db.close()
+
+def etapa_monday(servicio, cola_monday, totales, etapas):
+    """Trabajador: crea o actualiza los ítems en Monday y confirma cada lote en SQL"""
+    db = SessionLocal(servicio.company.number)
+    try:
+        with track_stages(etapas):
+            while True:
+                trabajo = cola_monday.get()
+                if trabajo is FIN_LOTES:
+                    break
+                pendientes, modificados = trabajo
+                try:
+                    if pendientes:
+                        resultado = servicio.sync_invoices(pendientes, db)
+                        totales.sumar(creados=resultado["synced_items"], fallidos_monday=resultado["failed_items"])
+                    if modificados:
+                        resultado = servicio.update_changed_invoices(modificados, db)
+                        totales.sumar(actualizados_monday=resultado["synced_items"],
+                                      fallidos_monday=resultado["failed_items"])
+                except Exception as e:
+                    # El lote queda pendiente en SQL y se reintenta en el barrido
+                    logger.error(f"Error al enviar lote a Monday: {str(e)}")
+                    db.rollback()
+                    totales.sumar(fallidos_monday=len(pendientes) + len(modificados))
+    finally:
+        db.close()
+
+def ejecutar_ciclo(firebird_cursor, sql_conn, sql_cursor, servicios, fecha_inicio, fecha_fin, empresa):
+    """Un ciclo del pipeline sobre el rango de fechas; retorna (totales, etapas)"""
+    cola_extraccion = queue.Queue(maxsize=LOTES_EN_COLA)
+    cola_monday = queue.Queue(maxsize=LOTES_EN_COLA)
+    totales = Totales()
+    etapas = StageTimes()
+
+    productor = threading.Thread(
+        target=extraer_lotes,
+        args=(firebird_cursor, fecha_inicio, fecha_fin, TAMANO_LOTE, cola_extraccion, etapas, empresa),
+        daemon=True
+    )
+    trabajadores = [
+        threading.Thread(target=etapa_monday, args=(servicio, cola_monday, totales, etapas), daemon=True)
+        for servicio in servicios
+    ]
+    productor.start()
+    for trabajador in trabajadores:
+        trabajador.start()
+
+    try:
+        etapa_carga(
+            sql_conn, sql_cursor, cola_extraccion, cola_monday, totales, etapas, empresa, servicios[0].company
+        )
+    finally:
+        # Liberar al productor si la carga se interrumpió con la cola llena
+        while productor.is_alive():
+            try:
+                cola_extraccion.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for _ in trabajadores:
+            cola_monday.put(FIN_LOTES)
+        for trabajador in trabajadores:
+            trabajador.join()
+    return totales, etapas
+
+def barrer_pendientes(servicio):
+    """Envía a Monday todos los pendientes y modificados de SQL, como la sincronización de la API"""
+    db = SessionLocal(servicio.company.number)
+    try:
+        sql_service = SQLService(db, servicio.company)
+        creados = servicio.sync_invoice_pages(sql_service.iter_recent_invoices(), db)
+        actualizados = servicio.update_changed_pages(sql_service.iter_changed_invoices(), db)
+        print(
+            f"Empresa {servicio.company.number}, barrido: {creados['synced_items']} creados, {actualizados['synced_items']} actualizados, "
+            f"{creados['failed_items'] + actualizados['failed_items']} fallidos"
+        )
+    except Exception as e:
+        logger.error(f"Error en el barrido de pendientes: {str(e)}")
+    finally:
+        db.close()
+
+def reportar_ciclo(totales, etapas, segundos, empresa):
+    print(
+        f"Empresa {empresa.numero}, ciclo en {segundos:.1f}s: {totales['extraidos']} leídos, {totales['insertados']} nuevos, "
+        f"{totales['actualizados']} con cambios → Monday: {totales['creados']} creados, "
+        f"{totales['actualizados_monday']} actualizados, {totales['fallidos_monday']} fallidos"
+    )
+    if totales["lotes_fallidos"]:
+        print(f"❌ Lotes con error: {totales['lotes_fallidos']} (se reintentarán en el siguiente ciclo)")
+    for nombre, datos in etapas.to_dict().items():
+        print(f"  {nombre}: {datos['seconds']}s en {datos['calls']} llamadas")
+    write_transfer_snapshot(
+        rows={
+            "extraidos": totales["extraidos"],
+            "cargados": etapas.rows.get("sql_staging", 0),
+            "insertados": totales["insertados"],
+            "actualizados": totales["actualizados"],
+            "monday_creados": totales["creados"],
+            "monday_actualizados": totales["actualizados_monday"],
+        },
+        stages=etapas,
+        failed_batches=totales["lotes_fallidos"],
+        company=empresa.numero
+    )
+
+def ejecutar_empresa(configs, company, una_vez=False):
+    """Ciclo del pipeline de una empresa; retorna el código de salida"""
+    empresa = Empresa(company.number)
+    try:
+        firebird_conn = fdb.connect(**configs['firebird'].get_connection_params(company.number))
+        firebird_cursor = firebird_conn.cursor()
+    except fdb.fbcore.DatabaseError as e:
+        print(f"❌ Error de conexión a Firebird (empresa {company.number}): {str(e)}")
+        return 1
+
+    sql_config = configs['sqlserver'].get_connection_params()
+    try:
+        sql_conn = pyodbc.connect(sql_config['connection_string'], timeout=sql_config.get('timeout', 30))
+        sql_cursor = sql_conn.cursor()
+        asegurar_tabla_destino(sql_cursor, empresa)
+        asegurar_tablas_control(sql_cursor)
+        crear_staging(sql_cursor, empresa)
+        sql_conn.commit()
+    except pyodbc.Error as e:
+        error_msg = str(e).replace(sql_config['connection_string'], '*****')
+        print(f"❌ Error de conexión a SQL Server: {error_msg}")
+        firebird_conn.close()
+        return 1
+
+    # Un cliente de Monday por trabajador: requests.Session no se comparte entre hilos.
+    # Todos comparten la parte del presupuesto de complejidad de la empresa
+    presupuesto = company_budget(company.number, company.budget_share)
+    servicios = [
+        SyncService(client=MondayClient(budget=presupuesto), company=company)
+        for _ in range(max(TRABAJADORES_MONDAY, 1))
+    ]
+    print(
+        f"Pipeline de la empresa {company.number} iniciado: cada {INTERVALO}s, lotes de {TAMANO_LOTE}, "
+        f"{len(servicios)} trabajadores de Monday"
+    )
+
+    ultimo_barrido = None
+    ultima_ventana = None
+    try:
+        while True:
+            inicio = time.monotonic()
+            fecha_actual = datetime.now().date()
+            try:
+                marca_agua = leer_marca_agua(sql_cursor, empresa)
+                sql_conn.commit()
+            except pyodbc.Error as e:
+                print(f"❌ Error al leer la marca de agua: {str(e)}")
+                marca_agua = None
+            if isinstance(marca_agua, str):
+                marca_agua = datetime.strptime(marca_agua, "%Y-%m-%d").date()
+            fecha_inicio = (marca_agua - timedelta(days=DIAS_SOLAPE)) if marca_agua else fecha_actual - timedelta(days=DIAS_A_TRANSFERIR)
+            # Los documentos editados antes de la marca de agua solo se ven leyendo la ventana completa
+            if VENTANA_COMPLETA > 0 and (ultima_ventana is None or time.monotonic() - ultima_ventana >= VENTANA_COMPLETA):
+                fecha_inicio = fecha_actual - timedelta(days=DIAS_A_TRANSFERIR)
+                ultima_ventana = time.monotonic()
+
+            totales, etapas = ejecutar_ciclo(
+                firebird_cursor, sql_conn, sql_cursor, servicios, fecha_inicio, fecha_actual, empresa
+            )
+            # Cerrar la transacción de lectura para ver en el siguiente ciclo lo capturado mientras tanto
+            firebird_conn.commit()
+
+            if totales["insertados"] or totales["actualizados"] or totales["fallidos_monday"] or totales["lotes_fallidos"]:
+                reportar_ciclo(totales, etapas, time.monotonic() - inicio, empresa)
+
+            if ultimo_barrido is None or time.monotonic() - ultimo_barrido >= BARRIDO:
+                barrer_pendientes(servicios[0])
+                ultimo_barrido = time.monotonic()
+
+            if una_vez:
+                return 1 if totales["lotes_fallidos"] or totales["fallidos_monday"] else 0
+            time.sleep(max(INTERVALO - (time.monotonic() - inicio), 0))
+    finally:
+        sql_conn.close()
+        firebird_conn.close()
+
+def ejecutar_pipeline(una_vez=False):
+    try:
+        # COMPANIES se lee de .env antes de cargar .env.db, igual que en la API
+        empresas = get_companies()
+        configs = load_configurations()
+        verificar_companies([company.number for company in empresas])
+    except (ConfigError, ValueError) as e:
+        print(f"❌ Error de configuración: {str(e)}")
+        return 1
+
+    if len(empresas) == 1:
+        try:
+            return ejecutar_empresa(configs, empresas[0], una_vez)
+        except KeyboardInterrupt:
+            print("\nPipeline detenido")
+            return 0
+
+    # Hilos daemon: Ctrl+C en el hilo principal termina el proceso
+    codigos = {}
+    hilos = [
+        threading.Thread(
+            target=lambda company=company: codigos.__setitem__(company.number, ejecutar_empresa(configs, company, una_vez)),
+            name=f"pipeline-{company.number}",
+            daemon=True
+        )
+        for company in empresas
+    ]
+    for hilo in hilos:
+        hilo.start()
+    try:
+        for hilo in hilos:
+            while hilo.is_alive():
+                hilo.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\nPipeline detenido")
+        return 0
+    return 1 if any(codigos.get(company.number, 1) for company in empresas) else 0
+
+if __name__ == "__main__":
+    sys.exit(ejecutar_pipeline(una_vez="--una-vez" in sys.argv))
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+from core.metrics import StageTimes, track_stages
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 50  # Trabajos que se conservan en memoria para consulta
+
+class SyncJob:
+    """Estado y contadores de avance de una sincronización en segundo plano"""
+
+    def __init__(self, kind: str = "sync"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind  # "sync" o "reconcile"
+        self.status = "queued"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.total = 0
+        self.synced = 0
+        self.failed = 0
+        self.failures: List[dict] = []
+        self.error: Optional[str] = None
+        self.result: Optional[dict] = None  # Reporte final (reconciliación)
+        self.stages = StageTimes()  # Tiempo por etapa: sql_read, monday, ledger, sql_write
+        self._started = None
+
+    def start(self, total: int):
+        self.status = "running"
+        self.total = total
+        self.started_at = datetime.now()
+        self._started = time.monotonic()
+
+    def record(self, results: List[dict]):
+        """Acumula el resultado de un lote; solo se guarda el detalle de los fallidos"""
+        for result in results:
+            if result["status"] == "success":
+                self.synced += 1
+            else:
+                self.failed += 1
+                self.failures.append(result)
+
+    def finish(self, error: Optional[str] = None):
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = datetime.now()
+
+    def to_dict(self, offset: int = 0, limit: int = 100) -> dict:
+        processed = self.synced + self.failed
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        if self.finished_at and self.started_at:
+            elapsed = (self.finished_at - self.started_at).total_seconds()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "total": self.total,
+            "processed": processed,
+            "synced_items": self.synced,
+            "failed_items": self.failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "items_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+            "error": self.error,
+            "stages": self.stages.to_dict(),
+            "result": self.result,
+            "failures": {
+                "total": len(self.failures),
+                "offset": offset,
+                "limit": limit,
+                "items": self.failures[offset:offset + limit]
+            }
+        }
+
+class JobManager:
+    """Registro de trabajos de sincronización con un candado de proceso.
+
+    Solo puede haber un trabajo activo a la vez, para que ejecuciones
+    programadas que se traslapen no sincronicen dos veces las mismas facturas
+    ni una reconciliación corrija el tablero mientras se crean ítems.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._active: Optional[SyncJob] = None
+        self._tasks = set()  # Referencias a las tareas para que no se recolecten antes de terminar
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    def try_start(self, kind: str = "sync") -> Tuple[SyncJob, bool]:
+        """Crea un trabajo nuevo o retorna el activo (de cualquier tipo); el bool indica si se creó"""
+        with self._lock:
+            if self._active is not None and self._active.status in ("queued", "running"):
+                return self._active, False
+            job = SyncJob(kind)
+            self._active = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+            return job, True
+
+    def launch(self, job: SyncJob, runner) -> asyncio.Task:
+        """Ejecuta runner(job) como tarea del event loop y registra su resultado"""
+        async def run():
+            try:
+                with track_stages(job.stages):
+                    await runner(job)
+                job.finish()
+            except Exception as e:
+                logger.error(f"Error en el trabajo de sincronización {job.id}: {str(e)}")
+                job.finish(str(e))
+            stages = ", ".join(f"{name} {data['seconds']}s" for name, data in job.stages.to_dict().items())
+            logger.info(f"Trabajo {job.id} terminado: {job.synced} sincronizados, {job.failed} fallidos ({stages or 'sin etapas'})")
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+# Instancia singleton del administrador de trabajos
+job_manager = JobManager()
@@ -0,0 +1,139 @@
+import math
+from collections import Counter
+from typing import Optional
+from sqlalchemy.orm import Session
+from services.sql_service import SQLService
+from services.sync_service import SyncService
+from core.monday_client import BaseMondayClient, MondayClient
+from core import metrics
+from config.settings import settings
+from config.companies import Company
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ventana en la que Monday repone el presupuesto de complejidad
+BUDGET_WINDOW_SECONDS = 60.0
+
+class PlanService:
+    """Plan de la sincronización de una empresa sin escribir nada.
+
+    Cuenta lo que se crearía o actualizaría en Monday, los grupos mensuales
+    que faltan en el tablero, las llamadas necesarias con el tamaño de lote
+    configurado y estima la complejidad y el tiempo con lo medido en las
+    llamadas anteriores del proceso (o con los valores de configuración si
+    aún no hay mediciones).
+    """
+
+    def __init__(self, client: Optional[MondayClient] = None, company: Optional[Company] = None):
+        self.sync_service = SyncService(client=client, company=company)
+
+    @property
+    def company(self) -> Company:
+        return self.sync_service.company
+
+    def _pending(self, sql_service: SQLService) -> dict:
+        """Documentos por crear (sin los que el registro local ya tiene en Monday) y sus meses"""
+        months: Counter = Counter()
+        to_create = known = 0
+        for page in sql_service.iter_recent_invoices():
+            with metrics.stage("ledger"):
+                found = self.sync_service.ledger.lookup(invoice.CVE_DOC for invoice in page)
+            known += len(found)
+            for invoice in page:
+                if invoice.CVE_DOC not in found:
+                    to_create += 1
+                    months[BaseMondayClient.group_name_for_date(invoice.FECHA_DOC)] += 1
+        return {"to_create": to_create, "already_in_monday": known, "months": months}
+
+    def _changed(self, sql_service: SQLService) -> dict:
+        """Documentos modificados que cambiarían columnas en Monday, los que ya coinciden y los que no tienen ítem"""
+        to_update = unchanged = missing = 0
+        for page in sql_service.iter_changed_invoices():
+            results: list = []
+            updates, same = self.sync_service._plan_updates(page, results)
+            to_update += len(updates)
+            unchanged += len(same)
+            missing += len(results)
+        return {"to_update": to_update, "unchanged": unchanged, "without_item": missing}
+
+    def _call_estimate(self, operation: str, calls: int, mutations_per_call: int) -> dict:
+        """Complejidad y latencia por llamada: medidas en este proceso o las de configuración"""
+        budget = self.sync_service.client.budget
+        cost = budget.operation_costs.get(operation)
+        latency = metrics.registry.mean("monday_request_seconds", operation=operation)
+        return {
+            "calls": calls,
+            "complexity_per_call": round(cost if cost is not None else settings.MONDAY_PLAN_MUTATION_COMPLEXITY * mutations_per_call),
+            "seconds_per_call": round(latency if latency is not None else settings.MONDAY_PLAN_CALL_SECONDS, 3),
+            "source": "measured" if cost is not None and latency is not None
+            else "partial" if cost is not None or latency is not None else "configured",
+        }
+
+    def plan(self, db: Session) -> dict:
+        """Plan completo de la siguiente sincronización de la empresa"""
+        sql_service = SQLService(db, self.company)
+        batch_size = settings.MONDAY_BATCH_SIZE
+
+        pending = self._pending(sql_service)
+        changed = self._changed(sql_service)
+
+        # La consulta de grupos también informa el presupuesto de la cuenta (campo complexity)
+        existing = self.sync_service.client.get_board_groups(self.company.board_id)
+        new_groups = sorted(name for name in pending["months"] if name not in existing)
+
+        operations = {
+            "get_board_groups": self._call_estimate("get_board_groups", 1, 1),
+            "create_group": self._call_estimate("create_group", len(new_groups), 1),
+            "create_items": self._call_estimate(
+                "create_items", math.ceil(pending["to_create"] / batch_size), min(batch_size, pending["to_create"]) or 1
+            ),
+            "change_column_values": self._call_estimate(
+                "change_column_values", math.ceil(changed["to_update"] / batch_size), min(batch_size, changed["to_update"]) or 1
+            ),
+        }
+        complexity = sum(op["calls"] * op["complexity_per_call"] for op in operations.values())
+
+        # Los lotes viajan en paralelo con la concurrencia del cliente asíncrono; los grupos, uno por uno
+        concurrency = max(round(settings.MONDAY_MAX_CONCURRENCY * self.company.budget_share), 1)
+        request_seconds = sum(
+            op["calls"] * op["seconds_per_call"] / (concurrency if name in ("create_items", "change_column_values") else 1)
+            for name, op in operations.items()
+        )
+        # Con presupuesto conocido, cada ventana solo admite la parte utilizable de la empresa
+        budget = self.sync_service.client.budget.budget
+        budget_seconds = None
+        if budget:
+            usable = budget * self.company.budget_share * (1 - settings.MONDAY_COMPLEXITY_RESERVE)
+            budget_seconds = max(complexity / usable - 1, 0) * BUDGET_WINDOW_SECONDS
+
+        report = {
+            "company": self.company.number,
+            "board_id": self.company.board_id,
+            "dry_run": True,
+            "rows": {
+                "new": pending["to_create"],
+                "new_already_in_monday": pending["already_in_monday"],
+                "changed": changed["to_update"],
+                "changed_unchanged_in_monday": changed["unchanged"],
+                "changed_without_item": changed["without_item"],
+            },
+            "groups": {
+                "months": dict(sorted(pending["months"].items())),
+                "to_create": new_groups,
+            },
+            "batch_size": batch_size,
+            "operations": operations,
+            "mutations": pending["to_create"] + changed["to_update"] + len(new_groups),
+            "estimated_complexity": complexity,
+            "complexity_budget": budget,
+            "estimated_seconds": round(max(request_seconds, budget_seconds or 0.0), 1),
+            "estimated_request_seconds": round(request_seconds, 1),
+            "estimated_budget_seconds": round(budget_seconds, 1) if budget_seconds is not None else None,
+        }
+        logger.info(
+            f"Plan de la empresa {self.company.number}: {report['rows']['new']} por crear, "
+            f"{report['rows']['changed']} por actualizar, {len(new_groups)} grupos nuevos, "
+            f"~{complexity} de complejidad, ~{report['estimated_seconds']}s"
+        )
+        return report
@@ -0,0 +1,154 @@
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from services.sql_service import SQLService
+from core.monday_client import MondayClient, get_monday_client
+from core.ledger import get_monday_ledger
+from core import metrics
+from config.settings import settings
+from config.companies import Company, companies_sharing_board, get_company
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ReconcileService:
+    """Compara SQLFACTFnn de una empresa contra los ítems de su tablero de Monday.
+
+    Detecta ítems faltantes (SINCRONIZADO = 1 sin ítem), ítems duplicados
+    (mismo CVE_DOC de SQLFACTFnn más de una vez) y documentos pendientes que
+    ya tienen ítem. Con fix=True corrige los tres casos en bloque; los ítems
+    cuyo nombre no es un documento de la empresa nunca se tocan.
+    """
+
+    def __init__(self, client: Optional[MondayClient] = None, company: Optional[Company] = None):
+        self._client = client
+        self.company = company or get_company()
+
+    @property
+    def client(self) -> MondayClient:
+        if self._client is None:
+            self._client = get_monday_client(self.company)
+        return self._client
+
+    def board_index(self, board_id: str) -> Dict[str, List[str]]:
+        """Índice {nombre_ítem: [ids]} de todo el tablero, leído por páginas con cursor"""
+        index: Dict[str, List[str]] = {}
+        pages = items = 0
+        for page in self.client.iter_board_items(board_id):
+            pages += 1
+            items += len(page)
+            for item in page:
+                index.setdefault(item['name'], []).append(str(item['id']))
+        logger.info(f"Tablero {board_id}: {items} ítems leídos en {pages} páginas")
+        return index
+
+    @staticmethod
+    def _keep(cve_doc: str, ids: List[str], ledger: Dict[str, tuple]) -> str:
+        """Ítem a conservar entre duplicados: el del registro local o el más antiguo"""
+        known = ledger.get(cve_doc)
+        if known and known[0] in ids:
+            return known[0]
+        return min(ids, key=lambda item_id: (len(item_id), item_id))
+
+    def check_fix(self):
+        """Lanza ValueError si corregir podría tocar ítems ajenos: tablero compartido o nombre de ítem que no es CVE_DOC"""
+        if settings.MONDAY_ITEM_NAME_COLUMN != "CVE_DOC":
+            raise ValueError(
+                f"MONDAY_ITEM_NAME_COLUMN={settings.MONDAY_ITEM_NAME_COLUMN} no identifica un solo documento; "
+                "la reconciliación solo reporta diferencias"
+            )
+        others = companies_sharing_board(self.company)
+        if others:
+            raise ValueError(
+                f"El tablero {self.company.board_id} de la empresa {self.company.number} también es de "
+                f"la(s) empresa(s) {', '.join(others)}; configure un tablero por empresa en COMPANIES para usar fix"
+            )
+
+    def reconcile(self, db: Session, fix: bool = False, max_details: int = 500) -> dict:
+        """Reconcilia el tablero con SQL Server; retorna el reporte de diferencias"""
+        if fix:
+            self.check_fix()
+        board_id = self.company.board_id
+        sql_service = SQLService(db, self.company)
+        index = self.board_index(board_id)
+
+        # El tablero se indexa por nombre de ítem: el campo configurado en MONDAY_ITEM_NAME_COLUMN
+        missing: List[str] = []
+        adopted: List[str] = []
+        duplicates: Dict[str, List[str]] = {}
+        items: Dict[str, List[str]] = {}  # CVE_DOC → ids de sus ítems, de los pendientes y duplicados
+        with metrics.stage("sql_read"):
+            for page in sql_service.iter_sync_flags(name_field=settings.MONDAY_ITEM_NAME_COLUMN):
+                for cve_doc, sincronizado, item_name in page:
+                    ids = index.get(item_name)
+                    if sincronizado and not ids:
+                        missing.append(cve_doc)
+                    elif not sincronizado and ids:
+                        adopted.append(cve_doc)
+                        items[cve_doc] = ids
+                    if ids and len(ids) > 1:
+                        duplicates[cve_doc] = ids
+                        items[cve_doc] = ids
+        ledger = get_monday_ledger(self.company.number)
+        with metrics.stage("ledger"):
+            known = ledger.lookup(list(duplicates) + adopted)
+
+        report = {
+            "company": self.company.number,
+            "board_id": board_id,
+            "board_items": sum(len(ids) for ids in index.values()),
+            "fix": fix,
+            "missing": {"total": len(missing), "items": missing[:max_details]},
+            "duplicates": {
+                "total": len(duplicates),
+                "items": [{"CVE_DOC": name, "ids": ids} for name, ids in list(duplicates.items())[:max_details]]
+            },
+            "unsynced_existing": {"total": len(adopted), "items": adopted[:max_details]},
+        }
+        logger.info(
+            f"Reconciliación de la empresa {self.company.number}: {len(missing)} faltantes, {len(duplicates)} duplicados, "
+            f"{len(adopted)} pendientes que ya existen en Monday"
+        )
+        if fix:
+            report["fixed"] = self._fix(db, items, missing, duplicates, adopted, known)
+        return report
+
+    def _fix(self, db: Session, items: Dict[str, List[str]], missing: List[str],
+             duplicates: Dict[str, List[str]], adopted: List[str], known: Dict[str, tuple]) -> dict:
+        """Corrige en bloque: recrea faltantes, elimina duplicados y adopta ítems existentes"""
+        sql_service = SQLService(db, self.company)
+        ledger = get_monday_ledger(self.company.number)
+
+        # 1. Faltantes: quitar del registro y volver a pendientes para que la siguiente sincronización los cree
+        if missing:
+            ledger.forget(missing)
+            sql_service.mark_unsynced(missing)
+
+        # 2. Duplicados: conservar un ítem por documento y eliminar el resto
+        extra_ids = []
+        for cve_doc, ids in duplicates.items():
+            keep = self._keep(cve_doc, ids, known)
+            items[cve_doc] = [keep]
+            extra_ids.extend(item_id for item_id in ids if item_id != keep)
+        deleted = failed = 0
+        if extra_ids:
+            for item_id, result in self.client.delete_items(extra_ids).items():
+                if result.get('id'):
+                    deleted += 1
+                else:
+                    failed += 1
+                    logger.error(f"No se pudo eliminar el ítem duplicado {item_id}: {result.get('errors')}")
+
+        # 3. Pendientes con ítem existente: registrar el ítem y marcarlos, refrescando sus columnas
+        if adopted:
+            ledger.record([
+                (cve_doc, self._keep(cve_doc, items[cve_doc], known), "", None)
+                for cve_doc in adopted
+            ])
+            sql_service.mark_adopted(adopted)
+
+        return {
+            "marked_unsynced": len(missing),
+            "duplicates_deleted": deleted,
+            "duplicates_failed": failed,
+            "adopted": len(adopted),
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from services.job_service import job_manager
+from core import metrics
+from core.database import acquire_app_lock, release_app_lock
+from config.settings import settings
+from config.companies import Company, get_companies
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Candado de SQL Server que comparten los procesos de la API
+SCHEDULER_LOCK = "facturasmh_scheduler"
+
+class SyncScheduler:
+    """Programador de la API: transferencia de Firebird y sincronización con Monday en ciclos.
+
+    Reemplaza a Scripts/taskfmh.ps1 + sync_scriptfmh.py. El intervalo se
+    adapta al trabajo observado: vuelve al mínimo cuando llegan documentos y
+    se multiplica por SCHEDULER_BACKOFF en cada ciclo sin trabajo, hasta el
+    máximo. Los disparos manuales que llegan juntos (o durante un ciclo) se
+    agrupan en un solo ciclo.
+
+    Con varios workers de uvicorn cada uno inicia su programador, pero cada
+    ciclo toma antes el candado SCHEDULER_LOCK (sp_getapplock): si otro
+    proceso ya está en un ciclo, este se omite.
+
+    No debe activarse junto con pipelinefmh.py ni con la tarea programada:
+    tomarían los mismos pendientes.
+    """
+
+    def __init__(self):
+        self.interval: Optional[float] = None  # La configuración se lee al iniciar
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.cycles = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.last_cycle: Optional[dict] = None
+        self._sync_runner = None
+        self._empresas = {}  # Número → Empresa de transferfmh; su cache de dimensiones se conserva entre ciclos
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, sync_runner):
+        """Inicia el ciclo como tarea del event loop; sync_runner(job) es la sincronización de la API"""
+        self._sync_runner = sync_runner
+        self.interval = settings.SCHEDULER_MIN_INTERVAL
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(
+            f"Programador iniciado: intervalo de {settings.SCHEDULER_MIN_INTERVAL}s "
+            f"a {settings.SCHEDULER_MAX_INTERVAL}s según el trabajo pendiente"
+        )
+
+    async def stop(self):
+        """Cancela el ciclo; una transferencia en curso termina en su hilo"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def trigger(self, reason: str = "manual") -> bool:
+        """Pide un ciclo lo antes posible; retorna False si se agrupó con otro disparo pendiente o en curso"""
+        queued = not self._wake.is_set() and not self.running
+        if not queued:
+            self.coalesced += 1
+        self._wake.set()
+        logger.info(f"Ciclo solicitado ({reason}){'' if queued else ', agrupado con el pendiente'}")
+        return queued
+
+    async def _loop(self):
+        # El primer ciclo corre al iniciar la API
+        self._wake.set()
+        while True:
+            self.next_run = datetime.now() + timedelta(seconds=self.interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+                # Margen para juntar los disparos que llegan en ráfaga
+                await asyncio.sleep(settings.SCHEDULER_COALESCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self.next_run = None
+            try:
+                await self.run_cycle()
+            except Exception as e:
+                logger.error(f"Error en el ciclo programado: {str(e)}")
+                self.interval = settings.SCHEDULER_MIN_INTERVAL
+
+    async def _transfer(self, company: Company) -> int:
+        """Transfiere de Firebird una empresa en un hilo; retorna los documentos insertados o modificados"""
+        from transferfmh import Empresa, exportar_registros  # fdb solo se necesita con el programador activo
+
+        empresa = self._empresas.get(company.number)
+        if empresa is None:
+            empresa = self._empresas[company.number] = Empresa(company.number)
+        rows = await run_in_threadpool(exportar_registros, empresa)
+        return (rows["insertados"] + rows["actualizados"]) if rows else 0
+
+    async def run_cycle(self) -> dict:
+        """Ciclo completo: transferencia de todas las empresas y sincronización con Monday.
+
+        Se omite (skipped) si otro proceso de la API tiene el candado del programador.
+        """
+        started = time.monotonic()
+        cycle = {"started_at": datetime.now().isoformat(), "transferred": 0, "pending": 0, "job_id": None}
+        lock = await run_in_threadpool(acquire_app_lock, SCHEDULER_LOCK)
+        if lock is None:
+            self.skipped += 1
+            cycle["skipped"] = True
+            self.last_cycle = cycle
+            metrics.registry.inc("scheduler_cycles_skipped_total")
+            logger.info(f"Otro proceso de la API está en un ciclo programado, este se omite; siguiente en {self.interval}s")
+            return cycle
+
+        self.running = True
+        try:
+            if settings.SCHEDULER_TRANSFER:
+                with metrics.timed("scheduler_stage_seconds", "scheduler_transfer", stage="transfer"):
+                    transferred = await asyncio.gather(*(self._transfer(company) for company in get_companies()))
+                cycle["transferred"] = sum(transferred)
+
+            job, created = job_manager.try_start()
+            cycle["job_id"] = job.id
+            if created:
+                with metrics.timed("scheduler_stage_seconds", "scheduler_sync", stage="sync"):
+                    await job_manager.launch(job, self._sync_runner)
+                cycle["pending"] = job.total
+                cycle["synced"] = job.synced
+                cycle["failed"] = job.failed
+            else:
+                # Un trabajo manual ya está en curso: se revisa de nuevo pronto
+                logger.info(f"Trabajo {job.id} ({job.kind}) en curso, el ciclo no sincroniza")
+                cycle["pending"] = max(job.total, 1)
+        finally:
+            self.running = False
+            await run_in_threadpool(release_app_lock, lock, SCHEDULER_LOCK)
+
+        # Con trabajo se vuelve al intervalo mínimo; sin trabajo se espacia
+        if cycle["transferred"] or cycle["pending"]:
+            self.interval = settings.SCHEDULER_MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * settings.SCHEDULER_BACKOFF, settings.SCHEDULER_MAX_INTERVAL)
+
+        self.cycles += 1
+        cycle["seconds"] = round(time.monotonic() - started, 2)
+        cycle["next_interval"] = self.interval
+        self.last_cycle = cycle
+        metrics.registry.inc("scheduler_cycles_total")
+        metrics.registry.set("scheduler_interval_seconds", self.interval)
+        logger.info(
+            f"Ciclo programado: {cycle['transferred']} transferidos, {cycle['pending']} por sincronizar "
+            f"en {cycle['seconds']}s; siguiente en {self.interval}s"
+        )
+        return cycle
+
+    def to_dict(self) -> dict:
+        return {
+            "enabled": self.started,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "next_run_at": self.next_run.isoformat() if self.next_run else None,
+            "trigger_pending": bool(self._wake and self._wake.is_set()),
+            "cycles": self.cycles,
+            "coalesced_triggers": self.coalesced,
+            "skipped_cycles": self.skipped,
+            "last_cycle": self.last_cycle,
+        }
+
+# Instancia singleton del programador
+scheduler = SyncScheduler()
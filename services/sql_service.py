@@ -1,29 +1,379 @@
-from datetime import datetime, date, timedelta
-from typing import List
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import and_, delete, false, func, or_, select, text, true
+from sqlalchemy.dialects import mssql
+from sqlalchemy.engine import Row
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import Session
-from models.entities import SQLFACTF03
+from models.entities import failure_model, invoice_model
+from config.settings import settings
+from config.companies import Company, get_company
+from core import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_IN_PARAMS = 1000
+
+# Columnas que necesita la sincronización (sin cargar entidades completas)
+INVOICE_COLUMNS = (
+    "CVE_DOC", "NOMBRE", "CVE_PEDI", "FECHA_DOC", "FECHA_VEN",
+    "MONEDA", "TIPCAMB", "IMPORTE", "IMPORTEME", "VENDEDOR"
+)
+
+# Creación idempotente del índice de pendientes; {create} sale de pending_index_ddl
+PENDING_INDEX_DDL = """
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = '{name}' AND object_id = OBJECT_ID('{table}')
+)
+{create}
+"""
+
+def pending_index_ddl(model) -> str:
+    """CREATE INDEX del índice filtrado de pendientes, compilado desde su declaración en models/entities.py"""
+    name = f"IX_{model.__tablename__}_PENDIENTES"
+    index = next(index for index in model.__table__.indexes if index.name == name)
+    create = CreateIndex(index).compile(dialect=mssql.dialect())
+    return PENDING_INDEX_DDL.format(name=name, table=model.__tablename__, create=create)
+
+# Columnas de detección de cambios (las crea también transferfmh.py); {table} = SQLFACTFnn
+CHANGE_COLUMNS_DDL = """
+IF COL_LENGTH('{table}', 'HASH_CONTENIDO') IS NULL
+    ALTER TABLE {table} ADD HASH_CONTENIDO CHAR(64) NULL;
+IF COL_LENGTH('{table}', 'ACTUALIZAR') IS NULL
+    ALTER TABLE {table} ADD ACTUALIZAR BIT NOT NULL CONSTRAINT DF_{table}_ACTUALIZAR DEFAULT 0;
+"""
+
+# Documentos rechazados por Monday; {table} = SQLFACTFnn
+FAILURES_TABLE_DDL = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = '{table}_FALLIDOS')
+CREATE TABLE {table}_FALLIDOS (
+    CVE_DOC VARCHAR(50) NOT NULL PRIMARY KEY,
+    INTENTOS INT NOT NULL,
+    TIPO_ERROR VARCHAR(100) NULL,
+    ULTIMO_ERROR NVARCHAR(1000) NULL,
+    PROXIMO_INTENTO DATETIME NOT NULL,
+    CUARENTENA BIT NOT NULL CONSTRAINT DF_{table}_FALLIDOS_CUARENTENA DEFAULT 0,
+    ACTUALIZADO DATETIME NOT NULL
+)
+"""
+
+def retry_delay(attempts: int) -> float:
+    """Segundos hasta el siguiente reintento: crece al doble con cada intento fallido"""
+    return min(settings.SYNC_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), settings.SYNC_RETRY_MAX_DELAY)
+
 class SQLService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, company: Optional[Company] = None):
         self.db = db
+        self.company = company or get_company()
+        self.model = invoice_model(self.company.number)
+        self.failures = failure_model(self.company.number)
+        self.columns = tuple(getattr(self.model, name) for name in INVOICE_COLUMNS)
 
-    def get_recent_invoices(self, days_back: int = 180) -> List[SQLFACTF03]:
+    def get_recent_invoices(self, days_back: int = 180) -> list:
         """Obtiene las facturas de los últimos N días que no han sido sincronizadas"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
-        
         try:
-            invoices = self.db.query(SQLFACTF03).filter(
-                SQLFACTF03.FECHA_DOC >= start_date,
-                SQLFACTF03.FECHA_DOC <= end_date,
-                SQLFACTF03.SINCRONIZADO == False
-            ).all()
+            with metrics.timed("sql_query_seconds", "sql_read", operation="get_recent_invoices"):
+                invoices = self.db.query(self.model).filter(self._pending_filter(days_back)).all()
 
             logger.info(f"Encontradas {len(invoices)} facturas no sincronizadas de los últimos {days_back} días")
             return invoices
         except Exception as e:
             logger.error(f"Error al obtener facturas: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def _pending_filter(self, days_back: int):
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days_back)
+        # false() se compila como literal (SINCRONIZADO = 0) para que SQL Server
+        # pueda usar el índice filtrado; con un parámetro no lo haría
+        return and_(
+            self.model.FECHA_DOC >= start_date,
+            self.model.FECHA_DOC <= end_date,
+            self.model.SINCRONIZADO == false(),
+            self._due_filter()
+        )
+
+    def _due_filter(self):
+        """Excluye los documentos rechazados cuyo reintento aún no toca o que están en cuarentena"""
+        return ~select(self.failures.CVE_DOC).where(
+            self.failures.CVE_DOC == self.model.CVE_DOC,
+            or_(self.failures.CUARENTENA == true(), self.failures.PROXIMO_INTENTO > datetime.now())
+        ).exists()
+
+    def count_recent_invoices(self, days_back: int = 180) -> int:
+        """Cuenta las facturas pendientes de sincronizar de los últimos N días"""
+        with metrics.timed("sql_query_seconds", "sql_read", operation="count_recent_invoices"):
+            return self.db.execute(
+                select(func.count()).select_from(self.model).where(self._pending_filter(days_back))
+            ).scalar_one()
+
+    def iter_recent_invoices(self, days_back: int = 180, page_size: int = None) -> Iterator[List[Row]]:
+        """Recorre por páginas las facturas pendientes de los últimos N días.
+
+        Pagina por llave (FECHA_DOC, CVE_DOC) en lugar de OFFSET y selecciona
+        solo columnas, así cada página cuesta lo mismo aunque la tabla crezca
+        y las filas no quedan retenidas en la sesión.
+        """
+        page_size = page_size or settings.SQL_PAGE_SIZE
+        last = None
+        total = 0
+
+        while True:
+            query = select(*self.columns).where(self._pending_filter(days_back))
+            if last is not None:
+                query = query.where(or_(
+                    self.model.FECHA_DOC > last.FECHA_DOC,
+                    and_(self.model.FECHA_DOC == last.FECHA_DOC, self.model.CVE_DOC > last.CVE_DOC)
+                ))
+            query = query.order_by(self.model.FECHA_DOC, self.model.CVE_DOC).limit(page_size)
+
+            try:
+                with metrics.timed("sql_query_seconds", "sql_read", operation="iter_recent_invoices"):
+                    page = self.db.execute(query).all()
+            except Exception as e:
+                logger.error(f"Error al obtener facturas: {str(e)}")
+                raise
+            # Cerrar la transacción de lectura entre páginas
+            with metrics.timed("sql_commit_seconds", "sql_read", operation="iter_recent_invoices"):
+                self.db.commit()
+
+            if not page:
+                break
+            total += len(page)
+            yield page
+            if len(page) < page_size:
+                break
+            last = page[-1]
+
+        logger.info(f"Recorridas {total} facturas no sincronizadas de los últimos {days_back} días")
+
+    def count_changed_invoices(self) -> int:
+        """Cuenta los documentos ya sincronizados que cambiaron en Firebird"""
+        with metrics.timed("sql_query_seconds", "sql_read", operation="count_changed_invoices"):
+            return self.db.execute(
+                select(func.count()).select_from(self.model).where(self.model.ACTUALIZAR == true(), self._due_filter())
+            ).scalar_one()
+
+    def iter_changed_invoices(self, page_size: int = None) -> Iterator[List[Row]]:
+        """Recorre por páginas (llave CVE_DOC) los documentos marcados con ACTUALIZAR"""
+        page_size = page_size or settings.SQL_PAGE_SIZE
+        last = None
+        total = 0
+
+        while True:
+            query = select(*self.columns).where(self.model.ACTUALIZAR == true(), self._due_filter())
+            if last is not None:
+                query = query.where(self.model.CVE_DOC > last)
+            query = query.order_by(self.model.CVE_DOC).limit(page_size)
+
+            try:
+                with metrics.timed("sql_query_seconds", "sql_read", operation="iter_changed_invoices"):
+                    page = self.db.execute(query).all()
+            except Exception as e:
+                logger.error(f"Error al obtener facturas modificadas: {str(e)}")
+                raise
+            with metrics.timed("sql_commit_seconds", "sql_read", operation="iter_changed_invoices"):
+                self.db.commit()
+
+            if not page:
+                break
+            total += len(page)
+            yield page
+            if len(page) < page_size:
+                break
+            last = page[-1].CVE_DOC
+
+        logger.info(f"Recorridas {total} facturas modificadas pendientes de actualizar en Monday")
+
+    def get_pending_by_cve(self, cve_docs: List[str]) -> Tuple[List[Row], List[Row]]:
+        """De los documentos indicados, retorna (pendientes de crear, modificados por actualizar)"""
+        pending: List[Row] = []
+        changed: List[Row] = []
+        try:
+            with metrics.timed("sql_query_seconds", "sql_read", operation="get_pending_by_cve"):
+                for start in range(0, len(cve_docs), MAX_IN_PARAMS):
+                    chunk = cve_docs[start:start + MAX_IN_PARAMS]
+                    rows = self.db.execute(
+                        select(*self.columns, self.model.SINCRONIZADO).where(
+                            self.model.CVE_DOC.in_(chunk),
+                            or_(self.model.SINCRONIZADO == false(), self.model.ACTUALIZAR == true()),
+                            self._due_filter()
+                        ).order_by(self.model.FECHA_DOC, self.model.CVE_DOC)
+                    ).all()
+                    for row in rows:
+                        (changed if row.SINCRONIZADO else pending).append(row)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error al obtener facturas pendientes por documento: {str(e)}")
+            raise
+        return pending, changed
+
+    def iter_sync_flags(self, page_size: int = None, name_field: str = "CVE_DOC") -> Iterator[List[Row]]:
+        """Recorre por llave CVE_DOC toda la tabla trayendo solo (CVE_DOC, SINCRONIZADO, nombre del ítem en Monday)"""
+        page_size = page_size or settings.SQL_PAGE_SIZE
+        last = None
+
+        while True:
+            query = select(self.model.CVE_DOC, self.model.SINCRONIZADO, getattr(self.model, name_field).label("ITEM_NAME"))
+            if last is not None:
+                query = query.where(self.model.CVE_DOC > last)
+            query = query.order_by(self.model.CVE_DOC).limit(page_size)
+
+            with metrics.timed("sql_query_seconds", "sql_read", operation="iter_sync_flags"):
+                page = self.db.execute(query).all()
+            self.db.commit()
+
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            last = page[-1].CVE_DOC
+
+    def ensure_schema(self):
+        """Agrega las columnas de detección de cambios, el índice filtrado de pendientes y la tabla de fallidos si no existen"""
+        try:
+            self.db.execute(text(CHANGE_COLUMNS_DDL.format(table=self.company.sql_table)))
+            self.db.execute(text(pending_index_ddl(self.model)))
+            self.db.execute(text(FAILURES_TABLE_DDL.format(table=self.company.sql_table)))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error al asegurar el esquema de {self.company.sql_table}: {str(e)}")
+            raise
+
+    def mark_synced(self, cve_docs: List[str]) -> int:
+        """Marca los documentos como sincronizados con UPDATE ... WHERE CVE_DOC IN (...) en una sola transacción"""
+        try:
+            return self._update_flags(cve_docs, {"SINCRONIZADO": True}, "mark_synced", clear_failures=True)
+        except Exception as e:
+            logger.error(f"Error al marcar documentos sincronizados: {str(e)}")
+            raise
+
+    def mark_updated(self, cve_docs: List[str]) -> int:
+        """Limpia la bandera ACTUALIZAR de los documentos ya actualizados en Monday"""
+        try:
+            return self._update_flags(cve_docs, {"ACTUALIZAR": False}, "mark_updated", clear_failures=True)
+        except Exception as e:
+            logger.error(f"Error al marcar documentos actualizados: {str(e)}")
+            raise
+
+    def mark_unsynced(self, cve_docs: List[str]) -> int:
+        """Vuelve a marcar como pendientes documentos cuyo ítem ya no existe en Monday"""
+        try:
+            return self._update_flags(cve_docs, {"SINCRONIZADO": False, "ACTUALIZAR": False}, "mark_unsynced")
+        except Exception as e:
+            logger.error(f"Error al marcar documentos como pendientes: {str(e)}")
+            raise
+
+    def mark_adopted(self, cve_docs: List[str]) -> int:
+        """Marca como sincronizados documentos que ya tenían ítem en Monday y pide refrescar sus columnas"""
+        try:
+            return self._update_flags(cve_docs, {"SINCRONIZADO": True, "ACTUALIZAR": True}, "mark_adopted")
+        except Exception as e:
+            logger.error(f"Error al marcar documentos existentes en Monday: {str(e)}")
+            raise
+
+    def _update_flags(self, cve_docs: List[str], values: dict, operation: str, clear_failures: bool = False) -> int:
+        updated = 0
+        try:
+            # SQL Server admite como máximo 2100 parámetros por sentencia
+            with metrics.timed("sql_query_seconds", "sql_write", operation=operation):
+                for start in range(0, len(cve_docs), MAX_IN_PARAMS):
+                    chunk = cve_docs[start:start + MAX_IN_PARAMS]
+                    updated += self.db.query(self.model).filter(
+                        self.model.CVE_DOC.in_(chunk)
+                    ).update(values, synchronize_session=False)
+                    if clear_failures:
+                        # Un documento aceptado por Monday deja de contar como fallido
+                        self.db.execute(delete(self.failures).where(self.failures.CVE_DOC.in_(chunk)))
+            with metrics.timed("sql_commit_seconds", "sql_write", operation=operation):
+                self.db.commit()
+            return updated
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def record_failures(self, failures: List[Tuple[str, str, str]]) -> List[str]:
+        """Registra (CVE_DOC, tipo de error, mensaje) rechazados por Monday y programa su reintento.
+
+        Cada intento duplica la espera (SYNC_RETRY_BASE_DELAY hasta
+        SYNC_RETRY_MAX_DELAY); al llegar a SYNC_MAX_ATTEMPTS el documento queda
+        en cuarentena hasta que se reencole. Retorna los que entraron en cuarentena.
+        """
+        now = datetime.now()
+        quarantined = []
+        try:
+            with metrics.timed("sql_query_seconds", "sql_write", operation="record_failures"):
+                existing = {}
+                cve_docs = [cve_doc for cve_doc, _, _ in failures]
+                for start in range(0, len(cve_docs), MAX_IN_PARAMS):
+                    chunk = cve_docs[start:start + MAX_IN_PARAMS]
+                    existing.update(
+                        (row.CVE_DOC, row)
+                        for row in self.db.query(self.failures).filter(self.failures.CVE_DOC.in_(chunk))
+                    )
+                for cve_doc, error_class, error in failures:
+                    row = existing.get(cve_doc)
+                    if row is None:
+                        row = existing[cve_doc] = self.failures(CVE_DOC=cve_doc, INTENTOS=0)
+                        self.db.add(row)
+                    row.INTENTOS += 1
+                    row.TIPO_ERROR = error_class[:100]
+                    row.ULTIMO_ERROR = error[:1000]
+                    row.PROXIMO_INTENTO = now + timedelta(seconds=retry_delay(row.INTENTOS))
+                    row.CUARENTENA = row.INTENTOS >= settings.SYNC_MAX_ATTEMPTS
+                    row.ACTUALIZADO = now
+                    if row.CUARENTENA:
+                        quarantined.append(cve_doc)
+            with metrics.timed("sql_commit_seconds", "sql_write", operation="record_failures"):
+                self.db.commit()
+            return quarantined
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error al registrar documentos fallidos: {str(e)}")
+            raise
+
+    def list_failures(self, quarantined: Optional[bool] = True, offset: int = 0, limit: int = 100) -> dict:
+        """Documentos fallidos (solo en cuarentena por defecto), del más reciente al más antiguo"""
+        query = select(self.failures)
+        if quarantined is not None:
+            query = query.where(self.failures.CUARENTENA == (true() if quarantined else false()))
+        total = self.db.execute(select(func.count()).select_from(query.subquery())).scalar_one()
+        rows = self.db.execute(
+            query.order_by(self.failures.ACTUALIZADO.desc(), self.failures.CVE_DOC).offset(offset).limit(limit)
+        ).scalars().all()
+        self.db.commit()
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [{
+                "CVE_DOC": row.CVE_DOC,
+                "attempts": row.INTENTOS,
+                "error_class": row.TIPO_ERROR,
+                "error": row.ULTIMO_ERROR,
+                "next_retry": row.PROXIMO_INTENTO.isoformat(),
+                "quarantined": row.CUARENTENA,
+                "updated_at": row.ACTUALIZADO.isoformat(),
+            } for row in rows]
+        }
+
+    def requeue_failures(self, cve_docs: Optional[List[str]] = None) -> int:
+        """Quita de fallidos los documentos indicados (o todos los de cuarentena) para reintentarlos desde cero"""
+        try:
+            if cve_docs is None:
+                removed = self.db.execute(delete(self.failures).where(self.failures.CUARENTENA == true())).rowcount
+            else:
+                removed = 0
+                for start in range(0, len(cve_docs), MAX_IN_PARAMS):
+                    chunk = cve_docs[start:start + MAX_IN_PARAMS]
+                    removed += self.db.execute(delete(self.failures).where(self.failures.CVE_DOC.in_(chunk))).rowcount
+            self.db.commit()
+            return removed
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error al reencolar documentos fallidos: {str(e)}")
+            raise
@@ -1,89 +1,496 @@
+import asyncio
+import json
 from datetime import datetime
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Optional
 from sqlalchemy.orm import Session
-from models.schemas import Factura, MondayItem
-from models.entities import SQLFACTF03
-from core.monday_client import monday_client
+from models.schemas import Factura
+from services.sql_service import SQLService
+from core.monday_client import BaseMondayClient, MondayClient, get_monday_client
+from core.monday_async_client import AsyncMondayClient, get_async_monday_client
+from core.ledger import MondayLedger, get_monday_ledger, payload_hash
+from core.column_map import MondayPayload, get_column_map
 from config.settings import settings
+from config.companies import Company, get_company
+from core import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SyncService:
+    def __init__(self, client: Optional[MondayClient] = None, async_client: Optional[AsyncMondayClient] = None,
+                 company: Optional[Company] = None):
+        # Los clientes se obtienen en el primer uso si no se inyectan
+        self._client = client
+        self._async_client = async_client
+        self._company = company
+
+    @property
+    def company(self) -> Company:
+        """Empresa que se sincroniza (la primera configurada si no se indica)"""
+        if self._company is None:
+            self._company = get_company()
+        return self._company
+
+    @property
+    def client(self) -> MondayClient:
+        if self._client is None:
+            self._client = get_monday_client(self.company)
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncMondayClient:
+        if self._async_client is None:
+            self._async_client = get_async_monday_client(self.company)
+        return self._async_client
+
+    @property
+    def ledger(self) -> MondayLedger:
+        return get_monday_ledger(self.company.number)
+
     @staticmethod
-    def map_to_monday_format(factura: Factura) -> MondayItem:
-        """Mapea los datos de SQL a formato de Monday.com"""
-        column_values = {
-            "text_mknkr94f": factura.NOMBRE,
-            "text_mknk2qt": factura.CVE_PEDI,
-            "date4": factura.FECHA_DOC.isoformat(),
-            "date_mknkfx2h": factura.FECHA_VEN.isoformat(),
-            "text_mkq36w8v": factura.MONEDA,
-            "numeric_mknkwc1": factura.TIPCAMB,
-            "numeric_mknkb26y": factura.IMPORTE,
-            "numeric_mknk6qv1": factura.IMPORTEME,
-            "text_mkr4r61z": factura.VENDEDOR,
-        }
-        
-        return MondayItem(
-            name=factura.CVE_DOC,
-            column_values=column_values
-        )
+    def map_to_monday_format(factura: Factura) -> MondayPayload:
+        """Mapea los datos de SQL a formato de Monday.com según MONDAY_COLUMN_MAP"""
+        return get_column_map()(factura)
 
-    def sync_invoices(self, invoices: List[Factura], db: Session) -> dict:
-        """Sincroniza las facturas con Monday.com y actualiza SQL"""
-        results = []
-        
+    @staticmethod
+    def _error_message(result: dict) -> str:
+        """Resume los errores de Monday de un ítem en un solo texto"""
+        errors = result.get('errors') or []
+        return "; ".join(str(error.get('message', error)) for error in errors) or "Monday no retornó ID"
+
+    @staticmethod
+    def _error_class(result: dict) -> Optional[str]:
+        """Código del error de Monday si es propio del documento (error con path a su alias).
+
+        Los errores del lote completo (límites, red, 5xx) retornan None: no son
+        culpa del documento y no cuentan como intento.
+        """
+        for error in result.get('errors') or []:
+            if isinstance(error, dict) and error.get('path'):
+                return str((error.get('extensions') or {}).get('code') or error.get('error_code') or "MondayError")
+        return None
+
+    def _record_failures(self, results: list, db: Session):
+        """Programa el reintento con espera creciente de los documentos rechazados por Monday.
+
+        Solo cuentan los rechazos propios de cada documento (error_class); las
+        fallas de grupos, del lote o de SQL se reintentan en la siguiente ejecución.
+        """
+        failures = [(r["CVE_DOC"], r["error_class"], r["error"]) for r in results if r.get("error_class")]
+        if not failures:
+            return
+        try:
+            quarantined = SQLService(db, self.company).record_failures(failures)
+        except Exception as e:
+            logger.error(f"Error al registrar {len(failures)} documentos fallidos: {str(e)}")
+            return
+        if quarantined:
+            logger.warning(
+                f"{len(quarantined)} documentos en cuarentena tras {settings.SYNC_MAX_ATTEMPTS} intentos: "
+                f"{', '.join(quarantined[:10])}"
+            )
+
+    def _split_known(self, invoices: List[Factura]) -> tuple:
+        """Separa las facturas que el registro local ya tiene creadas en Monday"""
+        with metrics.stage("ledger"):
+            known = self.ledger.lookup(invoice.CVE_DOC for invoice in invoices)
+        if known:
+            logger.info(f"{len(known)} documentos ya existen en Monday según el registro local, solo se marcan en SQL")
+        recovered = [(invoice, None, None) for invoice in invoices if invoice.CVE_DOC in known]
+        responses = {cve_doc: {'id': monday_id, 'errors': []} for cve_doc, (monday_id, _) in known.items()}
+        return [invoice for invoice in invoices if invoice.CVE_DOC not in known], recovered, responses
+
+    def _plan(self, invoices: List[Factura], groups: dict, results: list) -> list:
+        """Mapea las facturas a formato Monday y descarta las que no tienen grupo"""
+        pending = []
+        to_payload = get_column_map()
         for invoice in invoices:
-            try:
-                # 1. Obtener o crear el grupo correspondiente al mes de la fecha
-                group_id = monday_client.get_or_create_group_by_date(
-                    board_id=settings.MONDAY_BOARD_ID,
-                    fecha_doc=invoice.FECHA_DOC
-                )
-                
-                # 2. Mapear datos a formato Monday
-                monday_item = self.map_to_monday_format(invoice)
-                
-                # 3. Crear item en Monday en el grupo correcto
-                result = monday_client.create_item(
-                    board_id=settings.MONDAY_BOARD_ID,
-                    item_name=monday_item.name,
-                    column_values=monday_item.column_values,
-                    group_id=group_id  # ← AQUÍ SE ESPECIFICA EL GRUPO
-                )
-                
-                # 4. Si se sincronizó correctamente, marcarlo en SQL
-                if result.get('data', {}).get('create_item', {}).get('id'):
-                    db.query(SQLFACTF03).filter(SQLFACTF03.CVE_DOC == invoice.CVE_DOC).update({"SINCRONIZADO": True})
-                    db.commit()
-                    
-                    # Calcular nombre del grupo para el log
-                    meses = {1: "ENE", 2: "FEB", 3: "MAR", 4: "ABR", 5: "MAY", 6: "JUN",
-                            7: "JUL", 8: "AGO", 9: "SEP", 10: "OCT", 11: "NOV", 12: "DIC"}
-                    mes_nombre = meses[invoice.FECHA_DOC.month]
-                    grupo_nombre = f"{mes_nombre}-{invoice.FECHA_DOC.year}"
-                    
-                    logger.info(f"Documento {invoice.CVE_DOC} sincronizado en grupo '{grupo_nombre}' (ID: {group_id})")
+            grupo_nombre = BaseMondayClient.group_name_for_date(invoice.FECHA_DOC)
+            if not groups.get(grupo_nombre):
+                error = f"No se pudo crear el grupo {grupo_nombre}"
+                logger.error(f"Error al sincronizar documento {invoice.CVE_DOC}: {error}")
+                results.append({"CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": error})
+                continue
+            pending.append((invoice, to_payload(invoice), grupo_nombre))
+        return pending
+
+    @staticmethod
+    def _to_items(entries: list, groups: dict) -> list:
+        return [{
+            "key": invoice.CVE_DOC,
+            "item_name": monday_item.name,
+            "column_values": monday_item.column_values,
+            "group_id": groups.get(grupo_nombre)
+        } for invoice, monday_item, grupo_nombre in entries]
+
+    @staticmethod
+    def _rejected_groups(client, board_id: str, batch: list, responses: dict, groups: dict) -> list:
+        """Invalida los grupos que Monday rechazó y retorna las entradas a reintentar"""
+        rejected = [entry for entry in batch if client.is_group_error(responses[entry[0].CVE_DOC])]
+        for grupo_nombre in {entry[2] for entry in rejected}:
+            logger.warning(f"Grupo '{grupo_nombre}' rechazado por Monday, se vuelve a resolver")
+            client.invalidate_group_cache(board_id, grupo_nombre)
+            groups.pop(grupo_nombre, None)
+        return rejected
+
+    def _record_batch(self, batch: list, responses: dict, groups: dict, db: Session, results: list):
+        """Marca en SQL, en una sola transacción, los documentos aceptados por Monday y registra el resultado de cada uno.
+
+        Antes de tocar SQL Server se guardan los IDs en el registro local, para
+        que un fallo al marcar SINCRONIZADO no genere duplicados después.
+        """
+        accepted = []
+        start = len(results)
+        for invoice, monday_item, grupo_nombre in batch:
+            response = responses[invoice.CVE_DOC]
+            if not response.get('id'):
+                error = self._error_message(response)
+                logger.error(f"Error al sincronizar documento {invoice.CVE_DOC}: {error}")
+                results.append({
+                    "CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": error,
+                    "error_class": self._error_class(response)
+                })
+                continue
+            accepted.append((invoice, monday_item, grupo_nombre, response['id']))
+
+        self._record_failures(results[start:], db)
+        if not accepted:
+            return
+
+        # Los documentos recuperados del registro local no traen monday_item y ya están registrados
+        ledger_entries = [
+            (invoice.CVE_DOC, monday_id, payload_hash(monday_item.name, monday_item.column_values), monday_item.column_values)
+            for invoice, monday_item, _, monday_id in accepted
+            if monday_item is not None
+        ]
+        try:
+            with metrics.timed("ledger_write_seconds", "ledger"):
+                self.ledger.record(ledger_entries)
+        except Exception as e:
+            logger.error(f"Error al guardar {len(ledger_entries)} documentos en el registro local: {str(e)}")
+
+        try:
+            SQLService(db, self.company).mark_synced([entry[0].CVE_DOC for entry in accepted])
+        except Exception as e:
+            logger.error(f"Error al marcar {len(accepted)} documentos como sincronizados: {str(e)}")
+            for invoice, *_ in accepted:
+                results.append({"CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": str(e)})
+            return
+
+        for invoice, _, grupo_nombre, monday_id in accepted:
+            group_id = groups.get(grupo_nombre)
+            if grupo_nombre is None:
+                logger.info(f"Documento {invoice.CVE_DOC} marcado como sincronizado (ítem existente {monday_id})")
+            else:
+                logger.info(f"Documento {invoice.CVE_DOC} sincronizado en grupo '{grupo_nombre}' (ID: {group_id})")
+            results.append({
+                "CVE_DOC": invoice.CVE_DOC,
+                "monday_id": monday_id,
+                "group_id": group_id,
+                "status": "success"
+            })
 
+    @staticmethod
+    def _changed_columns(column_values: dict, previous: Optional[dict]) -> dict:
+        """Columnas cuyo valor difiere del último enviado a Monday (todas si no se conoce)"""
+        current = json.loads(json.dumps(column_values, default=str))
+        if previous is None:
+            return current
+        return {column: value for column, value in current.items() if previous.get(column) != value}
+
+    def _plan_updates(self, invoices: list, results: list) -> tuple:
+        """Compara las facturas modificadas contra lo último enviado a Monday.
+
+        Retorna (actualizaciones, sin_cambios): las actualizaciones son
+        (invoice, monday_item, monday_id, columnas_cambiadas) y sin_cambios los
+        CVE_DOC cuyo contenido en Monday ya coincide.
+        """
+        with metrics.stage("ledger"):
+            known = self.ledger.lookup_payloads(invoice.CVE_DOC for invoice in invoices)
+        updates, unchanged = [], []
+        to_payload = get_column_map()
+        for invoice in invoices:
+            entry = known.get(invoice.CVE_DOC)
+            if entry is None:
+                error = "Documento sin ID de Monday en el registro local"
+                logger.error(f"Error al actualizar documento {invoice.CVE_DOC}: {error}")
                 results.append({
-                    "CVE_DOC": invoice.CVE_DOC,
-                    "monday_id": result.get('data', {}).get('create_item', {}).get('id'),
-                    "group_id": group_id,
-                    "status": "success"
+                    "CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": error,
+                    "error_class": "LedgerMissing", "action": "update"
                 })
-                
-            except Exception as e:
-                logger.error(f"Error al sincronizar documento {invoice.CVE_DOC}: {str(e)}")
+                continue
+
+            monday_id, hash_value, previous = entry
+            monday_item = to_payload(invoice)
+            changed = {}
+            if payload_hash(monday_item.name, monday_item.column_values) != hash_value:
+                changed = self._changed_columns(monday_item.column_values, previous)
+            if changed:
+                updates.append((invoice, monday_item, monday_id, changed))
+            else:
+                unchanged.append(invoice.CVE_DOC)
+        return updates, unchanged
+
+    @staticmethod
+    def _to_updates(entries: list) -> list:
+        return [{
+            "key": invoice.CVE_DOC,
+            "item_id": monday_id,
+            "column_values": changed
+        } for invoice, _, monday_id, changed in entries]
+
+    def _record_updates(self, batch: list, responses: dict, db: Session, results: list):
+        """Registra el nuevo contenido de los ítems actualizados y limpia su bandera ACTUALIZAR en SQL"""
+        accepted = []
+        start = len(results)
+        for invoice, monday_item, monday_id, changed in batch:
+            response = responses[invoice.CVE_DOC]
+            if not response.get('id'):
+                error = self._error_message(response)
+                logger.error(f"Error al actualizar documento {invoice.CVE_DOC}: {error}")
                 results.append({
-                    "CVE_DOC": invoice.CVE_DOC,
-                    "status": "failed",
-                    "error": str(e)
+                    "CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": error,
+                    "error_class": self._error_class(response), "action": "update"
                 })
-                db.rollback()
-        
+                continue
+            accepted.append((invoice, monday_item, monday_id, changed))
+
+        self._record_failures(results[start:], db)
+        if not accepted:
+            return
+
+        try:
+            with metrics.timed("ledger_write_seconds", "ledger"):
+                self.ledger.record([
+                    (invoice.CVE_DOC, monday_id, payload_hash(monday_item.name, monday_item.column_values), monday_item.column_values)
+                    for invoice, monday_item, monday_id, _ in accepted
+                ])
+        except Exception as e:
+            logger.error(f"Error al guardar {len(accepted)} documentos en el registro local: {str(e)}")
+
+        try:
+            SQLService(db, self.company).mark_updated([entry[0].CVE_DOC for entry in accepted])
+        except Exception as e:
+            logger.error(f"Error al marcar {len(accepted)} documentos como actualizados: {str(e)}")
+            for invoice, *_ in accepted:
+                results.append({"CVE_DOC": invoice.CVE_DOC, "status": "failed", "error": str(e), "action": "update"})
+            return
+
+        for invoice, _, monday_id, changed in accepted:
+            logger.info(f"Documento {invoice.CVE_DOC} actualizado en Monday (ID: {monday_id}): {', '.join(changed)}")
+            results.append({
+                "CVE_DOC": invoice.CVE_DOC,
+                "monday_id": monday_id,
+                "columns": list(changed),
+                "status": "success",
+                "action": "update"
+            })
+
+    def _clear_unchanged(self, unchanged: List[str], results: list, db: Session):
+        """Limpia la bandera de los documentos que ya coinciden y registra los que no tienen ítem"""
+        self._record_failures(results, db)
+        if unchanged:
+            logger.info(f"{len(unchanged)} documentos modificados ya coinciden con Monday, solo se limpia la bandera")
+            SQLService(db, self.company).mark_updated(unchanged)
+
+    @staticmethod
+    def _report(progress, results: list, start: int):
+        new_results = results[start:]
+        for result in new_results:
+            metrics.registry.inc("sync_items_total", action=result.get("action", "create"), status=result["status"])
+        if progress is not None and new_results:
+            progress(new_results)
+
+    @staticmethod
+    def _summary(results: list) -> dict:
         return {
             "synced_items": len([r for r in results if r["status"] == "success"]),
             "failed_items": len([r for r in results if r["status"] == "failed"]),
             "details": results
-        }
\ No newline at end of file
+        }
+
+    def sync_invoices(self, invoices: List[Factura], db: Session,
+                      progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Sincroniza las facturas con Monday.com y actualiza SQL.
+
+        progress, si se indica, recibe los resultados nuevos después de cada lote.
+        """
+        results = []
+        board_id = self.company.board_id
+        batch_size = settings.MONDAY_BATCH_SIZE
+
+        # 0. Documentos ya creados en una ejecución anterior: solo marcarlos en SQL
+        invoices, recovered, known = self._split_known(invoices)
+        if recovered:
+            self._record_batch(recovered, known, {}, db, results)
+
+        # 1. Resolver una sola vez los grupos de todos los meses del lote
+        groups = self.client.resolve_groups(
+            board_id=board_id,
+            fechas=[invoice.FECHA_DOC for invoice in invoices]
+        ) if invoices else {}
+
+        # 2. Mapear datos a formato Monday y asignar el grupo de cada factura
+        pending = self._plan(invoices, groups, results)
+        self._report(progress, results, 0)
+
+        # 3. Crear los ítems en Monday por lotes de mutaciones con alias
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            responses = self._create_batch(board_id, batch, groups)
+
+            # 4. Marcar en SQL los documentos sincronizados (un commit por lote)
+            reported = len(results)
+            self._record_batch(batch, responses, groups, db, results)
+            self._report(progress, results, reported)
+        
+        return self._summary(results)
+
+    def sync_invoice_pages(self, pages: Iterable[List[Factura]], db: Session,
+                           progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Sincroniza un flujo de páginas de facturas (ver SQLService.iter_recent_invoices)"""
+        results = []
+        for page in pages:
+            results.extend(self.sync_invoices(page, db, progress)["details"])
+        return self._summary(results)
+
+    def _create_batch(self, board_id: str, batch: list, groups: dict) -> dict:
+        """Envía un lote a Monday; si algún grupo es rechazado, lo vuelve a resolver y reintenta esos ítems"""
+        responses = self.client.create_items(board_id, self._to_items(batch, groups), batch_size=len(batch))
+
+        rejected = self._rejected_groups(self.client, board_id, batch, responses, groups)
+        if rejected:
+            groups.update(self.client.resolve_groups(board_id, [entry[0].FECHA_DOC for entry in rejected]))
+            retry = [entry for entry in rejected if groups.get(entry[2])]
+            if retry:
+                responses.update(self.client.create_items(board_id, self._to_items(retry, groups), batch_size=len(retry)))
+
+        return responses
+
+    def update_changed_invoices(self, invoices: List[Factura], db: Session,
+                                progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Actualiza en Monday, solo en las columnas que difieren, las facturas modificadas en Firebird"""
+        results = []
+        board_id = self.company.board_id
+        batch_size = settings.MONDAY_BATCH_SIZE
+
+        pending, unchanged = self._plan_updates(invoices, results)
+        self._clear_unchanged(unchanged, results, db)
+        self._report(progress, results, 0)
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            responses = self.client.change_items_column_values(board_id, self._to_updates(batch), batch_size=len(batch))
+            reported = len(results)
+            self._record_updates(batch, responses, db, results)
+            self._report(progress, results, reported)
+
+        return self._summary(results)
+
+    def update_changed_pages(self, pages: Iterable[List[Factura]], db: Session,
+                             progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Actualiza un flujo de páginas de facturas modificadas (ver SQLService.iter_changed_invoices)"""
+        results = []
+        for page in pages:
+            results.extend(self.update_changed_invoices(page, db, progress)["details"])
+        return self._summary(results)
+
+    async def sync_invoices_async(self, invoices: List[Factura], db: Session,
+                                  progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Versión asíncrona de sync_invoices: envía los lotes a Monday en paralelo.
+
+        Las escrituras en SQL se ejecutan en un hilo aparte, de una en una,
+        para no bloquear el event loop ni compartir la sesión entre hilos.
+        """
+        results = []
+        board_id = self.company.board_id
+        batch_size = settings.MONDAY_BATCH_SIZE
+
+        invoices, recovered, known = await asyncio.to_thread(self._split_known, invoices)
+        if recovered:
+            await asyncio.to_thread(self._record_batch, recovered, known, {}, db, results)
+
+        groups = await self.async_client.resolve_groups(
+            board_id=board_id,
+            fechas=[invoice.FECHA_DOC for invoice in invoices]
+        ) if invoices else {}
+
+        pending = self._plan(invoices, groups, results)
+        self._report(progress, results, 0)
+        db_lock = asyncio.Lock()
+
+        async def sync_batch(batch):
+            responses = await self._create_batch_async(board_id, batch, groups)
+            async with db_lock:
+                reported = len(results)
+                await asyncio.to_thread(self._record_batch, batch, responses, groups, db, results)
+                self._report(progress, results, reported)
+
+        await asyncio.gather(*(
+            sync_batch(pending[start:start + batch_size])
+            for start in range(0, len(pending), batch_size)
+        ))
+
+        return self._summary(results)
+
+    async def sync_invoice_pages_async(self, pages: Iterator[List[Factura]], db: Session,
+                                       progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Versión asíncrona de sync_invoice_pages; cada página se lee en un hilo aparte"""
+        results = []
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            results.extend((await self.sync_invoices_async(page, db, progress))["details"])
+        return self._summary(results)
+
+    async def update_changed_invoices_async(self, invoices: List[Factura], db: Session,
+                                            progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Versión asíncrona de update_changed_invoices"""
+        results = []
+        board_id = self.company.board_id
+        batch_size = settings.MONDAY_BATCH_SIZE
+
+        pending, unchanged = await asyncio.to_thread(self._plan_updates, invoices, results)
+        await asyncio.to_thread(self._clear_unchanged, unchanged, results, db)
+        self._report(progress, results, 0)
+        db_lock = asyncio.Lock()
+
+        async def update_batch(batch):
+            responses = await self.async_client.change_items_column_values(
+                board_id, self._to_updates(batch), batch_size=len(batch)
+            )
+            async with db_lock:
+                reported = len(results)
+                await asyncio.to_thread(self._record_updates, batch, responses, db, results)
+                self._report(progress, results, reported)
+
+        await asyncio.gather(*(
+            update_batch(pending[start:start + batch_size])
+            for start in range(0, len(pending), batch_size)
+        ))
+
+        return self._summary(results)
+
+    async def update_changed_pages_async(self, pages: Iterator[List[Factura]], db: Session,
+                                         progress: Optional[Callable[[List[dict]], None]] = None) -> dict:
+        """Versión asíncrona de update_changed_pages"""
+        results = []
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            results.extend((await self.update_changed_invoices_async(page, db, progress))["details"])
+        return self._summary(results)
+
+    async def _create_batch_async(self, board_id: str, batch: list, groups: dict) -> dict:
+        responses = await self.async_client.create_items(board_id, self._to_items(batch, groups), batch_size=len(batch))
+
+        rejected = self._rejected_groups(self.async_client, board_id, batch, responses, groups)
+        if rejected:
+            groups.update(await self.async_client.resolve_groups(board_id, [entry[0].FECHA_DOC for entry in rejected]))
+            retry = [entry for entry in rejected if groups.get(entry[2])]
+            if retry:
+                responses.update(await self.async_client.create_items(board_id, self._to_items(retry, groups), batch_size=len(retry)))
+
+        return responses
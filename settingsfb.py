@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class ConfigError(Exception):
     """Excepción personalizada para errores de configuración"""
@@ -37,9 +37,12 @@ class FirebirdConfig(DatabaseConfig):
     def get_required_vars(self) -> list:
         return ['HOST', 'DATABASE', 'USER', 'PWD']
     
-    def get_connection_params(self) -> Dict[str, Any]:
+    def get_connection_params(self, empresa: Optional[str] = None) -> Dict[str, Any]:
+        # Aspel guarda cada empresa en su propio .FDB: FIREBIRD_DATABASE_05, o FIREBIRD_DATABASE si no existe
+        database = os.getenv(f'{self.prefix}_DATABASE_{empresa}') if empresa else None
+        database = database or os.getenv(f'{self.prefix}_DATABASE')
         return {
-            'dsn': f"{os.getenv(f'{self.prefix}_HOST')}:{os.getenv(f'{self.prefix}_DATABASE')}",
+            'dsn': f"{os.getenv(f'{self.prefix}_HOST')}:{database}",
             'user': os.getenv(f'{self.prefix}_USER'),
             'password': os.getenv(f'{self.prefix}_PWD'),
             'charset': 'UTF8'
@@ -0,0 +1,214 @@
+"""Instantáneas columnares de las extracciones de Firebird.
+
+Cada transferencia guarda lo extraído en Parquet, un archivo por empresa y mes:
+
+    data/snapshots/03/2026-10.parquet
+
+Sirven para dos cosas:
+
+- Delta: con MODO_TRANSFERENCIA=incremental solo se cargan en SQL Server los
+  documentos cuyo (CVE_DOC, HASH_CONTENIDO) no está en la última instantánea;
+  la comparación es vectorizada con pyarrow.compute en lugar de fila por fila.
+- Reproducción: transferfmh.py --reproducir vuelve a cargar SQLFACTFnn desde
+  las instantáneas sin conectarse a Firebird.
+
+La instantánea solo se reemplaza si todos los lotes se cargaron, así que un
+lote fallido vuelve a salir en el delta de la siguiente ejecución. Si
+SQLFACTFnn se vacía o se restaura, correr una vez en modo completo (el
+predeterminado) para cargar la ventana entera y reescribir las instantáneas.
+
+pyarrow es opcional: sin él la transferencia funciona como antes.
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+DIRECTORIO = Path(os.getenv("SNAPSHOT_DIR", Path(__file__).parent / "data" / "snapshots"))
+
+# Mismo orden que COLUMNAS de transferfmh: así se guarda y se reproduce cada fila
+ESQUEMA = pa.schema([
+    ("CVE_DOC", pa.string()), ("NOMBRE", pa.string()), ("CVE_PEDI", pa.string()),
+    ("FECHA_DOC", pa.date32()), ("FECHA_VEN", pa.date32()), ("MONEDA", pa.string()),
+    ("TIPCAMB", pa.float64()), ("IMPORTE", pa.float64()), ("IMPORTEME", pa.float64()),
+    ("VENDEDOR", pa.string()), ("SINCRONIZADO", pa.int8()), ("HASH_CONTENIDO", pa.string()),
+]) if pa is not None else None
+
+def disponibles():
+    """Instantáneas activas: pyarrow instalado y INSTANTANEAS distinto de 0"""
+    return pa is not None and os.getenv("INSTANTANEAS", "1") != "0"
+
+def _columna(valores, tipo):
+    """Normaliza los valores de Firebird (Decimal, datetime) al tipo de la columna"""
+    if pa.types.is_floating(tipo):
+        valores = [None if valor is None else float(valor) for valor in valores]
+    elif pa.types.is_date(tipo):
+        valores = [valor.date() if isinstance(valor, datetime) else valor for valor in valores]
+    return pa.array(valores, type=tipo)
+
+def a_tabla(lote):
+    """Lote de filas (tuplas en el orden de COLUMNAS) → tabla de Arrow"""
+    if not lote:
+        return ESQUEMA.empty_table()
+    columnas = list(zip(*lote))
+    return pa.Table.from_arrays(
+        [_columna(valores, campo.type) for valores, campo in zip(columnas, ESQUEMA)], schema=ESQUEMA
+    )
+
+def a_filas(tabla):
+    """Tabla de Arrow → filas (tuplas en el orden de COLUMNAS)"""
+    return list(zip(*(columna.to_pylist() for columna in tabla.columns)))
+
+def meses_del_rango(fecha_inicio, fecha_fin):
+    """Meses "AAAA-MM" que toca el rango de fechas"""
+    meses = []
+    anio, mes = fecha_inicio.year, fecha_inicio.month
+    while (anio, mes) <= (fecha_fin.year, fecha_fin.month):
+        meses.append(f"{anio:04d}-{mes:02d}")
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+class Instantanea:
+    """Instantánea de una empresa para la ventana de fechas de una transferencia.
+
+    Cada lote extraído se escribe en cuanto llega al archivo temporal de su
+    mes (un ParquetWriter por mes), así la memoria no crece con la ventana;
+    guardar() los pone en lugar de los archivos del mes y descartar() los borra.
+    """
+
+    def __init__(self, numero, fecha_inicio=None, fecha_fin=None, filtrar=True, directorio=None):
+        self.directorio = Path(directorio or DIRECTORIO) / numero
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.filtrar = filtrar  # False: se registra todo y se carga todo (modo completo)
+        self._escritores = {}  # Mes → ParquetWriter sobre su archivo temporal
+        self._filas = {}  # Mes → filas escritas en su archivo temporal
+        self._claves = None  # CVE_DOC|HASH de la instantánea anterior en la ventana
+
+    def ruta(self, mes):
+        return self.directorio / f"{mes}.parquet"
+
+    def temporal(self, mes):
+        return self.ruta(mes).with_suffix(".tmp")
+
+    def meses(self):
+        """Meses con instantánea guardada, en orden"""
+        return sorted(ruta.stem for ruta in self.directorio.glob("*.parquet"))
+
+    def leer_mes(self, mes, mapear=True):
+        """Tabla guardada del mes, o None si no hay.
+
+        Con mapear=False se lee a memoria propia: la tabla no retiene el
+        archivo y este se puede reemplazar (en Windows no se puede
+        reemplazar un archivo mapeado).
+        """
+        ruta = self.ruta(mes)
+        if not ruta.exists():
+            return None
+        return pq.read_table(ruta, memory_map=mapear).cast(ESQUEMA)
+
+    def _fuera_de_ventana(self, mes):
+        """Filas guardadas del mes fuera de la ventana (se conservan al reemplazarlo), o None si no hay archivo"""
+        anterior = self.leer_mes(mes, mapear=False)
+        if anterior is None:
+            return None
+        fuera = pc.or_(
+            pc.less(anterior["FECHA_DOC"], pa.scalar(self.fecha_inicio, pa.date32())),
+            pc.greater(anterior["FECHA_DOC"], pa.scalar(self.fecha_fin, pa.date32()))
+        )
+        return anterior.filter(fuera)
+
+    def _claves_anteriores(self):
+        if self._claves is None:
+            tablas = [tabla for tabla in map(self.leer_mes, meses_del_rango(self.fecha_inicio, self.fecha_fin))
+                      if tabla is not None]
+            self._claves = pa.concat_arrays([
+                pc.binary_join_element_wise(tabla["CVE_DOC"], tabla["HASH_CONTENIDO"], "|").combine_chunks()
+                for tabla in tablas
+            ]) if tablas else pa.array([], type=pa.string())
+        return self._claves
+
+    def _escribir(self, tabla):
+        """Agrega las filas al archivo temporal de su mes; el primero de cada mes arranca con sus filas fuera de la ventana"""
+        claves_mes = pc.add(pc.multiply(pc.year(tabla["FECHA_DOC"]), 100), pc.month(tabla["FECHA_DOC"]))
+        for clave in pc.unique(claves_mes).to_pylist():
+            mes = f"{clave // 100:04d}-{clave % 100:02d}"
+            escritor = self._escritores.get(mes)
+            if escritor is None:
+                self.directorio.mkdir(parents=True, exist_ok=True)
+                escritor = self._escritores[mes] = pq.ParquetWriter(self.temporal(mes), ESQUEMA)
+                self._filas[mes] = 0
+                fuera = self._fuera_de_ventana(mes)
+                if fuera is not None and fuera.num_rows:
+                    escritor.write_table(fuera)
+                    self._filas[mes] += fuera.num_rows
+            filas = tabla.filter(pc.equal(claves_mes, clave))
+            escritor.write_table(filas)
+            self._filas[mes] += filas.num_rows
+
+    def delta(self, lote):
+        """Registra el lote extraído y retorna solo sus filas nuevas o con hash distinto al de la instantánea"""
+        tabla = a_tabla(lote)
+        self._escribir(tabla)
+        if not self.filtrar:
+            return lote
+        anteriores = self._claves_anteriores()
+        if not len(anteriores):
+            return lote
+        claves = pc.binary_join_element_wise(tabla["CVE_DOC"], tabla["HASH_CONTENIDO"], "|")
+        cambios = pc.indices_nonzero(pc.invert(pc.is_in(claves, value_set=anteriores)))
+        return [lote[indice] for indice in cambios.to_pylist()]
+
+    def guardar(self):
+        """Reemplaza los meses de la ventana: filas anteriores fuera de la ventana + filas extraídas.
+
+        Los documentos de la ventana que ya no salieron en la extracción se
+        descartan. Retorna las filas guardadas.
+        """
+        guardadas = 0
+        for mes in meses_del_rango(self.fecha_inicio, self.fecha_fin):
+            ruta, temporal = self.ruta(mes), self.temporal(mes)
+            escritor = self._escritores.pop(mes, None)
+            if escritor is not None:
+                escritor.close()
+                filas = self._filas.pop(mes)
+            else:
+                # Mes sin filas extraídas: solo quedan las anteriores fuera de la ventana
+                fuera = self._fuera_de_ventana(mes)
+                if fuera is None:
+                    continue
+                filas = fuera.num_rows
+                if filas:
+                    pq.write_table(fuera, temporal)
+            if not filas:
+                ruta.unlink(missing_ok=True)
+                temporal.unlink(missing_ok=True)
+                continue
+            # Escritura atómica: un lector nunca ve un archivo a medias
+            os.replace(temporal, ruta)
+            guardadas += filas
+        return guardadas
+
+    def descartar(self):
+        """Cierra y borra los archivos temporales sin tocar la instantánea guardada"""
+        for mes, escritor in self._escritores.items():
+            escritor.close()
+            self.temporal(mes).unlink(missing_ok=True)
+        self._escritores.clear()
+        self._filas.clear()
+
+    def leer(self, meses=None, tamano_lote=5000):
+        """Lotes de filas de los meses indicados (todos si se omiten), listos para cargar_lote"""
+        for mes in meses or self.meses():
+            tabla = self.leer_mes(mes)
+            if tabla is None:
+                print(f"❌ No hay instantánea del mes {mes}")
+                continue
+            for bloque in tabla.to_batches(max_chunksize=tamano_lote):
+                yield a_filas(bloque)
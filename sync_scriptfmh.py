@@ -1,14 +1,51 @@
+import os
+import sys
+import time
 import requests
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    response = requests.post(
-        "http://localhost:8005/sync-recent-invoicesfmh",
-        headers={"Content-Type": "application/json"}
-    )
-    logger.info(f"Sync executed: {response.json()}")
-except Exception as e:
-    logger.error(f"Sync failed: {str(e)}")
\ No newline at end of file
+BASE_URL = os.getenv("SYNC_BASE_URL", "http://localhost:8005")
+POLL_INTERVAL = int(os.getenv("SYNC_POLL_INTERVAL", 10))  # Segundos entre consultas de avance
+MAX_WAIT = int(os.getenv("SYNC_MAX_WAIT", 3600))  # Segundos máximos de espera del trabajo
+REQUEST_TIMEOUT = 30
+
+def main() -> int:
+    try:
+        response = requests.post(
+            f"{BASE_URL}/sync-recent-invoicesfmh",
+            headers={"Content-Type": "application/json"},
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        job = response.json()
+        job_id = job["job_id"]
+        logger.info(f"Sync job {job_id} ({job['status']})")
+
+        deadline = time.monotonic() + MAX_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            status = requests.get(f"{BASE_URL}/jobs/{job_id}", timeout=REQUEST_TIMEOUT).json()
+            logger.info(
+                f"Job {job_id}: {status['status']} {status['processed']}/{status['total']} "
+                f"({status['items_per_second']} items/s, {status['failed_items']} failed)"
+            )
+            if status["status"] == "completed":
+                logger.info(f"Sync executed: {status['synced_items']} synced, {status['failed_items']} failed")
+                for failure in status["failures"]["items"]:
+                    logger.warning(f"Failed {failure['CVE_DOC']}: {failure.get('error')}")
+                return 0
+            if status["status"] == "failed":
+                logger.error(f"Sync failed: {status['error']}")
+                return 1
+
+        logger.error(f"Sync job {job_id} did not finish within {MAX_WAIT}s")
+        return 1
+    except Exception as e:
+        logger.error(f"Sync failed: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
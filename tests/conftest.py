@@ -0,0 +1,85 @@
+import os
+
+# Configuración ficticia antes de importar los módulos: las pruebas nunca tocan SQL Server ni Monday
+os.environ.update({
+    "SQL_SERVER": "pruebas",
+    "SQL_DATABASE": "pruebas",
+    "SQL_USER": "pruebas",
+    "SQL_PASSWORD": "pruebas",
+    "MONDAY_API_KEY": "pruebas",
+    "MONDAY_BOARD_ID": "100",
+    "MONDAY_API_URL": "https://monday.invalid/v2",
+    "COMPANIES": "",
+})
+
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from config.settings import get_settings
+from config.companies import Company
+import config.companies as companies_module
+import core.ledger as ledger_module
+import core.monday_client as monday_client_module
+from core.database import Base
+from models.entities import invoice_model
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Configuración real de la app; monkeypatch.setattr(settings, ...) se revierte al terminar la prueba"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "MONDAY_RETRY_BASE_DELAY", 0.0)
+    return settings
+
+@pytest.fixture
+def companies(monkeypatch):
+    """Fija las empresas configuradas: companies(Company(...), ...)"""
+    def configure(*items):
+        monkeypatch.setattr(companies_module, "_companies", list(items))
+        return list(items)
+    configure(Company(number="03", board_id="100"))
+    return configure
+
+@pytest.fixture(autouse=True)
+def ledger_dir(tmp_path, monkeypatch):
+    """Registro local en un directorio temporal por prueba"""
+    monkeypatch.setattr(get_settings(), "MONDAY_LEDGER_PATH", str(tmp_path / "monday_ledger.sqlite3"))
+    monkeypatch.setattr(ledger_module, "_ledgers", {})
+    yield tmp_path
+    for ledger in ledger_module._ledgers.values():
+        ledger.close()
+
+@pytest.fixture(autouse=True)
+def group_cache(monkeypatch):
+    """Cache de grupos compartido vacío en cada prueba"""
+    cache = monday_client_module.GroupCache()
+    monkeypatch.setattr(monday_client_module, "group_cache", cache)
+    return cache
+
+@pytest.fixture
+def db():
+    """Sesión sobre SQLite en memoria con SQLFACTF03"""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    invoice_model("03")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+@pytest.fixture
+def add_invoices(db):
+    """Inserta documentos en SQLFACTF03: add_invoices(["D1", "D2"], synced=True)"""
+    model = invoice_model("03")
+
+    def add(cve_docs, synced=False, **values):
+        for cve_doc in cve_docs:
+            db.add(model(
+                CVE_DOC=cve_doc, NOMBRE=values.get("NOMBRE", f"CLIENTE {cve_doc}"), CVE_PEDI="P1",
+                FECHA_DOC=datetime(2026, 1, 15), FECHA_VEN=datetime(2026, 2, 15), MONEDA="Pesos",
+                TIPCAMB=1.0, IMPORTE=100.0, IMPORTEME=100.0, VENDEDOR="V1",
+                SINCRONIZADO=synced, ACTUALIZAR=False
+            ))
+        db.commit()
+    return add
@@ -0,0 +1,35 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from core.column_map import compile_column_map, parse_column_map
+
+def invoice(**values):
+    row = dict(CVE_DOC="D1", NOMBRE="ACME", FECHA_DOC=datetime(2026, 1, 15), IMPORTE=100.0)
+    row.update(values)
+    return SimpleNamespace(**row)
+
+def test_parse_column_map_ignores_blank_entries():
+    assert parse_column_map("NOMBRE:text_1, FECHA_DOC:date4,") == [("NOMBRE", "text_1"), ("FECHA_DOC", "date4")]
+
+@pytest.mark.parametrize("value", ["NOMBRE", "NOMBRE:", ",,"])
+def test_parse_column_map_rejects_incomplete_entries(value):
+    with pytest.raises(ValueError):
+        parse_column_map(value)
+
+def test_compiled_map_builds_payload():
+    to_payload = compile_column_map(parse_column_map("NOMBRE:text_1,FECHA_DOC:date4,IMPORTE:num_1"), "CVE_DOC")
+
+    payload = to_payload(invoice())
+
+    assert payload.name == "D1"
+    assert payload.column_values == {"text_1": "ACME", "date4": "2026-01-15T00:00:00", "num_1": 100.0}
+
+def test_compiled_map_keeps_missing_dates_and_single_column():
+    to_payload = compile_column_map([("FECHA_DOC", "date4")], "NOMBRE")
+
+    assert to_payload(invoice(FECHA_DOC=None)) == ("ACME", {"date4": None})
+
+@pytest.mark.parametrize("pairs, name_field", [([("NO_EXISTE", "text_1")], "CVE_DOC"), ([("NOMBRE", "text_1")], "NO_EXISTE")])
+def test_compile_rejects_unknown_columns(pairs, name_field):
+    with pytest.raises(ValueError, match="NO_EXISTE"):
+        compile_column_map(pairs, name_field)
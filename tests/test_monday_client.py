@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+import httpx
+import pytest
+import requests
+from core.monday_async_client import AsyncMondayClient
+from core.monday_client import BaseMondayClient, MondayClient
+from core.rate_limiter import ComplexityBudget
+
+ITEMS = [{"key": "D1", "item_name": "D1", "column_values": {}, "group_id": "g1"}]
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data if data is not None else {"data": {"item_0": {"id": "9"}}}
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+def sync_client(monkeypatch, outcomes):
+    """Cliente cuyo POST entrega en orden las respuestas o excepciones indicadas"""
+    client = MondayClient(budget=ComplexityBudget())
+    calls = []
+
+    def post(url, data=None, timeout=None):
+        calls.append(data)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client.session, "post", post)
+    return client, calls
+
+def connect_error():
+    """Falla real de conexión (nada escucha en el puerto 9)"""
+    try:
+        requests.post("http://127.0.0.1:9/", timeout=2)
+    except requests.exceptions.ConnectionError as e:
+        return e
+    pytest.skip("el puerto 9 acepta conexiones")
+
+def test_mutation_not_retried_after_read_timeout(monkeypatch, settings):
+    client, calls = sync_client(monkeypatch, [requests.exceptions.ReadTimeout("lectura"), FakeResponse()])
+
+    results = client.create_items("100", ITEMS)
+
+    assert len(calls) == 1
+    assert results["D1"]["id"] is None
+
+def test_mutation_not_retried_after_5xx(monkeypatch, settings):
+    client, calls = sync_client(monkeypatch, [FakeResponse(502, {}), FakeResponse()])
+
+    results = client.create_items("100", ITEMS)
+
+    assert len(calls) == 1
+    assert results["D1"]["id"] is None
+
+def test_mutation_retried_after_connect_error(monkeypatch, settings):
+    client, calls = sync_client(monkeypatch, [connect_error(), FakeResponse()])
+
+    assert client.create_items("100", ITEMS)["D1"]["id"] == "9"
+    assert len(calls) == 2
+
+def test_mutation_retried_when_throttled(monkeypatch, settings):
+    client, calls = sync_client(monkeypatch, [FakeResponse(429, {}), FakeResponse()])
+
+    assert client.create_items("100", ITEMS)["D1"]["id"] == "9"
+    assert len(calls) == 2
+
+def test_query_retried_after_read_timeout_and_5xx(monkeypatch, settings):
+    page = {"data": {"boards": [{"items_page": {"items": [{"id": "1", "name": "D1"}], "cursor": None}}]}}
+    client, calls = sync_client(
+        monkeypatch, [requests.exceptions.ReadTimeout("lectura"), FakeResponse(503, {}), FakeResponse(200, page)]
+    )
+
+    assert list(client.iter_board_items("100")) == [[{"id": "1", "name": "D1"}]]
+    assert len(calls) == 3
+
+def run_async(outcomes, operation):
+    """Ejecuta _post del cliente asíncrono contra un transporte simulado; retorna (resultado o excepción, llamadas)"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome[0], json=outcome[1])
+
+    async def run():
+        client = AsyncMondayClient(budget=ComplexityBudget(), max_concurrency=1)
+        client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client._semaphore = asyncio.BoundedSemaphore(1)
+        try:
+            return await client._post("mutation { x }" if operation != "query" else "query { x }", operation)
+        except httpx.HTTPError as e:
+            return e
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run()), calls
+
+@pytest.mark.parametrize("outcome", [httpx.ReadTimeout("lectura"), httpx.RemoteProtocolError("cortada"), (500, {})])
+def test_async_mutation_not_retried_after_reaching_monday(outcome, settings):
+    result, calls = run_async([outcome, (200, {"data": {}})], "create_items")
+
+    assert isinstance(result, httpx.HTTPError)
+    assert len(calls) == 1
+
+@pytest.mark.parametrize("outcome", [httpx.ConnectError("sin conexión"), httpx.ConnectTimeout("conexión"), (429, {})])
+def test_async_mutation_retried_before_reaching_monday(outcome, settings):
+    result, calls = run_async([outcome, (200, {"data": {}})], "create_items")
+
+    assert result == {"data": {}}
+    assert len(calls) == 2
+
+def test_async_query_retried_after_read_timeout(settings):
+    result, calls = run_async([httpx.ReadTimeout("lectura"), (200, {"data": {}})], "query")
+
+    assert result == {"data": {}}
+    assert len(calls) == 2
+
+def test_retry_delay_classification(settings):
+    client = BaseMondayClient(budget=ComplexityBudget())
+
+    assert client._retry_delay(502, {}, {}, 0, "items_page") is not None
+    assert client._retry_delay(502, {}, {}, 0, "create_items") is None
+    assert client._retry_delay(429, {}, {}, 0, "create_items") is not None
+    assert client._retry_delay(400, {}, {}, 0, "items_page") is None
+    assert client._retry_delay(429, {}, {}, settings.MONDAY_MAX_RETRIES, "items_page") is None
+
+@pytest.mark.parametrize("result, expected", [
+    ({"errors": [{"message": "x", "extensions": {"code": "InvalidGroupIdException"}}]}, True),
+    ({"errors": [{"message": "Group not found"}]}, False),
+    ({"errors": [{"message": "x", "extensions": {"code": "ColumnValueException"}}]}, False),
+    ({"error_code": "InvalidGroupIdException", "error_message": "bad group"}, True),
+])
+def test_is_group_error(result, expected):
+    assert BaseMondayClient.is_group_error(result) is expected
+
+def test_is_group_error_keeps_legacy_code_through_batch_parsing():
+    data = {"error_code": "InvalidGroupIdException", "error_message": "bad group", "status_code": 200}
+
+    results = BaseMondayClient._parse_batch([{"key": "D1"}], data)
+
+    assert BaseMondayClient.is_group_error(results["D1"])
+
+def test_concurrent_clients_create_each_month_group_once(monkeypatch, settings):
+    created = []
+
+    def post(url, data=None, timeout=None):
+        if b"create_group" in data:
+            time.sleep(0.05)  # Ventana en la que el otro cliente también vería el cache vacío
+            created.append(data)
+            return FakeResponse(200, {"data": {"create_group": {"id": f"g{len(created)}"}}})
+        return FakeResponse(200, {"data": {"boards": [{"groups": []}]}})
+
+    clients = [MondayClient(budget=ComplexityBudget()) for _ in range(4)]
+    for client in clients:
+        monkeypatch.setattr(client.session, "post", post)
+    results = []
+    threads = [
+        threading.Thread(target=lambda client=client: results.append(client.resolve_groups("100", [datetime(2026, 3, 9)])))
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert results == [{"mar-2026": "g1"}] * 4
+
+def test_companies_on_a_shared_board_create_each_month_group_once(settings):
+    created = []
+
+    async def handler(request):
+        if b"create_group" in request.content:
+            await asyncio.sleep(0.05)  # Ventana en la que la otra empresa también vería el cache vacío
+            created.append(request)
+            return httpx.Response(200, json={"data": {"create_group": {"id": f"g{len(created)}"}}})
+        return httpx.Response(200, json={"data": {"boards": [{"groups": []}]}})
+
+    async def run():
+        # Un cliente por empresa, como get_async_monday_client con COMPANIES=03,05 sin tablero propio
+        clients = [AsyncMondayClient(budget=ComplexityBudget(), max_concurrency=2) for _ in range(2)]
+        for client in clients:
+            client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            client._semaphore = asyncio.BoundedSemaphore(2)
+        try:
+            return await asyncio.gather(*(client.resolve_groups("100", [datetime(2026, 3, 9)]) for client in clients))
+        finally:
+            for client in clients:
+                await client.aclose()
+
+    assert asyncio.run(run()) == [{"mar-2026": "g1"}] * 2
+    assert len(created) == 1
@@ -0,0 +1,81 @@
+import pytest
+from config.companies import Company
+from core.ledger import get_monday_ledger
+from models.entities import invoice_model
+from services.reconcile_service import ReconcileService
+
+class FakeBoardClient:
+    """Tablero de Monday en memoria: [(id, nombre)]"""
+
+    def __init__(self, items):
+        self.items = items
+        self.deleted = []
+
+    def iter_board_items(self, board_id):
+        yield [{"id": item_id, "name": name} for item_id, name in self.items]
+
+    def delete_items(self, item_ids):
+        self.deleted.extend(item_ids)
+        return {item_id: {"id": item_id, "errors": []} for item_id in item_ids}
+
+def flags(db):
+    model = invoice_model("03")
+    return {row.CVE_DOC: (row.SINCRONIZADO, row.ACTUALIZAR) for row in db.query(model)}
+
+def test_report_without_fix_changes_nothing(db, add_invoices, companies, settings):
+    add_invoices(["D1"], synced=True)
+    add_invoices(["D2"])
+    client = FakeBoardClient([("1", "D1"), ("2", "D1"), ("3", "D2")])
+
+    report = ReconcileService(client=client, company=Company(number="03", board_id="100")).reconcile(db)
+
+    assert report["duplicates"]["items"] == [{"CVE_DOC": "D1", "ids": ["1", "2"]}]
+    assert report["unsynced_existing"]["items"] == ["D2"]
+    assert "fixed" not in report
+    assert client.deleted == []
+    assert flags(db) == {"D1": (True, False), "D2": (False, False)}
+
+def test_fix_only_touches_documents_of_the_company(db, add_invoices, companies, settings):
+    add_invoices(["D1", "D3"], synced=True)
+    add_invoices(["D2"])
+    # OTRO no es documento de SQLFACTF03: sus dos ítems no se tocan
+    client = FakeBoardClient([("1", "D1"), ("2", "D1"), ("3", "OTRO"), ("4", "OTRO"), ("5", "D2")])
+
+    report = ReconcileService(client=client, company=Company(number="03", board_id="100")).reconcile(db, fix=True)
+
+    assert client.deleted == ["2"]
+    assert report["fixed"] == {"marked_unsynced": 1, "duplicates_deleted": 1, "duplicates_failed": 0, "adopted": 1}
+    # D3 no tiene ítem: vuelve a pendiente; D2 ya tenía ítem: se adopta y se refrescan sus columnas
+    assert flags(db) == {"D1": (True, False), "D2": (True, True), "D3": (False, False)}
+    assert get_monday_ledger("03").lookup(["D2"])["D2"][0] == "5"
+
+def test_fix_keeps_the_item_in_the_ledger(db, add_invoices, companies, settings):
+    add_invoices(["D1"], synced=True)
+    get_monday_ledger("03").record([("D1", "7", "hash", None)])
+    client = FakeBoardClient([("1", "D1"), ("7", "D1")])
+
+    ReconcileService(client=client, company=Company(number="03", board_id="100")).reconcile(db, fix=True)
+
+    assert client.deleted == ["1"]
+
+def test_fix_refused_on_shared_board(db, add_invoices, companies, settings):
+    company, _ = companies(Company(number="03", board_id="100"), Company(number="05", board_id="100"))
+    add_invoices(["D1"], synced=True)
+    client = FakeBoardClient([("1", "D1"), ("2", "D1")])
+
+    with pytest.raises(ValueError, match="05"):
+        ReconcileService(client=client, company=company).reconcile(db, fix=True)
+    assert client.deleted == []
+    assert ReconcileService(client=client, company=company).reconcile(db)["duplicates"]["total"] == 1
+
+def test_fix_refused_when_item_name_is_not_cve_doc(db, add_invoices, companies, settings, monkeypatch):
+    monkeypatch.setattr(settings, "MONDAY_ITEM_NAME_COLUMN", "NOMBRE")
+    add_invoices(["D1"], synced=True, NOMBRE="ACME")
+    add_invoices(["D2"], synced=True, NOMBRE="ACME")
+    client = FakeBoardClient([("1", "ACME")])
+    service = ReconcileService(client=client, company=Company(number="03", board_id="100"))
+
+    with pytest.raises(ValueError, match="MONDAY_ITEM_NAME_COLUMN"):
+        service.reconcile(db, fix=True)
+    # Sin fix el tablero se compara por el nombre configurado
+    assert service.reconcile(db)["missing"]["total"] == 0
@@ -0,0 +1,48 @@
+from datetime import date
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from snapshotfb import Instantanea
+
+def fila(cve_doc, fecha, hash_contenido="h1"):
+    return (cve_doc, "CLIENTE", "P1", fecha, fecha, "Pesos", 1.0, 100.0, 100.0, "V1", 0, hash_contenido)
+
+def claves(instantanea, mes):
+    return sorted(instantanea.leer_mes(mes)["CVE_DOC"].to_pylist())
+
+def test_guardar_replaces_window_and_keeps_older_rows(tmp_path):
+    primera = Instantanea("03", date(2026, 1, 1), date(2026, 2, 28), directorio=tmp_path)
+    primera.delta([fila("A", date(2026, 1, 5)), fila("B", date(2026, 1, 20)), fila("C", date(2026, 2, 3))])
+    assert primera.guardar() == 3
+
+    # Ventana desde el 15 de enero: A queda fuera y se conserva; B ya no salió y se descarta
+    segunda = Instantanea("03", date(2026, 1, 15), date(2026, 2, 28), directorio=tmp_path)
+    segunda.delta([fila("C", date(2026, 2, 3)), fila("D", date(2026, 2, 10))])
+    assert segunda.guardar() == 3
+
+    assert claves(segunda, "2026-01") == ["A"]
+    assert claves(segunda, "2026-02") == ["C", "D"]
+    assert not list(tmp_path.glob("03/*.tmp"))
+
+def test_delta_returns_only_new_or_changed_rows(tmp_path):
+    inicial = Instantanea("03", date(2026, 1, 1), date(2026, 1, 31), directorio=tmp_path)
+    inicial.delta([fila("A", date(2026, 1, 5)), fila("B", date(2026, 1, 6))])
+    inicial.guardar()
+
+    incremental = Instantanea("03", date(2026, 1, 1), date(2026, 1, 31), directorio=tmp_path)
+    delta = incremental.delta([fila("A", date(2026, 1, 5)), fila("B", date(2026, 1, 6), "h2"), fila("C", date(2026, 1, 7))])
+
+    assert [row[0] for row in delta] == ["B", "C"]
+
+def test_descartar_leaves_saved_snapshot_untouched(tmp_path):
+    inicial = Instantanea("03", date(2026, 1, 1), date(2026, 1, 31), directorio=tmp_path)
+    inicial.delta([fila("A", date(2026, 1, 5))])
+    inicial.guardar()
+
+    fallida = Instantanea("03", date(2026, 1, 1), date(2026, 1, 31), filtrar=False, directorio=tmp_path)
+    fallida.delta([fila("Z", date(2026, 1, 9))])
+    fallida.descartar()
+
+    assert claves(fallida, "2026-01") == ["A"]
+    assert not list(tmp_path.glob("03/*.tmp"))
@@ -0,0 +1,35 @@
+from config.companies import Company
+from core.ledger import get_monday_ledger, payload_hash
+from services.sql_service import SQLService
+
+def test_iter_sync_flags_pages_by_key(db, add_invoices, settings):
+    add_invoices([f"D{i:02d}" for i in range(7)], synced=True)
+    add_invoices(["D07"])
+
+    pages = list(SQLService(db, Company(number="03", board_id="100")).iter_sync_flags(page_size=3))
+
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert [row.CVE_DOC for page in pages for row in page] == [f"D{i:02d}" for i in range(8)]
+    assert tuple(pages[-1][-1]) == ("D07", False, "D07")
+
+def test_iter_sync_flags_uses_item_name_field(db, add_invoices, settings):
+    add_invoices(["D1"], NOMBRE="ACME")
+
+    pages = list(SQLService(db, Company(number="03", board_id="100")).iter_sync_flags(name_field="NOMBRE"))
+
+    assert [tuple(row) for row in pages[0]] == [("D1", False, "ACME")]
+
+def test_ledger_record_lookup_and_forget(settings):
+    ledger = get_monday_ledger("03")
+    values = {"text_1": "ACME"}
+
+    ledger.record([("D1", "9", payload_hash("D1", values), values)])
+
+    assert ledger.lookup(["D1", "D2"]) == {"D1": ("9", payload_hash("D1", values))}
+    assert ledger.lookup_payloads(["D1"])["D1"][2] == values
+    ledger.forget(["D1"])
+    assert ledger.lookup(["D1"]) == {}
+
+def test_payload_hash_ignores_key_order():
+    assert payload_hash("D1", {"a": 1, "b": 2}) == payload_hash("D1", {"b": 2, "a": 1})
+    assert payload_hash("D1", {"a": 1}) != payload_hash("D2", {"a": 1})
@@ -1,22 +1,623 @@
 from datetime import datetime, timedelta
+import hashlib
+import queue
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import fdb
 import pyodbc
 from settingsfb import load_configurations, ConfigError
+from config.companies import DEFAULT_COMPANY, get_companies, parse_company_numbers
+from core.metrics import StageTimes, write_transfer_snapshot
+from snapshotfb import Instantanea, disponibles as instantaneas_disponibles
 import os
 
-def exportar_registros():
+COLUMNAS = "CVE_DOC, NOMBRE, CVE_PEDI, FECHA_DOC, FECHA_VEN, MONEDA, TIPCAMB, IMPORTE, IMPORTEME, VENDEDOR, SINCRONIZADO, HASH_CONTENIDO"
+FIN_LOTES = object()  # Marca de fin que el productor deja en la cola
+
+# {n} = número de empresa de Aspel (FACTF03, CLIE03...). Solo columnas de FACTFnn: el cliente,
+# la moneda y el vendedor se resuelven con el cache de dimensiones en lugar de un JOIN en el servidor
+SELECT_FACTURAS = """
+SELECT f.CVE_DOC, f.CVE_CLPV, f.CVE_PEDI, CAST(f.FECHA_DOC AS DATE) AS FECHA_DOC, f.FECHA_VEN, f.NUM_MONED, f.TIPCAMB, f.IMPORTE,
+(CASE WHEN f.TIPCAMB = 0 THEN 0 ELSE f.IMPORTE / f.TIPCAMB END) AS IMPORTEME, f.CVE_VEND
+FROM FACTF{n} f
+"""
+
+FILTRO_FECHAS = """WHERE CAST(FECHA_DOC AS DATE) BETWEEN ? AND ?
+ORDER BY 4, 1
+"""
+
+# Captura por eventos: un trigger en FACTFnn anota el documento en la bitácora y avisa con POST_EVENT
+MAX_CLAVES_IN = 1000  # Firebird admite hasta 1500 valores en un IN
+DDL_CAPTURA = (
+    ("RDB$RELATIONS", "RDB$RELATION_NAME", "FACTF{n}_CAMBIOS", """
+    CREATE TABLE FACTF{n}_CAMBIOS (
+        CVE_DOC VARCHAR(50) NOT NULL PRIMARY KEY,
+        CAMBIO_ID BIGINT NOT NULL
+    )
+    """),
+    ("RDB$GENERATORS", "RDB$GENERATOR_NAME", "FACTF{n}_CAMBIOS_GEN", "CREATE GENERATOR FACTF{n}_CAMBIOS_GEN"),
+    ("RDB$TRIGGERS", "RDB$TRIGGER_NAME", "FACTF{n}_CAPTURA", """
+    CREATE TRIGGER FACTF{n}_CAPTURA FOR FACTF{n}
+    ACTIVE AFTER INSERT OR UPDATE POSITION 100
+    AS
+    BEGIN
+        UPDATE OR INSERT INTO FACTF{n}_CAMBIOS (CVE_DOC, CAMBIO_ID)
+        VALUES (NEW.CVE_DOC, GEN_ID(FACTF{n}_CAMBIOS_GEN, 1)) MATCHING (CVE_DOC);
+        POST_EVENT 'FACTF{n}_CAMBIO';
+    END
+    """),
+)
+
+# Cache de dimensiones: clientes en memoria como máximo y segundos entre refrescos
+MAX_CLIENTES = int(os.getenv("DIM_MAX_CLIENTES", 50000))
+REFRESCO_DIMENSIONES = float(os.getenv("DIM_REFRESCO_SEGUNDOS", 300))
+MARCA_DIMENSIONES = "VERSION_SINC"  # Marca de modificación de los catálogos de Aspel
+AUSENTE = object()  # Llave que no existe en el catálogo (el JOIN descartaba el documento)
+
+class Dimension:
+    """Llave → descripción de un catálogo de Aspel (CLIEnn, MONEDnn, VENDnn).
+
+    Sin límite se carga completo; con límite se llena bajo demanda y
+    expulsa la llave usada hace más tiempo. Si el catálogo tiene
+    VERSION_SINC se refresca solo lo modificado; si no, se vuelve a cargar.
+    """
+
+    def __init__(self, tabla, llave, columna, limite=None):
+        self.tabla = tabla
+        self.llave = llave
+        self.columna = columna
+        self.limite = limite
+        self.valores = OrderedDict()
+        self.con_marca = None  # Se detecta en la primera carga
+        self.marca = None
+
+    def _consultar(self, cursor, filtro="", params=()):
+        columnas = f"{self.llave}, {self.columna}" + (f", {MARCA_DIMENSIONES}" if self.con_marca else "")
+        cursor.execute(f"SELECT {columnas} FROM {self.tabla} {filtro}", params)
+        filas = cursor.fetchall()
+        if self.con_marca:
+            marcas = [fila[2] for fila in filas if fila[2] is not None]
+            if marcas and (self.marca is None or max(marcas) > self.marca):
+                self.marca = max(marcas)
+        return filas
+
+    def _guardar(self, llave, valor):
+        self.valores[llave] = valor
+        self.valores.move_to_end(llave)
+        if self.limite is not None:
+            while len(self.valores) > self.limite:
+                self.valores.popitem(last=False)
+
+    def refrescar(self, cursor):
+        """Carga inicial o refresco incremental por VERSION_SINC"""
+        if self.con_marca is None:
+            cursor.execute(
+                "SELECT COUNT(*) FROM RDB$RELATION_FIELDS WHERE TRIM(RDB$RELATION_NAME) = ? AND TRIM(RDB$FIELD_NAME) = ?",
+                (self.tabla, MARCA_DIMENSIONES)
+            )
+            self.con_marca = bool(cursor.fetchone()[0])
+            if self.con_marca and self.limite is not None:
+                # Los clientes se cargan bajo demanda; basta con saber desde dónde refrescar
+                cursor.execute(f"SELECT MAX({MARCA_DIMENSIONES}) FROM {self.tabla}")
+                self.marca = cursor.fetchone()[0]
+                return
+        elif self.con_marca and self.marca is not None:
+            for fila in self._consultar(cursor, f"WHERE {MARCA_DIMENSIONES} > ?", (self.marca,)):
+                # Con límite solo se actualizan las llaves que ya están en memoria
+                if self.limite is None or fila[0] in self.valores:
+                    self._guardar(fila[0], fila[1])
+            return
+
+        self.valores.clear()
+        if self.limite is None:
+            for fila in self._consultar(cursor):
+                self._guardar(fila[0], fila[1])
+
+    def resolver(self, cursor, llaves):
+        """Descripción de cada llave; las que faltan se leen en bloques de MAX_CLAVES_IN"""
+        resultado = {}
+        faltantes = []
+        for llave in llaves:
+            if llave is None:
+                resultado[llave] = AUSENTE
+            elif llave in self.valores:
+                self.valores.move_to_end(llave)
+                resultado[llave] = self.valores[llave]
+            else:
+                faltantes.append(llave)
+        for inicio in range(0, len(faltantes), MAX_CLAVES_IN):
+            parte = faltantes[inicio:inicio + MAX_CLAVES_IN]
+            encontradas = {
+                fila[0]: fila[1]
+                for fila in self._consultar(cursor, f"WHERE {self.llave} IN ({', '.join('?' * len(parte))})", tuple(parte))
+            }
+            for llave in parte:
+                resultado[llave] = encontradas.get(llave, AUSENTE)
+                self._guardar(llave, resultado[llave])
+        return resultado
+
+class CacheDimensiones:
+    """Clientes, monedas y vendedores de una empresa para armar las filas de SQLFACTFnn en Python"""
+
+    def __init__(self, numero):
+        self.clientes = Dimension(f"CLIE{numero}", "CLAVE", "NOMBRE", limite=MAX_CLIENTES)
+        self.monedas = Dimension(f"MONED{numero}", "NUM_MONED", "DESCR")
+        self.vendedores = Dimension(f"VEND{numero}", "CVE_VEND", "NOMBRE")
+        self.actualizado = None
+        self._lock = threading.Lock()
+
+    def resolver(self, cursor, filas):
+        """Convierte filas de FACTFnn (CVE_CLPV, NUM_MONED, CVE_VEND) al orden de COLUMNAS sin el hash.
+
+        Igual que el JOIN, descarta los documentos cuyo cliente, moneda o
+        vendedor no existe. El cursor no debe tener una consulta en curso.
+        """
+        with self._lock:
+            if self.actualizado is None or time.monotonic() - self.actualizado >= REFRESCO_DIMENSIONES:
+                for dimension in (self.clientes, self.monedas, self.vendedores):
+                    dimension.refrescar(cursor)
+                self.actualizado = time.monotonic()
+            clientes = self.clientes.resolver(cursor, {fila[1] for fila in filas})
+            monedas = self.monedas.resolver(cursor, {fila[5] for fila in filas})
+            vendedores = self.vendedores.resolver(cursor, {fila[9] for fila in filas})
+
+        resultado = []
+        for fila in filas:
+            nombre, moneda, vendedor = clientes[fila[1]], monedas[fila[5]], vendedores[fila[9]]
+            if nombre is AUSENTE or moneda is AUSENTE or vendedor is AUSENTE:
+                continue
+            resultado.append((fila[0], nombre, fila[2], fila[3], fila[4], moneda, fila[6], fila[7], fila[8], vendedor, 0))
+        return resultado
+
+class Empresa:
+    """Nombres de tablas, marca de agua y evento de una empresa de Aspel ("03" → FACTF03, SQLFACTF03...)"""
+
+    def __init__(self, numero=DEFAULT_COMPANY):
+        self.numero = numero
+        self.destino = f"SQLFACTF{numero}"
+        self.staging = f"#SQLFACTF{numero}_STAGING"
+        self.proceso = self.destino  # Clave de la marca de agua
+        self.bitacora = f"FACTF{numero}_CAMBIOS"
+        self.evento = f"FACTF{numero}_CAMBIO"
+        self.select_facturas = SELECT_FACTURAS.format(n=numero)
+        self.consulta_facturas = self.select_facturas + FILTRO_FECHAS
+        self.dimensiones = CacheDimensiones(numero)
+
+EMPRESA_PREDETERMINADA = Empresa()
+
+def medir(etapas, nombre):
+    """Mide el bloque en la etapa indicada si se lleva registro de etapas"""
+    return etapas.measure(nombre) if etapas is not None else nullcontext()
+
+def hash_contenido(row):
+    """Hash SHA-256 de las columnas de negocio (NOMBRE..VENDEDOR) para detectar cambios"""
+    valores = []
+    for valor in row[1:10]:
+        if isinstance(valor, float):
+            valor = f"{valor:.6f}"
+        elif hasattr(valor, "isoformat"):
+            valor = valor.isoformat()[:10]
+        valores.append("" if valor is None else str(valor).strip())
+    return hashlib.sha256("|".join(valores).encode("utf-8")).hexdigest()
+
+def asegurar_columnas_cambios(sql_cursor, empresa=EMPRESA_PREDETERMINADA):
+    """Agrega a SQLFACTFnn las columnas de detección de cambios si no existen"""
+    tabla = empresa.destino
+    sql_cursor.execute(f"""
+    IF COL_LENGTH('{tabla}', 'HASH_CONTENIDO') IS NULL
+        ALTER TABLE {tabla} ADD HASH_CONTENIDO CHAR(64) NULL;
+    IF COL_LENGTH('{tabla}', 'ACTUALIZAR') IS NULL
+        ALTER TABLE {tabla} ADD ACTUALIZAR BIT NOT NULL CONSTRAINT DF_{tabla}_ACTUALIZAR DEFAULT 0;
+    """)
+
+def asegurar_tabla_destino(sql_cursor, empresa=EMPRESA_PREDETERMINADA):
+    """Crea SQLFACTFnn si no existe y le agrega las columnas de detección de cambios"""
+    tabla = empresa.destino
+    sql_cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = '{tabla}')
+    CREATE TABLE {tabla} (
+        CVE_DOC VARCHAR(50) PRIMARY KEY,
+        NOMBRE VARCHAR(100),
+        CVE_PEDI VARCHAR(50),               
+        FECHA_DOC DATE NOT NULL,
+        FECHA_VEN DATE NOT NULL,               
+        MONEDA VARCHAR(100),
+        TIPCAMB FLOAT NOT NULL,
+        IMPORTE FLOAT NOT NULL,
+        IMPORTEME FLOAT NOT NULL,
+        VENDEDOR VARCHAR(100),
+        SINCRONIZADO BIT DEFAULT 0,
+        HASH_CONTENIDO CHAR(64) NULL,
+        ACTUALIZAR BIT NOT NULL CONSTRAINT DF_{tabla}_ACTUALIZAR DEFAULT 0
+    )
+    """)
+    asegurar_columnas_cambios(sql_cursor, empresa)
+
+def asegurar_tablas_control(sql_cursor):
+    """Crea la tabla de marcas de agua si no existe"""
+    sql_cursor.execute("""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'TRANSFER_MARCA_AGUA')
+    CREATE TABLE TRANSFER_MARCA_AGUA (
+        PROCESO VARCHAR(50) PRIMARY KEY,
+        ULTIMA_FECHA DATE NOT NULL,
+        ACTUALIZADO DATETIME NOT NULL DEFAULT GETDATE()
+    )
+    """)
+
+def leer_marca_agua(sql_cursor, empresa=EMPRESA_PREDETERMINADA):
+    """Retorna la última FECHA_DOC transferida o None si es la primera carga"""
+    sql_cursor.execute("SELECT ULTIMA_FECHA FROM TRANSFER_MARCA_AGUA WHERE PROCESO = ?", empresa.proceso)
+    row = sql_cursor.fetchone()
+    return row[0] if row else None
+
+def guardar_marca_agua(sql_cursor, fecha, empresa=EMPRESA_PREDETERMINADA):
+    """Avanza la marca de agua (nunca la retrocede)"""
+    sql_cursor.execute("""
+    MERGE TRANSFER_MARCA_AGUA AS t
+    USING (SELECT ? AS PROCESO, ? AS ULTIMA_FECHA) AS s ON t.PROCESO = s.PROCESO
+    WHEN MATCHED AND s.ULTIMA_FECHA > t.ULTIMA_FECHA THEN
+        UPDATE SET ULTIMA_FECHA = s.ULTIMA_FECHA, ACTUALIZADO = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (PROCESO, ULTIMA_FECHA) VALUES (s.PROCESO, s.ULTIMA_FECHA);
+    """, (empresa.proceso, fecha))
+
+def crear_staging(sql_cursor, empresa=EMPRESA_PREDETERMINADA):
+    """Crea la tabla temporal de staging para la sesión actual"""
+    staging = empresa.staging
+    sql_cursor.execute(f"""
+    IF OBJECT_ID('tempdb..{staging}') IS NOT NULL DROP TABLE {staging};
+    CREATE TABLE {staging} (
+        CVE_DOC VARCHAR(50) NOT NULL PRIMARY KEY,
+        NOMBRE VARCHAR(100),
+        CVE_PEDI VARCHAR(50),
+        FECHA_DOC DATE NOT NULL,
+        FECHA_VEN DATE NOT NULL,
+        MONEDA VARCHAR(100),
+        TIPCAMB FLOAT NOT NULL,
+        IMPORTE FLOAT NOT NULL,
+        IMPORTEME FLOAT NOT NULL,
+        VENDEDOR VARCHAR(100),
+        SINCRONIZADO BIT DEFAULT 0,
+        HASH_CONTENIDO CHAR(64) NOT NULL
+    )
+    """)
+
+def fusionar_staging(sql_cursor, empresa=EMPRESA_PREDETERMINADA):
+    """Fusiona staging en SQLFACTFnn; retorna (insertados, actualizados).
+
+    Los documentos nuevos se insertan. Los existentes solo se tocan si su
+    hash cambió: se actualizan los valores y, si ya estaban en Monday, se
+    marcan con ACTUALIZAR = 1 para que la sincronización actualice el ítem.
+    Un hash nulo (filas anteriores a la detección de cambios) solo se llena.
+    """
+    sql_cursor.execute(f"""
+    SET NOCOUNT ON;
+    MERGE {empresa.destino} WITH (HOLDLOCK) AS t
+    USING {empresa.staging} AS s ON t.CVE_DOC = s.CVE_DOC
+    WHEN MATCHED AND (t.HASH_CONTENIDO IS NULL OR t.HASH_CONTENIDO <> s.HASH_CONTENIDO) THEN
+        UPDATE SET
+            NOMBRE = s.NOMBRE, CVE_PEDI = s.CVE_PEDI, FECHA_DOC = s.FECHA_DOC, FECHA_VEN = s.FECHA_VEN,
+            MONEDA = s.MONEDA, TIPCAMB = s.TIPCAMB, IMPORTE = s.IMPORTE, IMPORTEME = s.IMPORTEME,
+            VENDEDOR = s.VENDEDOR, HASH_CONTENIDO = s.HASH_CONTENIDO,
+            ACTUALIZAR = CASE WHEN t.HASH_CONTENIDO IS NOT NULL AND t.SINCRONIZADO = 1 THEN 1 ELSE t.ACTUALIZAR END
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT ({COLUMNAS})
+        VALUES (s.CVE_DOC, s.NOMBRE, s.CVE_PEDI, s.FECHA_DOC, s.FECHA_VEN, s.MONEDA, s.TIPCAMB, s.IMPORTE, s.IMPORTEME, s.VENDEDOR, s.SINCRONIZADO, s.HASH_CONTENIDO)
+    OUTPUT $action;
+    """)
+    acciones = [row[0] for row in sql_cursor.fetchall()]
+    return acciones.count("INSERT"), acciones.count("UPDATE")
+
+def extraer_lotes(firebird_cursor, fecha_inicio, fecha_fin, tamano_lote, cola, etapas=None,
+                  empresa=EMPRESA_PREDETERMINADA):
+    """Productor: lee Firebird con fetchmany y deja cada lote en la cola acotada.
+
+    Retorna los registros leídos, o None si la consulta falló (el error
+    también se deja en la cola para el consumidor).
+    """
+    leidos = 0
+    try:
+        # Cursor aparte para el cache de dimensiones: el principal tiene abierta la consulta de facturas
+        cursor_dimensiones = firebird_cursor.connection.cursor()
+        with medir(etapas, "firebird"):
+            firebird_cursor.execute(empresa.consulta_facturas, (fecha_inicio, fecha_fin))
+        while True:
+            with medir(etapas, "firebird"):
+                lote = firebird_cursor.fetchmany(tamano_lote)
+            if not lote:
+                break
+            leidos += len(lote)
+            with medir(etapas, "dimensiones"):
+                lote = empresa.dimensiones.resolver(cursor_dimensiones, lote)
+            with medir(etapas, "hash"):
+                lote = [tuple(row) + (hash_contenido(row),) for row in lote]
+            if etapas is not None:
+                etapas.add_rows("firebird", len(lote))
+            cola.put(lote)
+        return leidos
+    except Exception as e:
+        cola.put(e)
+        return None
+    finally:
+        cola.put(FIN_LOTES)
+
+def particionar_rango(fecha_inicio, fecha_fin, dias_particion):
+    """Divide el rango de fechas en particiones consecutivas de dias_particion días"""
+    particiones = []
+    inicio = fecha_inicio
+    while inicio <= fecha_fin:
+        fin = min(inicio + timedelta(days=dias_particion - 1), fecha_fin)
+        particiones.append((inicio, fin))
+        inicio = fin + timedelta(days=1)
+    return particiones
+
+def extraer_particion(fb_config, fecha_inicio, fecha_fin, tamano_lote, cola, etapas=None,
+                      empresa=EMPRESA_PREDETERMINADA):
+    """Trabajador: extrae una partición con su propia conexión a Firebird y reporta su avance"""
+    firebird_conn = None
+    try:
+        firebird_conn = fdb.connect(**fb_config)
+    except Exception as e:
+        print(f"❌ Partición {fecha_inicio} a {fecha_fin}: error de conexión a Firebird: {str(e)}")
+        cola.put(e)
+        cola.put(FIN_LOTES)
+        return None
+
+    try:
+        leidos = extraer_lotes(firebird_conn.cursor(), fecha_inicio, fecha_fin, tamano_lote, cola, etapas, empresa)
+        if leidos is None:
+            print(f"❌ Partición {fecha_inicio} a {fecha_fin}: error al consultar Firebird")
+        else:
+            print(f"  Partición {fecha_inicio} a {fecha_fin}: {leidos} registros extraídos")
+        return leidos
+    finally:
+        firebird_conn.close()
+
+def cargar_lote(sql_conn, sql_cursor, lote, avanzar_marca=True, etapas=None, empresa=EMPRESA_PREDETERMINADA,
+                fecha_marca=None):
+    """Carga un lote en staging, lo fusiona y confirma; retorna (insertados, actualizados).
+
+    Si solo se carga el delta de un lote extraído, fecha_marca es la fecha
+    máxima del lote completo (el delta puede venir vacío).
+    """
+    insertados = actualizados = 0
+    if lote:
+        with medir(etapas, "sql_staging"):
+            sql_cursor.execute(f"TRUNCATE TABLE {empresa.staging}")
+            sql_cursor.fast_executemany = True
+            sql_cursor.executemany(
+                f"INSERT INTO {empresa.staging} ({COLUMNAS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                lote
+            )
+    with medir(etapas, "sql_merge"):
+        if lote:
+            insertados, actualizados = fusionar_staging(sql_cursor, empresa)
+        if avanzar_marca:
+            # Punto de control: la marca de agua avanza en la misma transacción que el lote
+            guardar_marca_agua(sql_cursor, fecha_marca or max(row[3] for row in lote), empresa)
+    with medir(etapas, "sql_commit"):
+        sql_conn.commit()
+    if etapas is not None:
+        etapas.add_rows("sql_staging", len(lote))
+    return insertados, actualizados
+
+def cargar_lotes(sql_conn, sql_cursor, cola, productores=1, avanzar_marca=True, etapas=None,
+                 empresa=EMPRESA_PREDETERMINADA, instantanea=None):
+    """Consumidor: carga los lotes de la cola con un commit por lote.
+
+    Si un lote falla se descarta solo ese lote y la marca de agua deja de
+    avanzar, para que la siguiente ejecución vuelva a leerlo. Con
+    instantánea solo se carga el delta de cada lote contra la anterior.
+    """
+    leidos = insertados = actualizados = lotes_fallidos = 0
+    fecha_maxima = None
+    pendientes = productores
+    while pendientes:
+        with medir(etapas, "espera_firebird"):
+            lote = cola.get()
+        if lote is FIN_LOTES:
+            pendientes -= 1
+            continue
+        if isinstance(lote, Exception):
+            print(f"❌ Error al consultar Firebird: {str(lote)}")
+            lotes_fallidos += 1
+            avanzar_marca = False
+            continue
+
+        leidos += len(lote)
+        fecha_lote = max(row[3] for row in lote)
+        delta = lote
+        if instantanea is not None:
+            with medir(etapas, "instantanea"):
+                delta = instantanea.delta(lote)
+        try:
+            nuevos, cambiados = cargar_lote(sql_conn, sql_cursor, delta, avanzar_marca, etapas, empresa, fecha_lote)
+            insertados += nuevos
+            actualizados += cambiados
+            fecha_maxima = fecha_lote if fecha_maxima is None else max(fecha_maxima, fecha_lote)
+            if instantanea is not None and instantanea.filtrar:
+                print(f"  Lote cargado: {len(lote)} leídos, {len(delta)} con cambios, {leidos} acumulados")
+            else:
+                print(f"  Lote cargado: {len(lote)} leídos, {leidos} acumulados")
+        except pyodbc.Error as e:
+            print(f"❌ Error al cargar lote de {len(delta)} registros: {str(e)}")
+            sql_conn.rollback()
+            lotes_fallidos += 1
+            avanzar_marca = False
+
+    return leidos, insertados, actualizados, lotes_fallidos, fecha_maxima
+
+def instalar_captura_cambios(firebird_conn, empresa=EMPRESA_PREDETERMINADA):
+    """Crea en Firebird la bitácora de cambios, su generador y el trigger de FACTFnn si no existen"""
+    cursor = firebird_conn.cursor()
+    for tabla_sistema, columna, nombre, ddl in DDL_CAPTURA:
+        nombre = nombre.format(n=empresa.numero)
+        cursor.execute(f"SELECT COUNT(*) FROM {tabla_sistema} WHERE TRIM({columna}) = ?", (nombre,))
+        if not cursor.fetchone()[0]:
+            cursor.execute(ddl.format(n=empresa.numero))
+            firebird_conn.commit()
+            print(f"  Captura de cambios: {nombre} creado")
+    firebird_conn.commit()
+
+def leer_facturas_por_clave(firebird_cursor, claves, empresa=EMPRESA_PREDETERMINADA):
+    """Lee de Firebird las facturas indicadas, con su hash, en bloques de MAX_CLAVES_IN"""
+    filas = []
+    for inicio in range(0, len(claves), MAX_CLAVES_IN):
+        parte = claves[inicio:inicio + MAX_CLAVES_IN]
+        firebird_cursor.execute(
+            empresa.select_facturas + f"WHERE f.CVE_DOC IN ({', '.join('?' * len(parte))})", tuple(parte)
+        )
+        lote = empresa.dimensiones.resolver(firebird_cursor, firebird_cursor.fetchall())
+        filas.extend(row + (hash_contenido(row),) for row in lote)
+    return filas
+
+def drenar_cambios(firebird_conn, sql_conn, sql_cursor, tamano_lote, etapas=None, empresa=EMPRESA_PREDETERMINADA):
+    """Transfiere solo los documentos anotados en la bitácora; retorna (leidos, insertados, actualizados).
+
+    Cada bloque se borra de la bitácora después de confirmarse en SQL Server,
+    y solo si no volvió a cambiar mientras tanto (mismo CAMBIO_ID). La marca
+    de agua no avanza: los documentos pueden tener cualquier fecha.
+    """
+    cursor = firebird_conn.cursor()
+    leidos = insertados = actualizados = 0
+    try:
+        while True:
+            with medir(etapas, "firebird"):
+                cursor.execute(f"SELECT FIRST {int(tamano_lote)} CVE_DOC, CAMBIO_ID FROM {empresa.bitacora} ORDER BY CAMBIO_ID")
+                cambios = cursor.fetchall()
+                if not cambios:
+                    break
+                # Los documentos eliminados de FACTFnn no regresan y solo se borran de la bitácora
+                lote = leer_facturas_por_clave(cursor, [cambio[0] for cambio in cambios], empresa)
+            if lote:
+                nuevos, cambiados = cargar_lote(sql_conn, sql_cursor, lote, avanzar_marca=False, etapas=etapas, empresa=empresa)
+                leidos += len(lote)
+                insertados += nuevos
+                actualizados += cambiados
+            with medir(etapas, "firebird"):
+                cursor.executemany(
+                    f"DELETE FROM {empresa.bitacora} WHERE CVE_DOC = ? AND CAMBIO_ID = ?",
+                    [tuple(cambio) for cambio in cambios]
+                )
+                firebird_conn.commit()
+            if len(cambios) < tamano_lote:
+                break
+    finally:
+        # Cerrar la transacción de lectura para ver los cambios confirmados después
+        firebird_conn.commit()
+    return leidos, insertados, actualizados
+
+def escuchar_cambios(empresa=EMPRESA_PREDETERMINADA):
+    """Modo eventos: transfiere los documentos modificados en cuanto Firebird los avisa.
+
+    Escucha el evento del trigger con un event conduit de fdb en una conexión
+    propia. Además drena la bitácora cada ESPERA_EVENTOS segundos por si se
+    pierde un aviso y ejecuta un barrido de la ventana completa (exportar_registros)
+    cada BARRIDO_EVENTOS segundos para cambios que el trigger no ve (p. ej.
+    el nombre del cliente en CLIEnn).
+    """
+    configs = load_configurations()
+    espera = float(os.getenv("ESPERA_EVENTOS", 30))
+    barrido = float(os.getenv("BARRIDO_EVENTOS", 3600))
+    tamano_lote = int(os.getenv("TAMANO_LOTE", 5000))
+    fb_config = configs['firebird'].get_connection_params(empresa.numero)
+    sql_config = configs['sqlserver'].get_connection_params()
+
+    try:
+        firebird_conn = fdb.connect(**fb_config)
+    except fdb.fbcore.DatabaseError as e:
+        print(f"❌ Error de conexión a Firebird: {str(e)}")
+        return
+    try:
+        eventos_conn = fdb.connect(**fb_config)
+        sql_conn = pyodbc.connect(sql_config['connection_string'], timeout=sql_config.get('timeout', 30))
+    except (fdb.fbcore.DatabaseError, pyodbc.Error) as e:
+        error_msg = str(e).replace(sql_config['connection_string'], '*****')
+        print(f"❌ Error de conexión: {error_msg}")
+        if 'eventos_conn' in locals():
+            eventos_conn.close()
+        firebird_conn.close()
+        return
+    sql_cursor = sql_conn.cursor()
+    conduit = None
+    try:
+        asegurar_tabla_destino(sql_cursor, empresa)
+        crear_staging(sql_cursor, empresa)
+        sql_conn.commit()
+        instalar_captura_cambios(firebird_conn, empresa)
+
+        # Registrar el conduit antes del primer drenado para no perder avisos intermedios
+        conduit = eventos_conn.event_conduit([empresa.evento])
+        conduit.begin()
+        print(f"Escuchando el evento {empresa.evento} (barrido completo cada {barrido:.0f}s)")
+
+        ultimo_barrido = None
+        while True:
+            if ultimo_barrido is None or time.monotonic() - ultimo_barrido >= barrido:
+                exportar_registros(empresa)
+                ultimo_barrido = time.monotonic()
+
+            conduit.flush()
+            inicio = time.perf_counter()
+            try:
+                leidos, insertados, actualizados = drenar_cambios(
+                    firebird_conn, sql_conn, sql_cursor, tamano_lote, empresa=empresa
+                )
+                if leidos:
+                    print(
+                        f"✔ Empresa {empresa.numero}, cambios capturados: {leidos} documentos, {insertados} nuevos, "
+                        f"{actualizados} actualizados en {time.perf_counter() - inicio:.2f}s"
+                    )
+            except (pyodbc.Error, fdb.fbcore.DatabaseError) as e:
+                # Los documentos siguen en la bitácora y se reintentan en el siguiente aviso
+                print(f"❌ Error al transferir cambios capturados: {str(e)}")
+                sql_conn.rollback()
+                firebird_conn.rollback()
+
+            conduit.wait(timeout=espera)
+    except KeyboardInterrupt:
+        print("\nCaptura por eventos detenida")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {str(e)}")
+    finally:
+        if conduit is not None:
+            conduit.close()
+        eventos_conn.close()
+        firebird_conn.close()
+        sql_cursor.close()
+        sql_conn.close()
+
+def exportar_registros(empresa=EMPRESA_PREDETERMINADA):
+    """Transfiere a SQLFACTFnn los documentos desde la marca de agua.
+
+    Retorna los conteos de filas de la transferencia, o None si no se pudo
+    completar.
+    """
     try:
         # 1. Cargar configuraciones
         configs = load_configurations()
         
-        # Obtener días a transferir desde variable de entorno (por defecto: 30)
+        # Obtener días a transferir desde variable de entorno (por defecto: 180)
         dias_atras = int(os.getenv("DIAS_A_TRANSFERIR", 180))
+        # Modo completo (por defecto, ventana de DIAS_A_TRANSFERIR) o incremental desde la marca de agua
+        incremental = os.getenv("MODO_TRANSFERENCIA", "completo").lower() == "incremental"
+        # Días que se vuelven a leer antes de la marca de agua por documentos capturados con fecha atrasada
+        dias_solape = int(os.getenv("DIAS_SOLAPE", 3))
+        # Registros por lote y lotes en memoria entre la extracción y la carga
+        tamano_lote = int(os.getenv("TAMANO_LOTE", 5000))
+        lotes_en_cola = int(os.getenv("LOTES_EN_COLA", 4))
+        # Extracción paralela por particiones de fecha (1 trabajador = un solo cursor)
+        trabajadores = int(os.getenv("TRABAJADORES_FIREBIRD", 1))
+        dias_particion = int(os.getenv("DIAS_POR_PARTICION", 7))
         fecha_actual = datetime.now().date()
         fecha_inicio = fecha_actual - timedelta(days=dias_atras)
-        print(f"\nBuscando registros desde {fecha_inicio} hasta {fecha_actual}")
 
         # 2. Configuración de conexión a Firebird
-        fb_config = configs['firebird'].get_connection_params()
+        fb_config = configs['firebird'].get_connection_params(empresa.numero)
 
         # 3. Conexión a Firebird
         try:
@@ -24,7 +625,7 @@ def exportar_registros():
             firebird_cursor = firebird_conn.cursor()
             
             # Verificación básica de conexión
-            firebird_cursor.execute("SELECT COUNT(*) FROM FACTF03")
+            firebird_cursor.execute(f"SELECT COUNT(*) FROM FACTF{empresa.numero}")
             total_registros = firebird_cursor.fetchone()[0]
             
         except fdb.fbcore.DatabaseError as e:
@@ -53,72 +654,111 @@ def exportar_registros():
 
         # 6. Verificar/crear tabla en SQL Server
         try:
-            sql_cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'SQLFACTF03')
-            CREATE TABLE SQLFACTF03 (
-                CVE_DOC VARCHAR(50) PRIMARY KEY,
-                NOMBRE VARCHAR(100),
-                CVE_PEDI VARCHAR(50),               
-                FECHA_DOC DATE NOT NULL,
-                FECHA_VEN DATE NOT NULL,               
-                MONEDA VARCHAR(100),
-                TIPCAMB FLOAT NOT NULL,
-                IMPORTE FLOAT NOT NULL,
-                IMPORTEME FLOAT NOT NULL,
-                VENDEDOR VARCHAR(100),
-                SINCRONIZADO BIT DEFAULT 0
-            )
-            """)
+            asegurar_tabla_destino(sql_cursor, empresa)
             sql_conn.commit()
         except pyodbc.Error as e:
             print(f"❌ Error al verificar tabla: {str(e)}")
             return
 
-        # 7. Obtener registros ya transferidos
+        # 7. Determinar el inicio del rango a partir de la marca de agua
         try:
-            sql_cursor.execute("SELECT CVE_DOC FROM SQLFACTF03")
-            docs_transferidos = {row[0] for row in sql_cursor.fetchall()}
+            asegurar_tablas_control(sql_cursor)
+            sql_conn.commit()
+            marca_agua = leer_marca_agua(sql_cursor, empresa) if incremental else None
         except pyodbc.Error as e:
-            print(f"❌ Error al consultar registros existentes: {str(e)}")
+            print(f"❌ Error al leer la marca de agua: {str(e)}")
             return
 
-        # 8. Consulta Firebird para registros del rango de fechas
+        if marca_agua is not None:
+            if isinstance(marca_agua, str):
+                marca_agua = datetime.strptime(marca_agua, "%Y-%m-%d").date()
+            fecha_inicio = marca_agua - timedelta(days=dias_solape)
+            print(f"\nModo incremental, marca de agua: {marca_agua}")
+        print(f"\nEmpresa {empresa.numero}: buscando registros desde {fecha_inicio} hasta {fecha_actual}")
+
+        # 8. Extracción (hilo productor) y carga por lotes en paralelo
         try:
-            firebird_cursor.execute("""
-            SELECT f.CVE_DOC, c.NOMBRE, f.CVE_PEDI, CAST(f.FECHA_DOC AS DATE) AS FECHA_DOC, f.FECHA_VEN, m.DESCR AS MONEDA, f.TIPCAMB, f.IMPORTE,
-            (CASE WHEN f.TIPCAMB = 0 THEN 0 ELSE f.IMPORTE / f.TIPCAMB END) AS IMPORTEME, v.NOMBRE AS VENDEDOR, 0 AS SINCRONIZADO
-            FROM FACTF03 f JOIN CLIE03 c ON f.CVE_CLPV = c.CLAVE JOIN MONED03 m ON f.NUM_MONED = m.NUM_MONED JOIN VEND03 v ON f.CVE_VEND = v.CVE_VEND
-            WHERE CAST(FECHA_DOC AS DATE) BETWEEN ? AND ?
-            """, (fecha_inicio, fecha_actual))
-            
-            registros = [
-                row for row in firebird_cursor.fetchall()
-                if row[0] not in docs_transferidos
-            ]
-            
-            print(f"Registros nuevos encontrados: {len(registros)}")
-            
-        except fdb.fbcore.DatabaseError as e:
-            print(f"❌ Error al consultar Firebird: {str(e)}")
+            crear_staging(sql_cursor, empresa)
+            sql_conn.commit()
+        except pyodbc.Error as e:
+            print(f"❌ Error al crear tabla de staging: {str(e)}")
             return
 
-        # 9. Transferencia de registros
-        if registros:
-            try:
-                print("\nIniciando transferencia...")
-                sql_cursor.executemany(
-                    "INSERT INTO SQLFACTF03 (CVE_DOC, NOMBRE, CVE_PEDI, FECHA_DOC, FECHA_VEN, MONEDA, TIPCAMB, IMPORTE, IMPORTEME, VENDEDOR, SINCRONIZADO) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                    registros
+        # Instantánea por mes: se guarda siempre y en modo incremental solo se carga el delta
+        instantanea = None
+        if instantaneas_disponibles():
+            instantanea = Instantanea(empresa.numero, fecha_inicio, fecha_actual, filtrar=incremental)
+
+        print("\nIniciando transferencia...")
+        cola = queue.Queue(maxsize=lotes_en_cola)
+        etapas = StageTimes()
+        particiones = particionar_rango(fecha_inicio, fecha_actual, dias_particion)
+
+        if trabajadores > 1 and len(particiones) > 1:
+            # Cada trabajador usa su propia conexión; la conexión principal ya no se necesita
+            print(f"Extracción paralela: {len(particiones)} particiones de {dias_particion} días, {trabajadores} trabajadores")
+            with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+                for inicio, fin in particiones:
+                    pool.submit(extraer_particion, fb_config, inicio, fin, tamano_lote, cola, etapas, empresa)
+
+                # 9. Carga en staging y MERGE; las particiones llegan desordenadas,
+                # así que la marca de agua solo avanza al final si no hubo errores
+                leidos, insertados, actualizados, lotes_fallidos, fecha_maxima = cargar_lotes(
+                    sql_conn, sql_cursor, cola, productores=len(particiones), avanzar_marca=False, etapas=etapas,
+                    empresa=empresa, instantanea=instantanea
                 )
+
+            if not lotes_fallidos and fecha_maxima is not None:
+                guardar_marca_agua(sql_cursor, fecha_maxima, empresa)
                 sql_conn.commit()
-                print(f"✔ Registros transferidos exitosamente: {len(registros)}")
-                
-            except pyodbc.Error as e:
-                print(f"❌ Error durante la transferencia: {str(e)}")
-                sql_conn.rollback()
+        else:
+            productor = threading.Thread(
+                target=extraer_lotes,
+                args=(firebird_cursor, fecha_inicio, fecha_actual, tamano_lote, cola, etapas, empresa),
+                daemon=True
+            )
+            productor.start()
+
+            # 9. Carga en staging y MERGE del lado del servidor, un commit por lote
+            leidos, insertados, actualizados, lotes_fallidos, _ = cargar_lotes(
+                sql_conn, sql_cursor, cola, etapas=etapas, empresa=empresa, instantanea=instantanea
+            )
+            productor.join()
+
+        # La instantánea solo se reemplaza si todo se cargó: lo fallido vuelve a salir en el siguiente delta
+        if instantanea is not None and not lotes_fallidos:
+            try:
+                with medir(etapas, "instantanea"):
+                    guardadas = instantanea.guardar()
+                print(f"✔ Instantánea actualizada: {guardadas} registros en {instantanea.directorio}")
+            except OSError as e:
+                print(f"❌ Error al guardar la instantánea: {str(e)}")
+                instantanea.descartar()
+        elif instantanea is not None:
+            instantanea.descartar()
+
+        print(f"Empresa {empresa.numero}, registros encontrados en el rango: {leidos}")
+        if lotes_fallidos:
+            print(f"❌ Lotes con error: {lotes_fallidos} (se reintentarán en la siguiente ejecución)")
+        if insertados or actualizados:
+            print(f"✔ Registros transferidos exitosamente: {insertados}")
+            print(f"✔ Registros con cambios actualizados: {actualizados}")
         else:
             print("\nNo hay registros nuevos para transferir en el rango de fechas")
 
+        # Tiempo por etapa para ubicar el cuello de botella (Firebird, staging, MERGE, commit)
+        print("\nTiempo por etapa:")
+        for nombre, datos in etapas.to_dict().items():
+            print(f"  {nombre}: {datos['seconds']}s en {datos['calls']} llamadas")
+        filas = {
+            "extraidos": leidos,
+            "cargados": etapas.rows.get("sql_staging", 0),
+            "insertados": insertados,
+            "actualizados": actualizados,
+        }
+        write_transfer_snapshot(rows=filas, stages=etapas, failed_batches=lotes_fallidos, company=empresa.numero)
+        return filas
+
     except ConfigError as e:
         print(f"\n❌ Error de configuración: {str(e)}")
     except Exception as e:
@@ -134,7 +774,220 @@ def exportar_registros():
         if 'sql_conn' in locals(): 
             sql_conn.close()
 
+def reproducir_instantanea(empresa=EMPRESA_PREDETERMINADA, meses=None):
+    """Carga SQLFACTFnn desde las instantáneas guardadas, sin conectarse a Firebird.
+
+    Pasa por la misma staging y el mismo MERGE que la transferencia; la
+    marca de agua no se mueve.
+    """
+    if not instantaneas_disponibles():
+        print("❌ Las instantáneas requieren pyarrow (y INSTANTANEAS distinto de 0)")
+        return None
+    instantanea = Instantanea(empresa.numero)
+    meses = meses or instantanea.meses()
+    if not meses:
+        print(f"❌ No hay instantáneas de la empresa {empresa.numero} en {instantanea.directorio}")
+        return None
+
+    configs = load_configurations()
+    sql_config = configs['sqlserver'].get_connection_params()
+    try:
+        sql_conn = pyodbc.connect(sql_config['connection_string'], timeout=sql_config.get('timeout', 30))
+    except pyodbc.Error as e:
+        print(f"❌ Error de conexión a SQL Server: {str(e).replace(sql_config['connection_string'], '*****')}")
+        return None
+    sql_cursor = sql_conn.cursor()
+    leidos = insertados = actualizados = lotes_fallidos = 0
+    etapas = StageTimes()
+    try:
+        asegurar_tabla_destino(sql_cursor, empresa)
+        crear_staging(sql_cursor, empresa)
+        sql_conn.commit()
+        print(f"\nReproduciendo la empresa {empresa.numero} desde {instantanea.directorio}: {', '.join(meses)}")
+        for lote in instantanea.leer(meses, int(os.getenv("TAMANO_LOTE", 5000))):
+            leidos += len(lote)
+            try:
+                nuevos, cambiados = cargar_lote(sql_conn, sql_cursor, lote, avanzar_marca=False, etapas=etapas,
+                                                empresa=empresa)
+                insertados += nuevos
+                actualizados += cambiados
+            except pyodbc.Error as e:
+                print(f"❌ Error al cargar lote de {len(lote)} registros: {str(e)}")
+                sql_conn.rollback()
+                lotes_fallidos += 1
+    except pyodbc.Error as e:
+        print(f"❌ Error al preparar SQL Server: {str(e)}")
+        return None
+    finally:
+        sql_cursor.close()
+        sql_conn.close()
+
+    print(f"Registros reproducidos: {leidos}")
+    print(f"✔ Insertados: {insertados}, actualizados: {actualizados}")
+    if lotes_fallidos:
+        print(f"❌ Lotes con error: {lotes_fallidos}")
+    return {"extraidos": leidos, "insertados": insertados, "actualizados": actualizados}
+
+def clasificar_lote(sql_cursor, lote, empresa=EMPRESA_PREDETERMINADA):
+    """Compara un lote contra SQLFACTFnn como lo haría el MERGE, sin escribir.
+
+    Retorna un Counter con nuevos, con_cambios, a_actualizar_en_monday,
+    hash_completado y sin_cambios, y otro con los documentos nuevos por mes.
+    """
+    existentes = {}
+    claves = [row[0] for row in lote]
+    for inicio in range(0, len(claves), MAX_CLAVES_IN):
+        parte = claves[inicio:inicio + MAX_CLAVES_IN]
+        sql_cursor.execute(
+            f"SELECT CVE_DOC, HASH_CONTENIDO, SINCRONIZADO FROM {empresa.destino} "
+            f"WHERE CVE_DOC IN ({', '.join('?' * len(parte))})", tuple(parte)
+        )
+        existentes.update((fila[0], (fila[1], fila[2])) for fila in sql_cursor.fetchall())
+
+    conteo, meses = Counter(), Counter()
+    for row in lote:
+        existente = existentes.get(row[0])
+        if existente is None:
+            conteo["nuevos"] += 1
+            meses[f"{row[3]:%Y-%m}"] += 1
+        elif existente[0] is None:
+            conteo["hash_completado"] += 1
+        elif existente[0].strip() != row[-1]:
+            conteo["con_cambios"] += 1
+            if existente[1]:
+                conteo["a_actualizar_en_monday"] += 1
+        else:
+            conteo["sin_cambios"] += 1
+    return conteo, meses
+
+def simular_exportacion(empresa=EMPRESA_PREDETERMINADA):
+    """Simulacro: lee Firebird desde la marca de agua y compara contra SQL Server sin escribir nada.
+
+    Reporta documentos nuevos, con cambios (y cuántos actualizarían un ítem
+    de Monday) y los meses de los nuevos, que son los grupos que usará la
+    sincronización.
+    """
+    configs = load_configurations()
+    dias_atras = int(os.getenv("DIAS_A_TRANSFERIR", 180))
+    incremental = os.getenv("MODO_TRANSFERENCIA", "completo").lower() == "incremental"
+    dias_solape = int(os.getenv("DIAS_SOLAPE", 3))
+    tamano_lote = int(os.getenv("TAMANO_LOTE", 5000))
+    fecha_actual = datetime.now().date()
+    fecha_inicio = fecha_actual - timedelta(days=dias_atras)
+    sql_config = configs['sqlserver'].get_connection_params()
+
+    try:
+        firebird_conn = fdb.connect(**configs['firebird'].get_connection_params(empresa.numero))
+    except fdb.fbcore.DatabaseError as e:
+        print(f"❌ Error de conexión a Firebird: {str(e)}")
+        return
+    try:
+        sql_conn = pyodbc.connect(sql_config['connection_string'], timeout=sql_config.get('timeout', 30))
+    except pyodbc.Error as e:
+        print(f"❌ Error de conexión a SQL Server: {str(e).replace(sql_config['connection_string'], '*****')}")
+        firebird_conn.close()
+        return
+    sql_cursor = sql_conn.cursor()
+    try:
+        sql_cursor.execute("SELECT OBJECT_ID(?), OBJECT_ID('TRANSFER_MARCA_AGUA')", (empresa.destino,))
+        tabla, control = sql_cursor.fetchone()
+        marca_agua = leer_marca_agua(sql_cursor, empresa) if incremental and control is not None else None
+        if isinstance(marca_agua, str):
+            marca_agua = datetime.strptime(marca_agua, "%Y-%m-%d").date()
+        if marca_agua is not None:
+            fecha_inicio = marca_agua - timedelta(days=dias_solape)
+        print(f"\nSimulacro de la empresa {empresa.numero} desde {fecha_inicio} hasta {fecha_actual} (no se escribe nada)")
+
+        cola = queue.Queue(maxsize=int(os.getenv("LOTES_EN_COLA", 4)))
+        productor = threading.Thread(
+            target=extraer_lotes,
+            args=(firebird_conn.cursor(), fecha_inicio, fecha_actual, tamano_lote, cola, None, empresa),
+            daemon=True
+        )
+        productor.start()
+        leidos = 0
+        conteo, meses = Counter(), Counter()
+        while True:
+            lote = cola.get()
+            if lote is FIN_LOTES:
+                break
+            if isinstance(lote, Exception):
+                print(f"❌ Error al consultar Firebird: {str(lote)}")
+                continue
+            leidos += len(lote)
+            if tabla is None:
+                # Sin tabla destino todo sería nuevo
+                conteo["nuevos"] += len(lote)
+                meses.update(f"{row[3]:%Y-%m}" for row in lote)
+            else:
+                conteo_lote, meses_lote = clasificar_lote(sql_cursor, lote, empresa)
+                conteo.update(conteo_lote)
+                meses.update(meses_lote)
+        productor.join()
+
+        print(f"Registros leídos: {leidos}")
+        print(f"✔ Nuevos: {conteo['nuevos']}")
+        print(f"✔ Con cambios: {conteo['con_cambios']} ({conteo['a_actualizar_en_monday']} ya en Monday, se actualizarían)")
+        print(f"  Sin cambios: {conteo['sin_cambios']}, hash por completar: {conteo['hash_completado']}")
+        if meses:
+            print("Documentos nuevos por mes (grupos de Monday):")
+            for mes, cantidad in sorted(meses.items()):
+                print(f"  {mes}: {cantidad}")
+    except pyodbc.Error as e:
+        print(f"❌ Error al consultar SQL Server: {str(e)}")
+    finally:
+        sql_cursor.close()
+        sql_conn.close()
+        firebird_conn.close()
+
+def verificar_companies(numeros):
+    """Lanza ConfigError si .env.db define COMPANIES con otras empresas que .env.
+
+    Se llama después de load_configurations: la lista que vale es la de .env,
+    la misma que usa la API.
+    """
+    en_env_db = os.getenv("COMPANIES")
+    if en_env_db is not None and parse_company_numbers(en_env_db) != list(numeros):
+        raise ConfigError(
+            f"COMPANIES de .env.db ({en_env_db}) no coincide con el de .env ({','.join(numeros)}); "
+            "defina las empresas solo en .env"
+        )
+
+def empresas_configuradas():
+    """Empresas de COMPANIES en .env ("03,05" o "03:tablero,05:tablero"), las mismas que sincroniza la API"""
+    numeros = [company.number for company in get_companies()]
+    load_configurations()
+    verificar_companies(numeros)
+    return [Empresa(numero) for numero in numeros]
+
+def por_empresa(funcion, empresas):
+    """Ejecuta la función para cada empresa; con varias, cada una en su hilo y con sus conexiones"""
+    if len(empresas) == 1:
+        funcion(empresas[0])
+        return
+    with ThreadPoolExecutor(max_workers=len(empresas)) as pool:
+        for futuro in [pool.submit(funcion, empresa) for empresa in empresas]:
+            futuro.result()
+
 if __name__ == "__main__":
-    print("=== Inicio del proceso de transferencia ===")
-    exportar_registros()
+    eventos = "--eventos" in sys.argv or os.getenv("MODO_TRANSFERENCIA", "").lower() == "eventos"
+    simulacro = "--simulacro" in sys.argv
+    if "--reproducir" in sys.argv:
+        # transferfmh.py --reproducir [AAAA-MM ...]: sin meses se reproducen todos
+        meses = [arg for arg in sys.argv[sys.argv.index("--reproducir") + 1:] if not arg.startswith("--")]
+        print("=== Inicio de la reproducción desde instantáneas ===")
+        funcion = lambda empresa: reproducir_instantanea(empresa, meses)
+    elif simulacro:
+        print("=== Inicio del simulacro de transferencia ===")
+        funcion = simular_exportacion
+    elif eventos:
+        print("=== Inicio de la captura por eventos ===")
+        funcion = escuchar_cambios
+    else:
+        print("=== Inicio del proceso de transferencia ===")
+        funcion = exportar_registros
+    try:
+        por_empresa(funcion, empresas_configuradas())
+    except (ConfigError, ValueError) as e:
+        print(f"\n❌ Error de configuración: {str(e)}")
     print("\n=== Proceso completado ===")
\ No newline at end of file